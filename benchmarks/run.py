@@ -0,0 +1,316 @@
+# benchmarks/run.py
+"""Benchmarks for the sky map overlap, loading and cosmology code.
+
+Times all six branches of skymap_overlap_integral (MOC or flat GW sky map
+against a MOC map, a flat map or a point), the vectorized point overlap,
+MOC rasterization, the FITS loaders, enforce_same_resolution, the
+distance helpers in analysis.los, the sample KDE and the galaxy catalog,
+on synthetic maps (see synthetic.py).
+
+    python benchmarks/run.py --preset quick --output results.json
+    python benchmarks/run.py --compare results.json
+
+Results are written as JSON. With --compare, each benchmark is compared
+with a saved baseline and the exit status is 1 if any of them got slower
+than --threshold times the baseline.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from synthetic import (flat_skymap, moc_skymap, random_points, write_flat,
+                       write_moc)
+
+#: Flat NSIDEs and MOC maximum orders benchmarked by each preset
+PRESETS = {
+    'quick': dict(nsides=(64, 256), orders=(8,), points=1_000),
+    'default': dict(nsides=(64, 256, 1024), orders=(8, 10), points=10_000),
+    'full': dict(nsides=(64, 256, 1024, 4096), orders=(8, 10, 12),
+                 points=100_000),
+}
+
+#: Distance layers are only generated up to this NSIDE (memory)
+MAX_DISTANCE_NSIDE = 1024
+#: Fixed resolution of the external sky maps
+EXT_NSIDE = 256
+EXT_ORDER = 8
+#: Target duration of one timing sample
+MIN_TIME = 0.2
+
+
+def measure(func, repeat=5):
+    """Best and median seconds per call, timeit style."""
+    start = time.perf_counter()
+    func()  # warm up (caches, lazy imports)
+    first = time.perf_counter() - start
+    number = int(min(1000, max(1, MIN_TIME // max(first, 1e-9))))
+    times = []
+    for _ in range(repeat if first < 10 * MIN_TIME else max(1, repeat // 2)):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - start) / number)
+    return dict(best=min(times), median=statistics.median(times),
+                number=number, repeat=len(times))
+
+
+def overlap_benchmarks(nsides, orders, points):
+    from gw_assoc.analysis.credible import CredibleIndex
+    from gw_assoc.analysis.moc import UniqIndex
+    from gw_assoc.analysis.spatial import (skymap_overlap_integral,
+                                           skymap_overlap_points)
+
+    ext_flat = flat_skymap(EXT_NSIDE, center=(125., -25.), distance=False)
+    ext_moc = moc_skymap(EXT_ORDER, center=(125., -25.), distance=False)
+    ra, dec = random_points(points)
+
+    for order in orders:
+        gw = moc_skymap(order, distance=False)
+        index = UniqIndex.from_table(gw)
+        params = dict(order=order, cells=len(gw))
+        yield 'overlap.moc_moc', params, \
+            lambda: skymap_overlap_integral(gw, ext_moc)
+        yield 'overlap.moc_flat', params, \
+            lambda: skymap_overlap_integral(gw, ext_flat['prob'])
+        yield 'overlap.moc_point', params, \
+            lambda: skymap_overlap_integral(gw, ra=ra[0], dec=dec[0])
+        yield 'overlap.moc_points', dict(params, points=points), \
+            lambda: skymap_overlap_points(gw, ra, dec, gw_index=index)
+        yield 'credible.index', params, \
+            lambda: CredibleIndex.from_moc(gw, index)
+        credible = CredibleIndex.from_moc(gw, index)
+        yield 'credible.searched', dict(params, points=points), \
+            lambda: credible.searched(ra, dec)
+
+    for nside in nsides:
+        gw = flat_skymap(nside, distance=False)['prob']
+        params = dict(nside=nside)
+        yield 'overlap.flat_moc', params, \
+            lambda: skymap_overlap_integral(gw, ext_moc)
+        yield 'overlap.flat_flat', params, \
+            lambda: skymap_overlap_integral(gw, ext_flat['prob'])
+        yield 'overlap.flat_point', params, \
+            lambda: skymap_overlap_integral(gw, ra=ra[0], dec=dec[0])
+        yield 'overlap.flat_points', dict(params, points=points), \
+            lambda: skymap_overlap_points(gw, ra, dec)
+
+
+def skymap_benchmarks(nsides, orders, tmpdir):
+    from gw_assoc.io.skymap import (_moc_level_ipix, enforce_same_resolution,
+                                    load_gw_skymap, rasterize_moc, read_skymap,
+                                    read_skymap_cache, set_skymap_disk_cache,
+                                    write_skymap_cache)
+
+    # Keep the loader's binary cache out of the user's cache directory
+    set_skymap_disk_cache(os.path.join(tmpdir, 'cache'))
+
+    for order in orders:
+        tab = moc_skymap(order)
+        level, ipix = _moc_level_ipix(tab)
+        values = {name.lower(): tab[name] for name in
+                  ('PROBDENSITY', 'DISTMU', 'DISTSIGMA', 'DISTNORM')}
+        params = dict(order=order, cells=len(tab))
+        yield 'rasterize.moc', params, \
+            lambda: rasterize_moc(level, ipix, values, order)
+
+        filename = os.path.join(tmpdir, f'moc{order}.fits')
+        write_moc(filename, tab)
+        yield 'load.moc', params, lambda: read_skymap(filename)
+        yield 'load.moc_cached', params, lambda: load_gw_skymap(filename)
+
+        binary = os.path.join(tmpdir, f'moc{order}.skymap')
+        write_skymap_cache(read_skymap(filename), binary)
+        yield 'load.moc_binary', params, lambda: read_skymap_cache(binary)
+
+    for nside in nsides:
+        skymap = flat_skymap(nside, distance=nside <= MAX_DISTANCE_NSIDE)
+        params = dict(nside=nside)
+        filename = os.path.join(tmpdir, f'flat{nside}.fits')
+        write_flat(filename, skymap)
+        yield 'load.flat', params, lambda: read_skymap(filename)
+        yield 'load.flat_prob', params, \
+            lambda: read_skymap(filename, columns=('prob',))
+
+        if nside > 64:
+            # Fresh dicts rebuild the pyramid; the second entry times
+            # the cached lookups
+            coarse = flat_skymap(nside // 4, distance=False)
+            grading = dict(params, nside_out=nside // 4)
+            yield 'resolution.enforce', grading, \
+                lambda: enforce_same_resolution(
+                    {k: v for k, v in skymap.items() if k != 'pyramid'},
+                    coarse)
+            yield 'resolution.enforce_cached', grading, \
+                lambda: enforce_same_resolution(skymap, coarse)
+
+
+def los_benchmarks(orders, points):
+    from gw_assoc.analysis.los import (H0grid, distance_bayes_factor,
+                                       dL_at_z, dvdz_at_z, z_at_dL)
+
+    rng = np.random.default_rng(1)
+    z = rng.uniform(0.01, 0.3, points)
+    dL = rng.uniform(10, 1500, points)
+    params = dict(points=points, H0=len(H0grid))
+    yield 'los.dL_at_z', params, lambda: dL_at_z(z, H0grid)
+    yield 'los.z_at_dL', params, lambda: z_at_dL(dL, H0grid)
+    yield 'los.dvdz_at_z', params, lambda: dvdz_at_z(z, H0grid)
+
+    ra, dec = random_points(points)
+    gw = moc_skymap(orders[0])
+    yield 'los.distance_bayes_factor', dict(params, order=orders[0]), \
+        lambda: distance_bayes_factor(gw, ra, dec, z)
+
+
+def kde_benchmarks(nsides, points, samples=10_000):
+    from gw_assoc.analysis.kde import SkyKDE
+
+    rng = np.random.default_rng(2)
+    dec = np.clip(rng.normal(20, 5, samples), -90, 90)
+    ra = (rng.normal(150, 5, samples) / np.cos(np.radians(dec))) % 360
+    kde = SkyKDE(ra, dec, distance=rng.normal(400, 50, samples))
+    params = dict(samples=samples)
+    yield 'kde.tree', params, \
+        lambda: SkyKDE(ra, dec, bandwidth=kde.bandwidth).tree
+    ra, dec = random_points(points)
+    yield 'kde.points', dict(params, points=points), \
+        lambda: kde.pdf(ra, dec)
+    yield 'kde.skymap', dict(params, nside=nsides[0]), \
+        lambda: kde.skymap(nsides[0])
+
+
+def galaxy_benchmarks(orders, points, galaxies=1_000_000):
+    from gw_assoc.analysis.hosts import (galaxies_in_region,
+                                         galaxy_probabilities)
+    from gw_assoc.io.galaxy import GalaxyCatalog
+
+    rng = np.random.default_rng(3)
+    ra, dec = random_points(galaxies)
+    z = rng.uniform(0.001, 0.2, galaxies)
+    params = dict(galaxies=galaxies)
+    yield 'galaxies.index', params, lambda: GalaxyCatalog(ra, dec, z=z)
+    catalog = GalaxyCatalog(ra, dec, z=z)
+    ra, dec = random_points(points)
+    yield 'galaxies.crossmatch', dict(params, points=points), \
+        lambda: catalog.crossmatch(ra, dec, 1 / 60)
+    gw = moc_skymap(orders[0])
+    rows = galaxies_in_region(gw, catalog, 0.9)
+    params = dict(params, order=orders[0])
+    yield 'galaxies.region', params, \
+        lambda: galaxies_in_region(gw, catalog, 0.9)
+    yield 'galaxies.probabilities', dict(params, rows=len(rows)), \
+        lambda: galaxy_probabilities(gw, catalog, rows)
+
+
+def run(preset, repeat=5, select=None, log=sys.stderr):
+    """Run a preset and return {name[params]: timing}."""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        suites = (overlap_benchmarks(preset['nsides'], preset['orders'],
+                                     preset['points']),
+                  skymap_benchmarks(preset['nsides'], preset['orders'],
+                                    tmpdir),
+                  los_benchmarks(preset['orders'], preset['points']),
+                  kde_benchmarks(preset['nsides'], preset['points']),
+                  galaxy_benchmarks(preset['orders'], preset['points']))
+        for suite in suites:
+            for name, params, func in suite:
+                key = name + '[' + ','.join(f'{k}={v}' for k, v in
+                                            params.items()) + ']'
+                if select and not any(s in key for s in select):
+                    continue
+                timing = measure(func, repeat)
+                results[key] = dict(name=name, params=params, **timing)
+                print(f'{key:60s} {timing["best"] * 1e3:12.3f} ms',
+                      file=log, flush=True)
+    return results
+
+
+def metadata(preset_name):
+    import gw_assoc
+    return dict(preset=preset_name,
+                time=time.strftime('%Y-%m-%dT%H:%M:%S'),
+                python=platform.python_version(),
+                numpy=np.__version__,
+                machine=platform.machine(),
+                processor=platform.processor(),
+                cpus=os.cpu_count(),
+                gw_assoc=getattr(gw_assoc, '__version__', None))
+
+
+def compare(results, baseline, threshold):
+    """Print best-time ratios to a baseline; return the regressed keys."""
+    regressions = []
+    print(f'{"benchmark":60s} {"baseline":>12s} {"current":>12s} '
+          f'{"ratio":>7s}')
+    for key, timing in results.items():
+        if key not in baseline:
+            print(f'{key:60s} {"-":>12s} {timing["best"] * 1e3:12.3f}   new')
+            continue
+        ratio = timing['best'] / baseline[key]['best']
+        flag = ''
+        if ratio > threshold:
+            flag = 'slower'
+            regressions.append(key)
+        elif ratio < 1 / threshold:
+            flag = 'faster'
+        print(f'{key:60s} {baseline[key]["best"] * 1e3:12.3f} '
+              f'{timing["best"] * 1e3:12.3f} {ratio:7.2f} {flag}')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark gw_assoc on synthetic sky maps')
+    parser.add_argument('--preset', choices=sorted(PRESETS),
+                        default='default',
+                        help='sky map sizes to run (full goes up to '
+                             'NSIDE 4096 and MOC order 12)')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='timing samples per benchmark')
+    parser.add_argument('-k', dest='select', action='append',
+                        help='only run benchmarks whose name contains this '
+                             '(repeatable)')
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help='compare with a JSON file from --output')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='slowdown ratio counted as a regression')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        preset_name = args.preset
+        if '--preset' not in (argv or sys.argv):
+            preset_name = baseline['metadata'].get('preset', preset_name)
+    else:
+        preset_name = args.preset
+
+    results = run(PRESETS[preset_name], args.repeat, args.select)
+    report = dict(metadata=metadata(preset_name), benchmarks=results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        regressions = compare(results, baseline['benchmarks'],
+                              args.threshold)
+        if regressions:
+            print(f'{len(regressions)} benchmark(s) slower than '
+                  f'{args.threshold}x the baseline', file=sys.stderr)
+            return 1
+    elif not args.output:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
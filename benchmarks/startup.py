@@ -0,0 +1,71 @@
+# benchmarks/startup.py
+"""Startup-time budget check for importing gw_assoc and `gw-assoc --help`.
+
+Each command runs in fresh interpreters; the best time over --repeat runs,
+minus the time of a bare interpreter, is checked against its budget. The
+commands must also not import any of the heavy dependencies, which
+gw_assoc loads only on first use.
+
+    python benchmarks/startup.py          # exit status 1 if over budget
+"""
+import argparse
+import subprocess
+import sys
+import time
+
+#: Extra seconds over a bare interpreter allowed for each command
+BUDGETS = {
+    'import gw_assoc': 0.15,
+    'import gw_assoc.association': 0.3,
+    'gw-assoc --help': 0.5,
+}
+
+HEAVY_MODULES = ('matplotlib', 'healpy', 'astropy', 'astropy_healpix',
+                 'ligo', 'scipy', 'sklearn')
+
+# Loaded modules are reported on stdout after the command has run
+_REPORT = ('import sys; print(" ".join(sorted({m.split(".")[0] '
+           'for m in sys.modules})))')
+COMMANDS = {
+    'import gw_assoc': 'import gw_assoc; ' + _REPORT,
+    'import gw_assoc.association': 'import gw_assoc.association; ' + _REPORT,
+    'gw-assoc --help': (
+        'import sys, contextlib, io; sys.argv = ["gw-assoc", "--help"]\n'
+        'from gw_assoc.cli import main\n'
+        'with contextlib.redirect_stdout(io.StringIO()):\n'
+        '    try: main()\n'
+        '    except SystemExit: pass\n' + _REPORT),
+}
+
+
+def best_time(code, repeat):
+    times, out = [], ''
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable, '-c', code], check=True,
+                             capture_output=True, text=True).stdout
+        times.append(time.perf_counter() - start)
+    return min(times), set(out.split())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    bare, _ = best_time('pass', args.repeat)
+    failed = False
+    for name, code in COMMANDS.items():
+        seconds, modules = best_time(code, args.repeat)
+        extra = seconds - bare
+        heavy = sorted(modules & set(HEAVY_MODULES))
+        ok = extra <= BUDGETS[name] and not heavy
+        failed |= not ok
+        print(f'{name:28s} {extra * 1e3:8.1f} ms  (budget '
+              f'{BUDGETS[name] * 1e3:.0f} ms)  {"ok" if ok else "FAIL"}'
+              + (f'  imports {", ".join(heavy)}' if heavy else ''))
+    return int(failed)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
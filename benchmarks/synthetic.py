@@ -0,0 +1,114 @@
+# benchmarks/synthetic.py
+"""Synthetic GW-like sky maps for the benchmarks (no downloads needed).
+
+Every map is a Gaussian blob on the sky with LVK-style distance layers
+(DISTMU, DISTSIGMA, DISTNORM). Multi-ordered maps are refined towards the
+blob the way LVK maps are: at each order the denser half of the cells is
+split, so an order-d map has about 768 * 2**(d - 3) cells.
+"""
+import astropy_healpix as ah
+import healpy as hp
+import numpy as np
+from astropy import units as u
+from astropy.io import fits
+from astropy.table import Table
+
+BASE_ORDER = 3
+
+
+def _density(nside, ipix, center, sigma):
+    """Unnormalized Gaussian density at the NESTED pixel centers."""
+    vec = np.stack(hp.pix2vec(nside, ipix, nest=True))
+    c = hp.ang2vec(*center, lonlat=True)
+    cosang = np.clip(c @ vec, -1, 1)
+    return np.exp(-0.5 * (np.arccos(cosang) / np.radians(sigma)) ** 2)
+
+
+def _distance_layers(nside, ipix, mu=400., sigma=100.):
+    """Distance ansatz parameters varying smoothly over the sky."""
+    _, dec = hp.pix2ang(nside, ipix, nest=True, lonlat=True)
+    distmu = mu * (1 + 0.2 * np.sin(np.radians(dec)))
+    distsigma = np.full(distmu.shape, sigma)
+    distnorm = 1 / (distmu ** 2 + distsigma ** 2)
+    return distmu, distsigma, distnorm
+
+
+def flat_skymap(nside, center=(120., -30.), sigma=10., distance=True):
+    """Flat NESTED sky map dict shaped like read_skymap's output."""
+    ipix = np.arange(hp.nside2npix(nside))
+    prob = _density(nside, ipix, center, sigma)
+    prob /= prob.sum()
+    skymap = dict(prob=prob, distmu=None, distsigma=None, distnorm=None,
+                  nside=nside, nested=True, metadata={}, moc=None)
+    if distance:
+        skymap['distmu'], skymap['distsigma'], skymap['distnorm'] = \
+            _distance_layers(nside, ipix)
+    return skymap
+
+
+def moc_skymap(max_order, center=(120., -30.), sigma=10., distance=True):
+    """Multi-ordered sky map Table (UNIQ, PROBDENSITY [1/sr], ...)."""
+    order = BASE_ORDER
+    ipix = np.arange(hp.order2npix(order))
+    done_level, done_ipix = [], []
+    while order < max_order:
+        dens = _density(2 ** order, ipix, center, sigma)
+        split = dens > np.median(dens)
+        done_level.append(np.full(np.count_nonzero(~split), order))
+        done_ipix.append(ipix[~split])
+        ipix = (4 * ipix[split][:, None] + np.arange(4)).ravel()
+        order += 1
+    level = np.concatenate(done_level + [np.full(len(ipix), order)])
+    ipix = np.concatenate(done_ipix + [ipix])
+
+    uniq = ah.level_ipix_to_uniq(level, ipix)
+    sort = np.argsort(uniq)
+    uniq, level, ipix = uniq[sort], level[sort], ipix[sort]
+    dens = np.empty(len(uniq))
+    for lev in np.unique(level):
+        sel = level == lev
+        dens[sel] = _density(2 ** int(lev), ipix[sel], center, sigma)
+    area = 4 * np.pi / (12 * 4.0 ** level)
+    dens /= np.sum(dens * area)
+
+    tab = Table({'UNIQ': uniq, 'PROBDENSITY': dens / u.sr})
+    if distance:
+        distmu = np.empty(len(uniq))
+        distsigma = np.empty(len(uniq))
+        distnorm = np.empty(len(uniq))
+        for lev in np.unique(level):
+            sel = level == lev
+            distmu[sel], distsigma[sel], distnorm[sel] = _distance_layers(
+                2 ** int(lev), ipix[sel])
+        tab['DISTMU'] = distmu * u.Mpc
+        tab['DISTSIGMA'] = distsigma * u.Mpc
+        tab['DISTNORM'] = distnorm / u.Mpc ** 2
+    return tab
+
+
+def random_points(n, seed=0):
+    """Uniformly distributed RA/DEC in degrees."""
+    rng = np.random.default_rng(seed)
+    ra = rng.uniform(0, 360, n)
+    dec = np.degrees(np.arcsin(rng.uniform(-1, 1, n)))
+    return ra, dec
+
+
+def write_flat(filename, skymap):
+    """Write a flat sky map dict as a NESTED HEALPix FITS table."""
+    cols = {'PROB': skymap['prob']}
+    for key in ('distmu', 'distsigma', 'distnorm'):
+        if skymap.get(key) is not None:
+            cols[key.upper()] = skymap[key]
+    hdu = fits.BinTableHDU(Table(cols))
+    hdu.header.update(PIXTYPE='HEALPIX', ORDERING='NESTED',
+                      NSIDE=skymap['nside'], INDXSCHM='IMPLICIT')
+    hdu.writeto(filename, overwrite=True)
+
+
+def write_moc(filename, tab):
+    """Write a multi-ordered sky map Table as a FITS table."""
+    hdu = fits.BinTableHDU(tab)
+    hdu.header.update(PIXTYPE='HEALPIX', ORDERING='NUNIQ',
+                      INDXSCHM='EXPLICIT')
+    hdu.writeto(filename, overwrite=True)
@@ -1,7 +1,28 @@
-def __getattr__(name):
-    if name == "Association":
-        from .association import Association
-        return Association
-    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+from ._lazy import lazy_exports
 
-__all__ = ["Association"]
+# Public names and the modules providing them. Modules are imported on
+# first attribute access, so `import gw_assoc` (and the CLI) stays cheap
+# and astropy, healpy, ligo.skymap and matplotlib load only when needed.
+_LAZY = {
+    "Association": ".association",
+    "load_gw_skymap": ".io.skymap",
+    "read_skymap": ".io.skymap",
+    "iter_skymaps": ".io.prefetch",
+    "Transient": ".io.transient",
+    "TransientCatalog": ".io.transient",
+    "read_transients": ".io.transient",
+    "GalaxyCatalog": ".io.galaxy",
+    "compute_posterior_odds": ".analysis.odds",
+    "compute_posterior_odds_batch": ".analysis.odds",
+    "iter_posterior_odds": ".analysis.odds",
+    "compute_posterior_odds_matrix": ".analysis.matrix",
+    "instrument": ".instrument",
+    "Report": ".instrument",
+    "AssociationEngine": ".online",
+    "get_precision": ".precision",
+    "set_precision": ".precision",
+}
+
+
+__getattr__, __dir__ = lazy_exports(globals(), _LAZY)
+__all__ = list(_LAZY)
@@ -0,0 +1,53 @@
+# src/gw_assoc/_lazy.py
+import importlib
+
+
+class LazyModule:
+    """
+    Stand-in for a module that is imported on first attribute access.
+
+    Used for healpy (which imports matplotlib) and astropy_healpix (which
+    imports astropy.coordinates), so importing gw_assoc modules does not
+    pay for them until a sky map is actually processed. The real import is
+    an ordinary one, and attributes are cached on the stand-in, so after
+    the first use a lookup costs the same as on the module itself.
+    """
+
+    def __init__(self, name):
+        self.__name = name
+
+    def __getattr__(self, attr):
+        value = getattr(importlib.import_module(self.__name), attr)
+        setattr(self, attr, value)
+        return value
+
+    def __repr__(self):
+        return f"<lazy module {self.__name!r}>"
+
+
+def lazy_import(name):
+    return LazyModule(name)
+
+
+def lazy_exports(namespace, exports):
+    """
+    Module-level ``__getattr__`` and ``__dir__`` for a package whose public
+    names are imported from their submodules on first access.
+
+    ``namespace`` is the package's ``globals()`` and ``exports`` maps each
+    public name to the (relative) module providing it. Resolved names are
+    stored in the namespace, so later lookups skip ``__getattr__``.
+    """
+    package = namespace["__name__"]
+
+    def __getattr__(name):
+        if name in exports:
+            module = importlib.import_module(exports[name], package)
+            value = namespace[name] = getattr(module, name)
+            return value
+        raise AttributeError(f"module {package!r} has no attribute {name!r}")
+
+    def __dir__():
+        return sorted(set(namespace) | set(exports))
+
+    return __getattr__, __dir__
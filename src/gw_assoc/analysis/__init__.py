@@ -1,4 +1,22 @@
 # src/gw_assoc/analysis/__init__.py
-from .odds import compute_posterior_odds
+from .._lazy import lazy_exports
 
-__all__ = ["compute_posterior_odds"]
+# Imported on first access, so light submodules such as analysis.temporal
+# do not pull in the sky map and cosmology dependencies of analysis.odds
+_LAZY = {
+    "compute_posterior_odds": ".odds",
+    "compute_posterior_odds_batch": ".odds",
+    "iter_posterior_odds": ".odds",
+    "compute_posterior_odds_matrix": ".matrix",
+    "CredibleIndex": ".credible",
+    "credible_index": ".credible",
+    "SkyKDE": ".kde",
+    "sample_overlap_integral": ".spatial",
+    "galaxies_in_region": ".hosts",
+    "galaxy_probabilities": ".hosts",
+    "host_probability": ".hosts",
+}
+
+
+__getattr__, __dir__ = lazy_exports(globals(), _LAZY)
+__all__ = list(_LAZY)
@@ -0,0 +1,174 @@
+#credible regions: credible levels, searched area and probability
+from functools import partial
+
+import numpy as np
+
+from .._lazy import lazy_import
+from ..io.skymap import is_skymap_moc
+from .kde import SkyKDE
+from .moc import UniqIndex
+from .spatial import unpack_skymap
+
+hp = lazy_import('healpy')
+
+SR_TO_DEG2 = (180 / np.pi) ** 2
+
+
+class CredibleIndex:
+    """Credible-region index of a flat or multi-ordered (MOC) sky map.
+
+    Pixels (or MOC cells) are sorted once by decreasing probability
+    density and the cumulative probability and area are kept, so the
+    credible level and searched area of any number of positions are
+    array lookups instead of a sort of the sky map per query.
+
+    The credible level of a position is the probability contained in all
+    pixels at least as dense as its own, its own pixel included (the
+    searched probability), and the searched area is the area of those
+    pixels. A position is inside the X% credible region if its credible
+    level is at most X. Positions outside a MOC's coverage get level 1.
+
+    Build it with `credible_index`, which keeps it with a loaded sky map.
+
+    Parameters
+    ----------
+    density: array
+        Probability density (any normalization) per pixel or cell
+    areas: float or array
+        Area of each pixel or cell in steradians
+    locate: callable
+        Maps (ra, dec) in degrees to pixel/cell rows, -1 if uncovered
+
+    """
+
+    def __init__(self, density, areas, locate):
+        density = np.clip(np.asarray(density, dtype=float), 0., None)
+        areas = np.broadcast_to(np.asarray(areas, dtype=float),
+                                density.shape)
+        order = np.argsort(-density, kind='stable')
+        prob = density[order] * areas[order]
+        norm = prob.sum()
+        if not norm > 0:
+            raise ValueError("Sky map has no probability")
+        self.cumprob = np.cumsum(prob) / norm
+        self.cumarea = np.cumsum(areas[order])
+        self.rank = np.empty(order.size, dtype=np.intp)
+        self.rank[order] = np.arange(order.size)
+        self._locate = locate
+
+    @classmethod
+    def from_flat(cls, prob, nested=True):
+        """Index of a flat HEALPix probability map."""
+        prob = np.asarray(prob)
+        area = 4 * np.pi / prob.size
+        # A partial rather than a closure, so the index can be pickled
+        return cls(prob, area, partial(_flat_locate,
+                                       hp.npix2nside(prob.size), nested))
+
+    @classmethod
+    def from_arrays(cls, cumprob, cumarea, rank, locate):
+        """Rebuild an index from the arrays of a built one.
+
+        The arrays are used as given (e.g. views of shared memory) and
+        nothing is sorted again; `locate` is as for the constructor.
+        """
+        index = cls.__new__(cls)
+        index.cumprob, index.cumarea, index.rank = cumprob, cumarea, rank
+        index._locate = locate
+        return index
+
+    @classmethod
+    def from_moc(cls, table, index=None):
+        """Index of a MOC table with UNIQ and PROBDENSITY columns."""
+        if index is None:
+            index = UniqIndex.from_table(table)
+        try:
+            density = table['PROBDENSITY']
+        except KeyError:
+            density = table['PROB']
+        return cls(np.asarray(density), index.areas, index.lookup)
+
+    def __len__(self):
+        return len(self.rank)
+
+    def _ranks(self, ra, dec):
+        ra, dec = np.broadcast_arrays(np.asarray(ra, dtype=float),
+                                      np.asarray(dec, dtype=float))
+        rows = np.asarray(self._locate(ra, dec))
+        return np.where(rows >= 0, self.rank[rows], -1)
+
+    def credible_level(self, ra, dec):
+        """Credible level (searched probability) of RA/DEC positions."""
+        rank = self._ranks(ra, dec)
+        return np.where(rank >= 0, self.cumprob[rank], 1.)
+
+    searched_probability = credible_level
+
+    def searched_area(self, ra, dec):
+        """Searched area in deg^2 of RA/DEC positions."""
+        rank = self._ranks(ra, dec)
+        return np.where(rank >= 0, self.cumarea[rank],
+                        self.cumarea[-1]) * SR_TO_DEG2
+
+    def searched(self, ra, dec):
+        """Credible level and searched area (deg^2) with one lookup."""
+        rank = self._ranks(ra, dec)
+        inside = rank >= 0
+        return (np.where(inside, self.cumprob[rank], 1.),
+                np.where(inside, self.cumarea[rank],
+                         self.cumarea[-1]) * SR_TO_DEG2)
+
+    def inside(self, ra, dec, level=0.9):
+        """True for positions inside the `level` credible region."""
+        return self.credible_level(ra, dec) <= level
+
+    def region(self, level=0.9):
+        """Rows (pixels or cells) of the `level` credible region."""
+        return np.flatnonzero(self.cumprob[self.rank] <= level)
+
+    def region_area(self, level=0.9):
+        """Area in deg^2 of the `level` credible region(s)."""
+        level = np.asarray(level, dtype=float)
+        i = np.searchsorted(self.cumprob, level, side='left')
+        i = np.clip(i, 0, len(self.cumprob) - 1)
+        return self.cumarea[i] * SR_TO_DEG2
+
+
+def _flat_locate(nside, nested, ra, dec):
+    return hp.ang2pix(nside, ra, dec, nest=nested, lonlat=True)
+
+
+def credible_index(skymap, nested=True):
+    """Credible-region index of a sky map, built once per loaded map.
+
+    Parameters
+    ----------
+    skymap: dict, Table, array or SkyKDE
+        Sky map from `gw_assoc.io.load_gw_skymap` (the index is kept in
+        the dict under 'credible'; MOC sources use their original
+        cells), a MOC table, a flat probability array, or a kernel
+        density estimate (indexed through `SkyKDE.skymap`)
+    nested: bool
+        Ordering of a flat probability array
+
+    Returns
+    -------
+    CredibleIndex
+
+    """
+    if isinstance(skymap, dict):
+        index = skymap.get('credible')
+        if index is None:
+            if skymap.get('moc') is not None:
+                moc, _, uniq_index = unpack_skymap(skymap)
+                index = CredibleIndex.from_moc(moc, uniq_index)
+            else:
+                index = CredibleIndex.from_flat(skymap['prob'],
+                                                skymap['nested'])
+            index = skymap.setdefault('credible', index)
+        return index
+    if isinstance(skymap, SkyKDE):
+        return CredibleIndex.from_flat(skymap.skymap()['prob'])
+    if is_skymap_moc(skymap):
+        return CredibleIndex.from_moc(skymap)
+    return CredibleIndex.from_flat(skymap, nested)
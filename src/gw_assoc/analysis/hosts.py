@@ -0,0 +1,200 @@
+#host galaxy weighting: 3D GW probabilities of catalog galaxies
+import numpy as np
+
+from .._lazy import lazy_import
+from ..instrument import annotate, stage
+from ..io.skymap import is_skymap_moc
+from ..io.transient import transient_columns
+from .credible import credible_index
+from .los import (H0grid, Om0Planck, _flat_los_parameters, dL_at_z,
+                  distance_posterior, los_parameters)
+from .spatial import skymap_overlap_points, unpack_skymap
+
+ah = lazy_import('astropy_healpix')
+hp = lazy_import('healpy')
+
+#: Search radius in degrees around transients without an error radius
+DEFAULT_HOST_RADIUS = 1 / 60
+#: Upper bound on the (H0, galaxy) values held in memory at once
+MAX_GRID_SIZE = 1 << 21
+
+
+@stage('hosts.region')
+def galaxies_in_region(skymap, catalog, level=0.9, nested=True):
+    """Rows of the catalog galaxies inside a credible region of a sky map.
+
+    The pixels (or MOC cells) of the region are turned into NESTED pixel
+    ranges at the catalog order and the galaxies in them are sliced out
+    of the pixel-sorted catalog, so the cost is proportional to the
+    number of galaxies in the region. Galaxies in catalog pixels only
+    partly covered by finer sky map pixels are cut by credible level.
+
+    Parameters
+    ----------
+    skymap: dict, Table or array
+        Sky map from `gw_assoc.io.load_gw_skymap`, a MOC table, or a flat
+        probability array
+    catalog: GalaxyCatalog
+        Pixel-indexed galaxy catalog
+    level: float
+        Credible level of the region
+    nested: bool
+        Ordering of a flat probability array
+
+    Returns
+    -------
+    rows: array
+        Catalog rows, in pixel order
+
+    """
+    index = credible_index(skymap, nested)
+    region = index.region(level)
+    table, nested, _ = unpack_skymap(skymap, nested)
+    if is_skymap_moc(table):
+        order, ipix = ah.uniq_to_level_ipix(
+            np.asarray(table['UNIQ'], dtype=np.int64)[region])
+    else:
+        npix = len(table)
+        ipix = region if nested else hp.ring2nest(hp.npix2nside(npix),
+                                                   region)
+        order = np.full(len(ipix), ah.nside_to_level(hp.npix2nside(npix)))
+    annotate(galaxies=len(catalog), pixels=len(ipix))
+
+    coarse = order <= catalog.order
+    shift = 2 * (catalog.order - order[coarse])
+    starts = [ipix[coarse] << shift]
+    ends = [(ipix[coarse] + 1) << shift]
+    fine = ~coarse
+    if fine.any():
+        parent = np.unique(ipix[fine] >> (2 * (order[fine] - catalog.order)))
+        starts.append(parent)
+        ends.append(parent + 1)
+    starts, ends = np.concatenate(starts), np.concatenate(ends)
+    sort = np.argsort(starts, kind='stable')
+    rows = catalog.rows_in_ranges(starts[sort], ends[sort])
+    if fine.any():
+        rows = rows[index.inside(catalog.ra[rows], catalog.dec[rows], level)]
+    return rows
+
+
+@stage('hosts.probability')
+def galaxy_probabilities(skymap, catalog, rows=None, H0=None, H0_weights=None,
+                         Om0=Om0Planck, nested=True, index=None):
+    """3D GW probability density at catalog galaxies.
+
+    dP/dV = p(ra, dec) DISTNORM N(dL; DISTMU, DISTSIGMA), the probability
+    per Mpc^3 of the LVK 3D sky map ansatz, times the galaxy weight where
+    the catalog has one. Galaxies with a luminosity distance use it;
+    otherwise it is worked out from the redshift with the `los` distance
+    relations and marginalized over the H0 grid. Galaxies with neither
+    get zero. Vectorized over galaxies and H0 values.
+
+    Parameters
+    ----------
+    skymap: dict or Table
+        3D GW sky map, flat (from `gw_assoc.io.load_gw_skymap`) or MOC
+    catalog: GalaxyCatalog
+        Pixel-indexed galaxy catalog
+    rows: array, optional
+        Catalog rows to evaluate, e.g. from `galaxies_in_region`; all
+        galaxies if not given
+    H0: array
+        H0 grid in km/s/Mpc, defaults to `H0grid`
+    H0_weights: array
+        Prior weights on the H0 grid, flat if not given
+    Om0: float
+        Matter density of the flat LCDM cosmology
+
+    Returns
+    -------
+    array
+        dP/dV in Mpc^-3 (times the weight) for each row
+
+    """
+    cols = catalog.columns(rows)
+    ra, dec = cols['ra'], cols['dec']
+    annotate(galaxies=len(ra))
+    H0 = H0grid if H0 is None else np.atleast_1d(np.asarray(H0, dtype=float))
+    w = np.ones(H0.shape) if H0_weights is None else np.asarray(H0_weights,
+                                                                dtype=float)
+    w = w/w.sum()
+
+    # skymap_overlap_points is 4 pi times the probability per steradian
+    sky = skymap_overlap_points(skymap, ra, dec, nested, index) / (4 * np.pi)
+    if isinstance(skymap, dict) and skymap.get('moc') is None:
+        mu, sigma, norm = _flat_los_parameters(skymap, ra, dec)
+    else:
+        mu, sigma, norm = los_parameters(skymap, ra, dec, nested, index)
+
+    dist = np.asarray(cols['dist'], dtype=float)
+    radial = np.empty(len(ra))
+    # Chunked over galaxies to bound the (H0, galaxy) arrays
+    chunk = max(1, MAX_GRID_SIZE // len(H0))
+    for i in range(0, len(ra), chunk):
+        part = slice(i, i + chunk)
+        dL = np.where(np.isfinite(dist[part]), dist[part],
+                      dL_at_z(cols['z'][part], H0, Om0))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            p = np.where(dL > 0, distance_posterior(
+                dL, mu[part], sigma[part], norm[part]) / dL**2, 0.)
+        radial[part] = np.tensordot(w, p, axes=1)
+    p = sky * radial
+    weight = np.asarray(cols['weight'], dtype=float)
+    return np.where(np.isnan(weight), p, p * weight)
+
+
+@stage('hosts.association')
+def host_probability(skymap, catalog, transients, radius=None, level=0.99,
+                     **kwargs):
+    """Share of the galaxy-weighted GW probability near each transient.
+
+    The 3D probabilities (see `galaxy_probabilities`) of the galaxies
+    within `radius` of a transient, over their sum for all galaxies in
+    the `level` credible region and the transient's own candidates
+    outside it: the probability that the GW host is one of the
+    transient's candidate hosts, given the catalog. Candidates outside
+    the region count towards both sums, so the result is at most 1 and
+    does not depend on the other transients.
+
+    Parameters
+    ----------
+    skymap: dict or Table
+        3D GW sky map
+    catalog: GalaxyCatalog
+        Pixel-indexed galaxy catalog
+    transients: TransientCatalog, Transient(s) or dict
+        Transient positions
+    radius: float or array, optional
+        Host search radius in degrees. By default the transients'
+        err_radius where known, else DEFAULT_HOST_RADIUS
+    level: float
+        Credible region normalizing the probabilities
+    **kwargs:
+        Passed to `galaxy_probabilities` (H0, H0_weights, Om0)
+
+    Returns
+    -------
+    array
+        Host probability for each transient
+
+    """
+    cols = transient_columns(transients, ('ra', 'dec', 'err_radius'))
+    if radius is None:
+        radius = cols['err_radius']
+        if radius is None:
+            radius = DEFAULT_HOST_RADIUS
+        else:
+            radius = np.where(np.isfinite(radius) & (radius > 0), radius,
+                              DEFAULT_HOST_RADIUS)
+    n = len(cols['ra'])
+
+    region = galaxies_in_region(skymap, catalog, level)
+    total = np.sum(galaxy_probabilities(skymap, catalog, region, **kwargs))
+    if not total > 0:
+        return np.zeros(n)
+    index, rows = catalog.crossmatch(cols['ra'], cols['dec'], radius)
+    p = galaxy_probabilities(skymap, catalog, rows, **kwargs)
+    near = np.bincount(index, p, minlength=n)
+    outside = np.bincount(index, np.where(np.isin(rows, region), 0., p),
+                          minlength=n)
+    return near / (total + outside)
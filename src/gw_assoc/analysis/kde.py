@@ -0,0 +1,260 @@
+#kernel density estimates of sky localizations from posterior samples
+import numpy as np
+
+from .._lazy import lazy_import
+from ..instrument import annotate, stage
+
+hp = lazy_import('healpy')
+neighbors = lazy_import('sklearn.neighbors')
+
+#: Samples kept by default; larger sample sets are sub-sampled
+DEFAULT_MAX_SAMPLES = 10000
+#: Kernels are cut off this many bandwidths from their sample
+KERNEL_CUTOFF = 6.
+#: Upper bound on the (query, sample) pairs held in memory at once
+MAX_PAIRS = 1 << 22
+#: Finest NSIDE chosen automatically by SkyKDE.skymap
+MAX_AUTO_NSIDE = 512
+
+
+class SkyKDE:
+    """Spherical kernel density estimate of a sky localization.
+
+    Built from posterior samples, e.g. the (ra, dec, distance) samples of
+    a GW parameter estimation run or the position samples of an external
+    instrument that publishes no sky map. Each sample carries a
+    von Mises-Fisher kernel, the normal distribution of the sphere,
+    so the density is normalized on the sky for any bandwidth.
+
+    Samples go into a haversine BallTree, and the density at any number of
+    positions is summed over the samples within KERNEL_CUTOFF bandwidths
+    of each, in vectorized batches. Sample sets above `max_samples` are
+    sub-sampled first, which bounds the cost for 10^5+ samples.
+
+    With distances, `skymap` also fills in the distance ansatz layers from
+    the kernel-weighted conditional distance moments, so the result works
+    with every function that takes a sky map loaded with
+    `gw_assoc.io.load_gw_skymap`.
+
+    Parameters
+    ----------
+    ra, dec: array
+        Sample positions in degrees
+    distance: array, optional
+        Luminosity distance of each sample in Mpc
+    weights: array, optional
+        Sample weights; equal by default
+    bandwidth: float, optional
+        Kernel width (angular standard deviation) in degrees. By default
+        Scott's rule on the angular spread of the samples
+    max_samples: int or None
+        Sub-sample larger sample sets to this many; None keeps them all
+    seed: int
+        Seed of the sub-sampling, so estimates are reproducible
+
+    """
+
+    def __init__(self, ra, dec, distance=None, weights=None, bandwidth=None,
+                 max_samples=DEFAULT_MAX_SAMPLES, seed=0):
+        ra, dec = np.broadcast_arrays(np.asarray(ra, dtype=float).ravel(),
+                                      np.asarray(dec, dtype=float).ravel())
+        n = len(ra)
+        if n == 0:
+            raise ValueError("SkyKDE needs at least one sample")
+        if weights is not None:
+            weights = np.asarray(weights, dtype=float).ravel()
+        if distance is not None:
+            distance = np.asarray(distance, dtype=float).ravel()
+        self.total_samples = n
+
+        if max_samples is not None and n > max_samples:
+            rng = np.random.default_rng(seed)
+            if weights is None:
+                keep = rng.choice(n, max_samples, replace=False)
+            else:
+                # Weighted draws with replacement leave equal weights
+                keep = rng.choice(n, max_samples, p=weights / weights.sum())
+                weights = None
+            ra, dec = ra[keep], dec[keep]
+            if distance is not None:
+                distance = distance[keep]
+        if weights is None:
+            weights = np.ones(len(ra))
+
+        self.ra, self.dec = ra, dec
+        self.distance = distance
+        self.weights = weights / weights.sum()
+
+        dims = 2 if distance is None else 3
+        if bandwidth is None:
+            bandwidth = np.degrees(self._scott_bandwidth(dims))
+        self.bandwidth = float(bandwidth)
+        self.kappa = 1 / np.radians(self.bandwidth) ** 2
+        if distance is not None:
+            self.distance_bandwidth = (self._spread(distance) *
+                                       self._effective_n() ** (-1 / (dims + 4)))
+        self._tree = None
+
+    def __len__(self):
+        return len(self.ra)
+
+    def __repr__(self):
+        return (f"SkyKDE({len(self)} samples, bandwidth="
+                f"{self.bandwidth:.3g} deg)")
+
+    def _effective_n(self):
+        return 1 / np.sum(self.weights ** 2)
+
+    def _spread(self, values):
+        mean = np.dot(self.weights, values)
+        return np.sqrt(np.dot(self.weights, (values - mean) ** 2))
+
+    def _scott_bandwidth(self, dims):
+        """Angular bandwidth in radians by Scott's rule.
+
+        The angular standard deviation per axis is estimated from the
+        mean resultant length R of the unit vectors, 1 - R ~ sigma^2.
+        """
+        resultant = np.linalg.norm(self.weights @ _unit_vectors(self.ra,
+                                                                self.dec))
+        sigma = np.sqrt(-np.log(np.clip(resultant, 1e-12, 1)))
+        sigma *= self._effective_n() ** (-1 / (dims + 4))
+        # Keep a single sample (or coincident ones) from collapsing the kernel
+        return float(np.clip(sigma, np.radians(1e-3), 1.))
+
+    @property
+    def tree(self):
+        """Haversine BallTree of the samples, built on first use."""
+        if self._tree is None:
+            with stage('kde.tree'):
+                self._tree = neighbors.BallTree(
+                    np.radians(np.column_stack([self.dec, self.ra])),
+                    metric='haversine')
+        return self._tree
+
+    def _kernel_sums(self, ra, dec, values=()):
+        """Kernel-weighted sums over the samples at RA/DEC points.
+
+        Returns the density per steradian, followed by the kernel-weighted
+        sums of each of `values` (arrays over the samples).
+        """
+        ra, dec = np.broadcast_arrays(np.asarray(ra, dtype=float),
+                                      np.asarray(dec, dtype=float))
+        shape = ra.shape
+        points = np.radians(np.column_stack([dec.ravel(), ra.ravel()]))
+        sums = np.zeros((1 + len(values), len(points)))
+        if not len(points):
+            return sums.reshape((-1,) + shape)
+        tree = self.tree
+        annotate(points=len(points), samples=len(self))
+
+        kappa = self.kappa
+        radius = min(KERNEL_CUTOFF * np.sqrt(1 / kappa), np.pi)
+        # vMF normalization, kappa / (2 pi (1 - exp(-2 kappa)))
+        norm = kappa / (-2 * np.pi * np.expm1(-2 * kappa))
+        values = [np.asarray(v, dtype=float) for v in values]
+        chunk = max(1, MAX_PAIRS // len(self))
+        with stage('kde.evaluate'):
+            for start in range(0, len(points), chunk):
+                ind, dist = tree.query_radius(points[start:start + chunk],
+                                              radius, return_distance=True)
+                counts = np.fromiter(map(len, ind), dtype=np.int64,
+                                     count=len(ind))
+                if not counts.sum():
+                    continue
+                ind = np.concatenate(ind)
+                rows = np.repeat(np.arange(len(counts)), counts)
+                kernel = self.weights[ind] * np.exp(
+                    kappa * (np.cos(np.concatenate(dist)) - 1))
+                block = sums[:, start:start + chunk]
+                block[0] = np.bincount(rows, kernel, minlength=len(counts))
+                for k, value in enumerate(values, 1):
+                    block[k] = np.bincount(rows, kernel * value[ind],
+                                           minlength=len(counts))
+        sums *= norm
+        return sums.reshape((-1,) + shape)
+
+    def pdf(self, ra, dec):
+        """Probability density per steradian at RA/DEC in degrees."""
+        return self._kernel_sums(ra, dec)[0]
+
+    def skymap(self, nside=None):
+        """Rasterize to a NESTED HEALPix sky map.
+
+        The density is evaluated at the pixel centres. Kernels narrower
+        than half a pixel would fall between the centres; at such a
+        resolution the samples are binned into pixels instead. The result
+        is a dict like the ones returned by `gw_assoc.io.load_gw_skymap`,
+        with distance layers when the samples have distances.
+
+        Parameters
+        ----------
+        nside: int, optional
+            Resolution; by default the coarsest with pixels below half
+            the bandwidth, up to MAX_AUTO_NSIDE
+
+        """
+        if nside is None:
+            nside = 1
+            while (nside < MAX_AUTO_NSIDE and
+                   hp.nside2resol(nside, arcmin=True) / 60 >
+                   self.bandwidth / 2):
+                nside *= 2
+        npix = hp.nside2npix(nside)
+        values = () if self.distance is None else (self.distance,
+                                                   self.distance ** 2)
+        if self.bandwidth >= hp.nside2resol(nside, arcmin=True) / 120:
+            ra, dec = hp.pix2ang(nside, np.arange(npix), nest=True,
+                                 lonlat=True)
+            sums = self._kernel_sums(ra, dec, values)
+        else:
+            ipix = hp.ang2pix(nside, self.ra, self.dec, nest=True,
+                              lonlat=True)
+            sums = np.array([np.bincount(ipix, self.weights * value,
+                                         minlength=npix)
+                             for value in (1.,) + values])
+        prob = sums[0] / sums[0].sum()
+        skymap = {
+            'prob': prob,
+            'distmu': None,
+            'distsigma': None,
+            'distnorm': None,
+            'nside': nside,
+            'nested': True,
+            'metadata': {'samples': self.total_samples,
+                         'bandwidth': self.bandwidth},
+            'moc': None,
+            'file': None,
+        }
+        if self.distance is not None:
+            skymap.update(zip(('distmu', 'distsigma', 'distnorm'),
+                              self._distance_layers(*sums)))
+        return skymap
+
+    def _distance_layers(self, density, m1, m2):
+        """Distance ansatz per pixel from kernel-weighted distance sums.
+
+        The conditional distance distribution of a direction is the
+        kernel-weighted mixture of Gaussians of width distance_bandwidth
+        around the sample distances; its mean and standard deviation are
+        matched by the ansatz (see ligo.skymap.distance).
+        """
+        from ligo.skymap.distance import moments_to_parameters
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = m1 / density
+            std = np.sqrt(np.clip(m2 / density - mean ** 2, 0, None) +
+                          self.distance_bandwidth ** 2)
+        empty = ~(density > 0)
+        mean[empty], std[empty] = 1., 1.
+        distmu, distsigma, distnorm = moments_to_parameters(mean, std)
+        bad = empty | ~np.isfinite(distmu)
+        distmu[bad], distsigma[bad], distnorm[bad] = np.inf, 1., 0.
+        return distmu, distsigma, distnorm
+
+
+def _unit_vectors(ra, dec):
+    ra, dec = np.radians(ra), np.radians(dec)
+    return np.column_stack([np.cos(dec) * np.cos(ra),
+                            np.cos(dec) * np.sin(ra),
+                            np.sin(dec)])
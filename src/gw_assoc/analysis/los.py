@@ -1,19 +1,86 @@
+from functools import lru_cache
+
+import numpy as np
+
+from .._lazy import lazy_import
+from ..instrument import annotate, stage
+from ..io.skymap import is_skymap_moc
+from ..io.transient import transient_columns
+from .moc import UniqIndex
+from .spatial import skymap_overlap_points, unpack_skymap
+
+hp = lazy_import('healpy')
+
 zinterp = np.linspace(0,0.5,5000)
 dz = zinterp[1] - zinterp[0]
-speed_of_light = constants.c.to('km/s').value
-H0Planck = Planck15.H0.value
-Om0Planck = Planck15.Om0
+# astropy.constants.c in km/s and the astropy.cosmology.Planck15 parameters,
+# spelled out so importing this module does not load astropy.cosmology
+speed_of_light = 299792.458
+H0Planck = 67.74
+Om0Planck = 0.3075
+# Default H0 grid (km/s/Mpc) marginalized over with a flat prior
+H0grid = np.linspace(20,140,121)
+
+# In flat LCDM, H0 only sets the distance scale c/H0, so a single table of
+# dimensionless distances per Om0 serves every H0 exactly. Tables span
+# [0, zmax] on the zinterp spacing and store d/z, which stays ~1 near z=0 and
+# keeps linear interpolation accurate in relative terms at low redshift.
+TABLE_ZSTEP = 0.5
+
+@lru_cache(maxsize=16)
+def distance_table(Om0, zmax=TABLE_ZSTEP):
+    """Cached (z, dL/z, dC/z) table in units of c/H0 for flat LCDM."""
+    from astropy import units as u
+    from astropy.cosmology import FlatLambdaCDM
+
+    z = np.arange(int(round(zmax/dz)) + 1) * dz
+    cosmo = FlatLambdaCDM(H0=speed_of_light, Om0=Om0)  # c/H0 = 1 Mpc
+    dc = cosmo.comoving_distance(z).to(u.Mpc).value
+    dc_ratio = np.ones_like(z)
+    dc_ratio[1:] = dc[1:]/z[1:]
+    dl_ratio = (1+z)*dc_ratio
+    for arr in (z, dl_ratio, dc_ratio):
+        arr.flags.writeable = False
+    return z, dl_ratio, dc_ratio
+
+def _table_for_z(z, Om0):
+    zmax = np.max(z[np.isfinite(z)], initial=0)
+    return distance_table(Om0, TABLE_ZSTEP*max(1, int(np.ceil(zmax/TABLE_ZSTEP))))
+
+def _hubble_distance(H0, shape):
+    # c/H0 with H0 along the leading axes of the result
+    H0 = np.asarray(H0, dtype=float)
+    return (speed_of_light/H0).reshape(H0.shape + (1,)*len(shape))
+
+def dL_at_z(z, H0, Om0=Om0Planck):
+    """Luminosity distance in Mpc, shape H0.shape + z.shape."""
+    z = np.asarray(z, dtype=float)
+    ztab, dl_ratio, _ = _table_for_z(z, Om0)
+    return _hubble_distance(H0, z.shape) * z*np.interp(z, ztab, dl_ratio)
+
+def z_at_dL(dL, H0, Om0=Om0Planck):
+    """Redshift at luminosity distance dL in Mpc, shape H0.shape + dL.shape."""
+    dL = np.asarray(dL, dtype=float)
+    x = dL/_hubble_distance(H0, dL.shape)  # dimensionless distance
+    zmax = TABLE_ZSTEP
+    ztab, dl_ratio, _ = distance_table(Om0, zmax)
+    while ztab[-1]*dl_ratio[-1] < np.max(x[np.isfinite(x)], initial=0):
+        zmax += TABLE_ZSTEP
+        ztab, dl_ratio, _ = distance_table(Om0, zmax)
+    return x*np.interp(x, ztab*dl_ratio, 1/dl_ratio)
+
+def dvdz_at_z(z, H0, Om0=Om0Planck):
+    """4 pi dV_c/dz/dOmega in Gpc^3, shape H0.shape + z.shape."""
+    z = np.asarray(z, dtype=float)
+    ztab, _, dc_ratio = _table_for_z(z, Om0)
+    dc = z*np.interp(z, ztab, dc_ratio)
+    return 4*np.pi*_hubble_distance(H0, z.shape)**3*dc**2/E(z,Om0)/1e9
 
 def dL_at_z_H0(z,h0,Om0):
-    cosmo = FlatLambdaCDM(H0=h0, Om0=Om0)
-    dLs = cosmo.luminosity_distance(z).to(u.Mpc).value
-    return dLs
+    return dL_at_z(z, h0, Om0)
 
 def z_at_dL_H0(dL,h0,Om0):
-    cosmo = FlatLambdaCDM(H0=h0, Om0=Om0)
-    dLs = cosmo.luminosity_distance(zinterp).to(u.Mpc).value  
-    z_at_dL = interp1d(dLs,zinterp)
-    return z_at_dL(dL)
+    return z_at_dL(dL, h0, Om0)
 
 def E(z,Om):
     return np.sqrt(Om*(1+z)**3 + (1.0-Om))
@@ -25,7 +92,143 @@ def dL_by_z_H0(z,dL,h0,Om0):
     return dL/(1+z) + speed_of_light*(1+z)/(h0*E(z,Om0))
 
 def dvdz(z, H0, Om0):
-    cosmo = FlatLambdaCDM(H0=H0, Om0=Om0)
-    dvdz = 4*np.pi*cosmo.differential_comoving_volume(z).to(u.Gpc**3/u.sr).value
-    return dvdz
+    return dvdz_at_z(z, H0, Om0)
+
+def los_parameters(skymap, ra, dec, nested=True, index=None):
+    """Per-position DISTMU, DISTSIGMA and DISTNORM of a 3D GW sky map.
+
+    Accepts a flat sky map dict from `gw_assoc.io.load_gw_skymap` or a
+    MOC table/dict. Positions outside the MOC coverage get DISTNORM 0.
+    """
+    skymap, nested, index = unpack_skymap(skymap, nested, index)
+    if isinstance(skymap, dict) or not is_skymap_moc(skymap):
+        raise ValueError("3D scoring needs a sky map with distance layers, "
+                         "e.g. from gw_assoc.io.load_gw_skymap")
+    ra, dec = np.broadcast_arrays(np.asarray(ra, dtype=float),
+                                  np.asarray(dec, dtype=float))
+    if index is None:
+        index = UniqIndex.from_table(skymap)
+    rows = index.lookup(ra, dec)
+    inside = rows >= 0
+    params = []
+    for name in ('DISTMU', 'DISTSIGMA', 'DISTNORM'):
+        col = np.asarray(skymap[name])[rows]
+        params.append(np.where(inside, col, 0.).astype(float))
+    return tuple(params)
+
+def _flat_los_parameters(skymap, ra, dec):
+    if skymap.get('distmu') is None:
+        raise ValueError("Sky map has no distance layers")
+    ipix = hp.ang2pix(skymap['nside'], ra, dec, nest=skymap['nested'],
+                      lonlat=True)
+    return tuple(np.asarray(skymap[k])[ipix].astype(float)
+                 for k in ('distmu', 'distsigma', 'distnorm'))
+
+def distance_posterior(dL, distmu, distsigma, distnorm):
+    """GW line-of-sight posterior p(dL|sky position) in 1/Mpc.
+
+    Uses the ansatz of the LVK 3D sky maps,
+        p(dL) = DISTNORM dL^2 N(dL; DISTMU, DISTSIGMA),
+    and returns 0 where the pixel has no valid distance information.
+    """
+    dL, distmu, distsigma, distnorm = np.broadcast_arrays(
+        dL, distmu, distsigma, distnorm)
+    valid = (np.isfinite(distmu) & np.isfinite(distnorm) & (distsigma > 0) &
+             (dL >= 0))
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        gauss = np.exp(-0.5*((dL - distmu)/distsigma)**2)/(
+            np.sqrt(2*np.pi)*distsigma)
+        p = distnorm*dL**2*gauss
+    return np.where(valid, p, 0.)
+
+def redshift_posterior(skymap, ra, dec=None, z=None, H0=None, H0_weights=None,
+                       Om0=Om0Planck, nested=True, index=None):
+    """GW posterior density of each transient's redshift along its line of sight.
+
+    p(z|ra,dec) = sum_k w_k p(dL(z,H0_k)|ra,dec) ddL/dz(z,H0_k), evaluated for
+    all transients and all H0 grid values in one array operation.
+
+    Parameters
+    ----------
+    skymap: dict or Table
+        3D GW sky map, flat (from `gw_assoc.io.load_gw_skymap`) or MOC
+    ra, dec, z: array
+        Transient positions in degrees and redshifts. `ra` may also be a
+        TransientCatalog providing all three
+    H0: array
+        H0 grid in km/s/Mpc, defaults to `H0grid`
+    H0_weights: array
+        Prior weights on the H0 grid, flat if not given
+    Om0: float
+        Matter density of the flat LCDM cosmology
+
+    Returns
+    -------
+    array
+        p(z|ra,dec) for each transient
+
+    """
+    H0 = H0grid if H0 is None else np.atleast_1d(np.asarray(H0, dtype=float))
+    w = np.ones(H0.shape) if H0_weights is None else np.asarray(H0_weights,
+                                                                dtype=float)
+    w = w/w.sum()
+    if dec is None:
+        ra, dec, z = transient_columns(ra, ('ra', 'dec', 'z')).values()
+    ra, dec, z = np.broadcast_arrays(np.asarray(ra, dtype=float),
+                                     np.asarray(dec, dtype=float),
+                                     np.asarray(z, dtype=float))
+    if isinstance(skymap, dict) and skymap.get('moc') is None:
+        mu, sigma, norm = _flat_los_parameters(skymap, ra, dec)
+    else:
+        mu, sigma, norm = los_parameters(skymap, ra, dec, nested, index)
+
+    dL = dL_at_z(z, H0, Om0)                         # (n_H0, n_transients)
+    jac = dL_by_z_H0(z, dL, H0[:, None], Om0)
+    p = distance_posterior(dL, mu, sigma, norm)*jac
+    return np.tensordot(w, p, axes=1)
+
+def redshift_prior(z, zmax=zinterp[-1], Om0=Om0Planck):
+    """Uniform-in-comoving-volume-and-time redshift prior on [0, zmax].
+
+    H0 only rescales dV/dz, so the normalized prior does not depend on it.
+    """
+    from scipy.integrate import trapezoid
+
+    z = np.asarray(z, dtype=float)
+    ztab = np.linspace(0, zmax, 5000)
+    f = dvdz_at_z(ztab, H0Planck, Om0)/(1+ztab)
+    norm = trapezoid(f, ztab)
+    inside = (z >= 0) & (z <= zmax)
+    return np.where(inside, dvdz_at_z(z, H0Planck, Om0)/(1+z)/norm, 0.)
+
+@stage('overlap.distance')
+def distance_bayes_factor(skymap, ra, dec=None, z=None, H0=None, H0_weights=None,
+                          Om0=Om0Planck, zmax=zinterp[-1], nested=True,
+                          index=None):
+    """Bayes factor of the GW redshift posterior against the `redshift_prior`.
+
+    The distance term of the 3D overlap, marginalized over the H0 grid.
+    """
+    if dec is None:
+        ra, dec, z = transient_columns(ra, ('ra', 'dec', 'z')).values()
+    pz = redshift_posterior(skymap, ra, dec, z, H0, H0_weights, Om0, nested,
+                            index)
+    annotate(points=np.size(pz), H0=np.size(H0grid if H0 is None else H0))
+    prior = redshift_prior(z, zmax, Om0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(prior > 0, pz/prior, 0.)
+
+def volume_overlap_points(skymap, ra, dec=None, z=None, H0=None, H0_weights=None,
+                          Om0=Om0Planck, zmax=zinterp[-1], nested=True,
+                          index=None):
+    """3D (sky position and distance) overlap of transients with a GW sky map.
 
+    The 2D overlap from `skymap_overlap_points` times the
+    `distance_bayes_factor` along each line of sight. Vectorized over
+    transients and H0 values. `ra` may also be a TransientCatalog.
+    """
+    if dec is None:
+        ra, dec, z = transient_columns(ra, ('ra', 'dec', 'z')).values()
+    overlap = skymap_overlap_points(skymap, ra, dec, nested, index)
+    return overlap*distance_bayes_factor(skymap, ra, dec, z, H0, H0_weights,
+                                         Om0, zmax, nested, index)
@@ -0,0 +1,309 @@
+# src/gw_assoc/analysis/matrix.py
+import math
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .._lazy import lazy_import
+from ..instrument import annotate, stage
+from ..io.skymap import SKYMAP_LAYERS, is_skymap_moc
+from ..io.transient import transient_columns
+from .credible import CredibleIndex, credible_index
+from .moc import UniqIndex
+from .odds import _score
+from .spatial import unpack_skymap
+
+hp = lazy_import("healpy")
+
+# Odds keywords that may be given once per sky map in matrix mode
+PER_SKYMAP_KWARGS = ("prior_odds", "gw_time")
+
+_INDEX_ARRAYS = ("level", "sort", "starts", "ends")
+_CREDIBLE_ARRAYS = ("cumprob", "cumarea", "rank")
+_ALIGN = 64
+
+# Shared sky maps attached by each pool worker
+_WORKER_SKYMAPS = None
+
+
+def _as_skymap_dict(skymap):
+    """Loaded sky map dict for a dict, MOC table or flat NESTED array."""
+    if isinstance(skymap, dict):
+        return skymap
+    if is_skymap_moc(skymap):
+        return {"moc": skymap, "nside": None, "nested": True}
+    prob = np.asarray(skymap)
+    return {"prob": prob, "nside": hp.npix2nside(prob.size), "nested": True,
+            "moc": None}
+
+
+class SharedSkymaps:
+    """
+    Arrays of several sky maps packed into one shared-memory block.
+
+    Only what scoring reads is shared: the cells and UniqIndex of MOC
+    sources, the layers of flat maps and, if already built, the
+    CredibleIndex. Pool workers attach to the block by name with
+    `attach(handle)` and get sky map dicts whose arrays are read-only
+    views of it, so no worker ever receives a copy of a map.
+
+    Use as a context manager, or call `close()`, to free the block.
+
+    Parameters
+    ----------
+    skymaps : sequence of dict, Table or array
+        Sky maps from load_gw_skymap, MOC tables or flat NESTED arrays.
+    """
+
+    def __init__(self, skymaps=None, *, _handle=None):
+        self._maps = {}
+        if _handle is not None:
+            name, self.layouts = _handle
+            self._shm = shared_memory.SharedMemory(name=name)
+            self._owner = False
+            return
+
+        arrays, self.layouts, size = [], [], 0
+        for skymap in skymaps:
+            layout = {"fields": {}, "arrays": {}, "columns": None}
+            for key, arr in _shared_arrays(_as_skymap_dict(skymap), layout):
+                arr = np.ascontiguousarray(arr)
+                size = -(-size // _ALIGN) * _ALIGN
+                layout["arrays"][key] = (size, arr.dtype.str, arr.shape)
+                arrays.append((size, arr))
+                size += arr.nbytes
+            self.layouts.append(layout)
+
+        self._shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self._owner = True
+        for offset, arr in arrays:
+            np.ndarray(arr.shape, arr.dtype, self._shm.buf, offset)[...] = arr
+
+    @classmethod
+    def attach(cls, handle):
+        """Attach to the block of another process's SharedSkymaps."""
+        return cls(_handle=handle)
+
+    @property
+    def handle(self):
+        """Small picklable reference passed to `attach`."""
+        return self._shm.name, self.layouts
+
+    @property
+    def nbytes(self):
+        return self._shm.size
+
+    def __len__(self):
+        return len(self.layouts)
+
+    def __getitem__(self, i):
+        skymap = self._maps.get(i)
+        if skymap is None:
+            skymap = self._maps[i] = self._build(self.layouts[i])
+        return skymap
+
+    def _build(self, layout):
+        arrays = {}
+        for key, (offset, dtype, shape) in layout["arrays"].items():
+            arr = np.ndarray(shape, dtype, self._shm.buf, offset)
+            arr.flags.writeable = False
+            arrays[key] = arr
+
+        skymap = dict(layout["fields"])
+        for key in SKYMAP_LAYERS:
+            skymap[key] = arrays.get(key)
+        skymap["moc"] = None
+        if layout["columns"] is not None:
+            from astropy.table import Table
+            skymap["moc"] = Table([arrays["moc." + c] for c in
+                                   layout["columns"]],
+                                  names=layout["columns"], copy=False)
+            skymap["index"] = UniqIndex.from_arrays(
+                max_order=layout["fields"]["index.max_order"],
+                **{key: arrays["index." + key] for key in _INDEX_ARRAYS})
+        skymap.pop("index.max_order", None)
+        if "credible.rank" in arrays:
+            skymap["credible"] = CredibleIndex.from_arrays(
+                locate=_locator(skymap),
+                **{key: arrays["credible." + key]
+                   for key in _CREDIBLE_ARRAYS})
+        return skymap
+
+    def close(self):
+        """Detach, and free the block if this process created it."""
+        self._maps.clear()
+        try:
+            self._shm.close()
+        except BufferError:
+            pass  # views still in use; unmapped when they are released
+        if self._owner:
+            self._owner = False
+            self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def _shared_arrays(skymap, layout):
+    """(key, array) pairs of a sky map to share; fills layout fields."""
+    fields = layout["fields"]
+    for key in ("nside", "nested", "file"):
+        fields[key] = skymap.get(key)
+    if skymap.get("moc") is not None:
+        moc, _, index = unpack_skymap(skymap)
+        layout["columns"] = list(moc.colnames)
+        for name in moc.colnames:
+            yield "moc." + name, np.asarray(moc[name])
+        fields["index.max_order"] = index.max_order
+        for key in _INDEX_ARRAYS:
+            yield "index." + key, getattr(index, key)
+    else:
+        for key in SKYMAP_LAYERS:
+            if skymap.get(key) is not None:
+                yield key, np.asarray(skymap[key])
+    credible = skymap.get("credible")
+    if credible is not None:
+        for key in _CREDIBLE_ARRAYS:
+            yield "credible." + key, getattr(credible, key)
+
+
+def _locator(skymap):
+    if skymap["moc"] is not None:
+        return skymap["index"].lookup
+    nside, nested = skymap["nside"], skymap["nested"]
+
+    def locate(ra, dec):
+        return hp.ang2pix(nside, ra, dec, nest=nested, lonlat=True)
+    return locate
+
+
+def _cost_weight(skymap):
+    """Relative cost of scoring one transient against a sky map."""
+    skymap = _as_skymap_dict(skymap)
+    if skymap.get("moc") is not None:
+        cells = len(skymap["moc"])
+        distance = "DISTMU" in skymap["moc"].colnames
+    else:
+        cells = len(skymap["prob"])
+        distance = skymap.get("distmu") is not None
+    return math.log2(cells + 2) * (2 if distance else 1)
+
+
+def plan_tasks(weights, n, workers, chunk_size=None):
+    """
+    Split M sky maps x n transients into balanced pool tasks.
+
+    Each map's transients are cut into chunks of about equal estimated cost
+    (chunk length times the map's weight), about four per worker in total,
+    so maps that are expensive to score get more, shorter chunks. Tasks are
+    returned most expensive first, which keeps the tail of the pool short.
+
+    Returns
+    -------
+    list of (map, start, stop)
+    """
+    weights = np.asarray(weights, dtype=float)
+    if chunk_size is None:
+        target = weights.sum() * n / (4 * workers)
+        sizes = [max(1, math.ceil(target / w)) for w in weights]
+    else:
+        sizes = [chunk_size] * len(weights)
+    tasks = [(m, i, min(i + size, n))
+             for m, size in enumerate(sizes) for i in range(0, n, size)]
+    tasks.sort(key=lambda t: weights[t[0]] * (t[2] - t[1]), reverse=True)
+    return tasks
+
+
+@stage("odds")
+def compute_posterior_odds_matrix(gw_maps, transients, *, workers=None,
+                                  chunk_size=None, return_terms=False,
+                                  **kwargs):
+    """
+    Posterior odds of N transients against each of M GW sky maps.
+
+    For several GW alerts active at once. With a process pool the sky maps
+    are packed once into shared memory (see SharedSkymaps), which every
+    worker attaches to without copying, and the M x N work is split into
+    chunks balanced by an estimate of each map's cost (see plan_tasks).
+
+    Parameters
+    ----------
+    gw_maps : sequence of dict or Table
+        GW sky maps (from load_gw_skymap, or MOC tables).
+    transients : TransientCatalog, sequence of Transient or dict of arrays
+        Transients to score, as for `compute_posterior_odds_batch`.
+    workers : int, optional
+        Score on a process pool with this many workers. Default is
+        in-process.
+    chunk_size : int, optional
+        Transients per pool task for every map; default balances the
+        estimated cost of the tasks.
+    return_terms : bool
+        If True, return a dict of (M, N) arrays with the individual terms.
+    prior_odds, gw_time : float or sequence
+        As for `compute_posterior_odds_batch`, or one value per sky map.
+    **kwargs
+        Other keywords of `compute_posterior_odds_batch`.
+
+    Returns
+    -------
+    np.ndarray or dict
+        (M, N) posterior odds, or all terms if return_terms.
+    """
+    gw_maps = list(gw_maps)
+    cols = transient_columns(transients)
+    m, n = len(gw_maps), len(cols["ra"])
+    annotate(skymaps=m, transients=n, workers=workers or 1)
+
+    per_map = [{} for _ in range(m)]
+    for key in PER_SKYMAP_KWARGS:
+        if np.ndim(kwargs.get(key)) == 1:
+            values = kwargs.pop(key)
+            if len(values) != m:
+                raise ValueError(f"{key} needs one value per sky map")
+            for d, value in zip(per_map, values):
+                d[key] = value
+
+    keys = ("posterior_odds", "spatial_overlap", "temporal_overlap",
+            "distance_factor")
+    terms = {k: np.empty((m, n)) for k in keys}
+    if not workers or workers <= 1 or m == 0 or n == 0:
+        for i, gw_data in enumerate(gw_maps):
+            for k, v in _score(gw_data, cols, **per_map[i], **kwargs).items():
+                terms[k][i] = v
+        return terms if return_terms else terms["posterior_odds"]
+
+    if kwargs.get("max_credible_level") is not None:
+        # Built once here and shared, rather than rebuilt by every task
+        gw_maps = [_as_skymap_dict(g) for g in gw_maps]
+        for gw_data in gw_maps:
+            credible_index(gw_data)
+    tasks = plan_tasks([_cost_weight(g) for g in gw_maps], n, workers,
+                       chunk_size)
+    # Stages inside the workers are not recorded; time the pool as a whole
+    with stage("odds.pool"), SharedSkymaps(gw_maps) as shared, \
+            ProcessPoolExecutor(workers, initializer=_attach_worker,
+                                initargs=(shared.handle,)) as pool:
+        annotate(skymaps=m, transients=n, workers=workers, chunks=len(tasks))
+        futures = [(i, start, stop, pool.submit(
+            _score_task, i, {k: v[start:stop] for k, v in cols.items()},
+            dict(kwargs, **per_map[i]))) for i, start, stop in tasks]
+        for i, start, stop, future in futures:
+            for k, v in future.result().items():
+                terms[k][i, start:stop] = v
+    return terms if return_terms else terms["posterior_odds"]
+
+
+def _attach_worker(handle):
+    global _WORKER_SKYMAPS
+    _WORKER_SKYMAPS = SharedSkymaps.attach(handle)
+
+
+def _score_task(i, cols, kwargs):
+    return _score(_WORKER_SKYMAPS[i], cols, **kwargs)
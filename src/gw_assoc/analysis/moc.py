@@ -0,0 +1,162 @@
+#multi-order (UNIQ) sky map helpers
+import numpy as np
+
+from .._lazy import lazy_import
+
+ah = lazy_import('astropy_healpix')
+hp = lazy_import('healpy')
+
+
+def uniq_to_nested_ranges(uniq, order):
+    """Convert UNIQ cells to half-open NESTED index ranges at `order`.
+
+    Parameters
+    ----------
+    uniq: array
+        UNIQ indices of the MOC cells
+    order: int
+        HEALPix order of the common grid, at least the finest cell order
+
+    Returns
+    -------
+    start, end: array
+        First and one-past-last NESTED pixel covered by each cell
+
+    """
+    level, ipix = ah.uniq_to_level_ipix(np.asarray(uniq, dtype=np.int64))
+    shift = 2 * (order - level)
+    if np.any(shift < 0):
+        raise ValueError("order must be at least the finest MOC cell order")
+    return ipix << shift, (ipix + 1) << shift
+
+
+class UniqIndex:
+    """Point-lookup index for a multi-ordered (MOC) sky map.
+
+    Every cell is expanded to its range of NESTED pixels at the finest
+    order present and the ranges are kept sorted, so the cell containing
+    a position is found with a binary search instead of a nearest
+    neighbour match against pixel centres. The lookup is exact for cells
+    of any size.
+
+    Build it once per UNIQ column and reuse it for every query against
+    the same sky map.
+
+    Parameters
+    ----------
+    uniq: array
+        UNIQ indices of the MOC cells
+
+    """
+
+    def __init__(self, uniq):
+        uniq = np.asarray(uniq, dtype=np.int64)
+        level, _ = ah.uniq_to_level_ipix(uniq)
+        self.level = level
+        self.max_order = int(level.max()) if level.size else 0
+        start, end = uniq_to_nested_ranges(uniq, self.max_order)
+        self.sort = np.argsort(start, kind='stable')
+        self.starts = start[self.sort]
+        self.ends = end[self.sort]
+
+    @classmethod
+    def from_table(cls, table):
+        """Build the index from a MOC table with a UNIQ column."""
+        return cls(table['UNIQ'])
+
+    @classmethod
+    def from_arrays(cls, level, sort, starts, ends, max_order=None):
+        """Rebuild an index from the arrays of a built one.
+
+        The arrays are used as given (e.g. views of shared memory) and
+        nothing is sorted again.
+
+        Parameters
+        ----------
+        level, sort, starts, ends: array
+            The attributes of the same name of an existing index
+        max_order: int, optional
+            Its `max_order`; the largest level if not given
+
+        """
+        index = cls.__new__(cls)
+        index.level, index.sort = level, sort
+        index.starts, index.ends = starts, ends
+        if max_order is None:
+            max_order = int(np.max(level)) if len(level) else 0
+        index.max_order = int(max_order)
+        return index
+
+    def __len__(self):
+        return len(self.level)
+
+    @property
+    def areas(self):
+        """Solid angle of each cell in steradians, in table order."""
+        return 4 * np.pi / (12 * 4.0 ** self.level)
+
+    def lookup_nested(self, ipix):
+        """Find the cells containing NESTED pixels at `max_order`.
+
+        Returns the row of the containing cell for each pixel, or -1 for
+        pixels outside the MOC coverage.
+        """
+        ipix = np.asarray(ipix, dtype=np.int64)
+        if not len(self):
+            return np.full(ipix.shape, -1, dtype=np.int64)
+        i = np.searchsorted(self.starts, ipix, side='right') - 1
+        i_safe = np.clip(i, 0, None)
+        inside = (i >= 0) & (ipix < self.ends[i_safe])
+        return np.where(inside, self.sort[i_safe], -1)
+
+    def lookup(self, ra, dec):
+        """Find the cells containing RA/DEC positions given in degrees.
+
+        Returns the row of the containing cell for each position, or -1
+        for positions outside the MOC coverage.
+        """
+        ipix = hp.ang2pix(2 ** self.max_order, ra, dec,
+                          nest=True, lonlat=True)
+        return self.lookup_nested(ipix)
+
+    def intersect(self, uniq):
+        """Find all overlapping cell pairs between this MOC and another.
+
+        Both MOCs are compared as sorted NESTED ranges at the finer of
+        their two maximum orders. Each cell of the other MOC is joined to
+        the run of indexed cells it overlaps with two binary searches, so
+        no product map at the finest common depth is ever built.
+
+        Parameters
+        ----------
+        uniq: array
+            UNIQ indices of the other MOC's cells
+
+        Returns
+        -------
+        rows: array
+            Row of the indexed cell for each overlapping pair
+        other_rows: array
+            Row of the other MOC's cell for each overlapping pair
+        area: array
+            Solid angle of each intersection in steradians
+
+        """
+        level, ipix = ah.uniq_to_level_ipix(np.asarray(uniq, dtype=np.int64))
+        order = max(self.max_order, int(level.max()) if level.size else 0)
+        start, end = ipix << 2 * (order - level), (ipix + 1) << 2 * (order - level)
+        shift = 2 * (order - self.max_order)
+        starts, ends = self.starts << shift, self.ends << shift
+
+        # Indexed cells [lo, hi) overlap each of the other cells
+        lo = np.searchsorted(ends, start, side='right')
+        hi = np.searchsorted(starts, end, side='left')
+        count = np.clip(hi - lo, 0, None)
+        other_rows = np.repeat(np.arange(len(start)), count)
+        first = np.cumsum(count) - count
+        i = lo[other_rows] + np.arange(count.sum()) - first[other_rows]
+
+        npix = (np.minimum(end[other_rows], ends[i]) -
+                np.maximum(start[other_rows], starts[i]))
+        area = npix * (4 * np.pi / (12 * 4.0 ** order))
+        return self.sort[i], other_rows, area
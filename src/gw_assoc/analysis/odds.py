@@ -1,18 +1,270 @@
 # src/gw_assoc/analysis/odds.py
+import multiprocessing as mp
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
+
+from ..instrument import annotate, record_stage, stage
+from ..io.skymap import is_skymap_moc
+from ..io.transient import transient_columns
+from .credible import credible_index
+from .kde import SkyKDE
+from .los import distance_bayes_factor
+from .spatial import skymap_overlap_points
+
+# Sky map (and its credible-region index, if filtering) used by pool
+# workers, set once per worker by the pool initializer so they are never
+# pickled along with each chunk
+_WORKER_SKYMAP = None
+_WORKER_CREDIBLE = None
+
+
+@stage('odds')
 def compute_posterior_odds(gw_data, transient, **kwargs):
     """
-    Minimal stub for posterior odds calculation.
-    Replace with real math later.
+    Posterior odds that a transient is associated with a GW event.
+
+    The odds are the prior odds times the spatial overlap integral, the
+    temporal Bayes factor and, when the transient has a redshift and the
+    sky map has distance layers, the distance Bayes factor. See
+    `compute_posterior_odds_batch` for the keyword arguments.
+
+    Parameters
+    ----------
+    gw_data : dict or Table
+        GW sky map (from load_gw_skymap, or a MOC table).
+    transient : Transient
+        Transient event.
+
+    Returns
+    -------
+    dict
+        Posterior odds and the terms they are made of.
     """
+    kwargs.pop("workers", None)
+    cols = transient_columns(transient)
+    terms = _score(gw_data, cols, **kwargs)
     return {
-        "gw_file": getattr(gw_data, "get", lambda *_: None)("file"),
+        "gw_file": gw_data.get("file") if isinstance(gw_data, dict) else None,
         "transient": {
             "ra": getattr(transient, "ra", None),
             "dec": getattr(transient, "dec", None),
             "z": getattr(transient, "z", None),
             "time": getattr(transient, "time", None),
         },
-        "posterior_odds": None,
-        "note": "compute_posterior_odds not implemented yet",
+        "posterior_odds": float(terms["posterior_odds"][0]),
+        "prior_odds": kwargs.get("prior_odds", 1.0),
+        "spatial_overlap": float(terms["spatial_overlap"][0]),
+        "temporal_overlap": float(terms["temporal_overlap"][0]),
+        "distance_factor": float(terms["distance_factor"][0]),
+    }
+
+
+@stage('odds')
+def compute_posterior_odds_batch(gw_data, transients, *, workers=None,
+                                 chunk_size=None, return_terms=False,
+                                 **kwargs):
+    """
+    Posterior odds for a whole catalog of transients against one GW sky map.
+
+    Parameters
+    ----------
+    gw_data : dict or Table
+        GW sky map (from load_gw_skymap, or a MOC table).
+    transients : TransientCatalog, sequence of Transient or dict of arrays
+        Transients to score; a dict needs 'ra' and 'dec' arrays and may
+        have 'z' and 'time'.
+    workers : int, optional
+        Score chunks on a process pool with this many workers. The sky map
+        is handed to each worker once (inherited through fork where
+        available), never pickled per chunk. Default is in-process.
+    chunk_size : int, optional
+        Transients per pool task; default splits the catalog into about four
+        chunks per worker.
+    return_terms : bool
+        If True, return a dict of arrays with the individual terms instead
+        of just the odds.
+    prior_odds : float
+        Prior odds of association, default 1.
+    gw_time : float
+        GW event time, in the same units as the transient times.
+    window : UniformWindow or ExponentialWindow
+        Temporal window around gw_time. Transients outside the window get
+        zero odds and are not scored spatially. The temporal Bayes factor
+        is the window likelihood against a uniform background over the
+        window. Without gw_time/window the temporal term is 1.
+    use_distance : bool
+        Include the distance term when possible, default True.
+    max_credible_level : float, optional
+        Pre-filter: transients outside this credible region of the GW sky
+        map (e.g. 0.99) get zero odds and are not scored. The region is
+        looked up in a CredibleIndex built once per call (and kept in a
+        load_gw_skymap dict).
+    H0, H0_weights, Om0, zmax
+        Forwarded to the distance term, see analysis.los.
+
+    Returns
+    -------
+    np.ndarray or dict
+        Posterior odds for each transient, or all terms if return_terms.
+    """
+    cols = transient_columns(transients)
+    n = len(cols["ra"])
+    annotate(transients=n, workers=workers or 1)
+    if not workers or workers <= 1 or n == 0:
+        terms = _score(gw_data, cols, **kwargs)
+        return terms if return_terms else terms["posterior_odds"]
+
+    if chunk_size is None:
+        chunk_size = max(1, -(-n // (4 * workers)))
+    starts = range(0, n, chunk_size)
+    chunks = [{k: v[i:i + chunk_size] for k, v in cols.items()}
+              for i in starts]
+    # Stages inside the workers are not recorded; time the pool as a whole
+    with stage("odds.pool"):
+        annotate(transients=n, workers=workers, chunks=len(chunks))
+        results = [terms for _, terms in iter_posterior_odds(
+            gw_data, chunks, workers=workers, max_pending=len(chunks),
+            **kwargs)]
+    terms = {k: np.concatenate([r[k] for r in results]) for k in results[0]}
+    return terms if return_terms else terms["posterior_odds"]
+
+
+def iter_posterior_odds(gw_data, chunks, *, workers=None, max_pending=None,
+                        **kwargs):
+    """
+    Stream odds terms for an iterable of transient chunks, in input order.
+
+    Chunks (TransientCatalogs or anything `transient_columns` accepts) are
+    pulled from `chunks` only as results are consumed: at most `max_pending`
+    chunks (default 2 per worker) are in flight, so a slow consumer applies
+    back-pressure to the reader and memory stays bounded however long the
+    stream is.
+
+    Yields
+    ------
+    chunk, terms
+        Each input chunk with its dict of term arrays (see
+        `compute_posterior_odds_batch` with return_terms=True).
+    """
+    # Credible-region index built once for the stream, not per chunk
+    credible = (credible_index(gw_data)
+                if kwargs.get("max_credible_level") is not None else None)
+    if not workers or workers <= 1:
+        for chunk in chunks:
+            with stage("odds"):
+                terms = _score(gw_data, transient_columns(chunk),
+                               credible=credible, **kwargs)
+            yield chunk, terms
+        return
+
+    max_pending = max_pending or 2 * workers
+    pending = deque()
+    with _skymap_pool(gw_data, workers, credible) as pool:
+        for chunk in chunks:
+            cols = transient_columns(chunk)
+            pending.append((chunk, pool.submit(_score_worker, cols, kwargs)))
+            if len(pending) >= max_pending:
+                chunk, future = pending.popleft()
+                yield chunk, _worker_terms(future)
+        while pending:
+            chunk, future = pending.popleft()
+            yield chunk, _worker_terms(future)
+
+
+def _skymap_pool(gw_data, workers, credible=None):
+    """Process pool whose workers each hold the sky map exactly once.
+
+    The sky map and its credible-region index reach the workers through
+    the pool initializer, so concurrent pools never share state in the
+    parent. With fork (where available) the initializer arguments are
+    inherited copy-on-write rather than pickled.
+    """
+    context = (mp.get_context("fork") if "fork" in mp.get_all_start_methods()
+               else None)
+    return ProcessPoolExecutor(workers, mp_context=context,
+                               initializer=_init_worker,
+                               initargs=(gw_data, credible))
+
+
+def _init_worker(gw_data, credible=None):
+    global _WORKER_SKYMAP, _WORKER_CREDIBLE
+    _WORKER_SKYMAP = gw_data
+    _WORKER_CREDIBLE = credible
+
+
+def _score_worker(cols, kwargs):
+    start = time.perf_counter()
+    terms = _score(_WORKER_SKYMAP, cols, credible=_WORKER_CREDIBLE, **kwargs)
+    return terms, time.perf_counter() - start
+
+
+def _worker_terms(future):
+    """Terms of a pooled chunk, recording its scoring time in the worker."""
+    terms, wall_time = future.result()
+    record_stage("odds.worker", wall_time,
+                 transients=len(terms["posterior_odds"]))
+    return terms
+
+
+def _has_distance(gw_data):
+    if isinstance(gw_data, SkyKDE):
+        # Distances of samples are used once rasterized with SkyKDE.skymap
+        return False
+    if isinstance(gw_data, dict):
+        if gw_data.get("moc") is not None:
+            return "DISTMU" in gw_data["moc"].colnames
+        return gw_data.get("distmu") is not None
+    return is_skymap_moc(gw_data) and "DISTMU" in gw_data.colnames
+
+
+def _score(gw_data, cols, prior_odds=1.0, gw_time=None, window=None,
+           use_distance=True, max_credible_level=None, H0=None,
+           H0_weights=None, Om0=None, zmax=None, credible=None):
+    """All odds terms for a chunk of transient columns.
+
+    `credible` is a prebuilt CredibleIndex of gw_data for the
+    max_credible_level filter; built here if not given.
+    """
+    n = len(cols["ra"])
+    annotate(transients=n)
+    temporal = np.ones(n)
+    spatial = np.zeros(n)
+    distance = np.ones(n)
+
+    if gw_time is not None and window is not None:
+        with stage("overlap.temporal"):
+            dt = cols["time"] - gw_time
+            has_time = np.isfinite(dt)
+            temporal[has_time] = (window.pdf(dt[has_time]) *
+                                  window.duration)
+
+    # Only transients in temporal coincidence (and inside the credible
+    # region, if asked) are scored spatially
+    todo = np.flatnonzero(temporal > 0)
+    if max_credible_level is not None and todo.size:
+        with stage("credible.filter"):
+            if credible is None:
+                credible = credible_index(gw_data)
+            inside = credible.inside(
+                cols["ra"][todo], cols["dec"][todo], max_credible_level)
+        todo = todo[inside]
+    if todo.size:
+        ra, dec, z = cols["ra"][todo], cols["dec"][todo], cols["z"][todo]
+        spatial[todo] = skymap_overlap_points(gw_data, ra, dec)
+        has_z = np.isfinite(z)
+        if use_distance and has_z.any() and _has_distance(gw_data):
+            los_kwargs = {k: v for k, v in dict(H0=H0, H0_weights=H0_weights,
+                                                 Om0=Om0, zmax=zmax).items()
+                          if v is not None}
+            distance[todo[has_z]] = distance_bayes_factor(
+                gw_data, ra[has_z], dec[has_z], z[has_z], **los_kwargs)
+
+    return {
+        "posterior_odds": prior_odds * spatial * temporal * distance,
+        "spatial_overlap": spatial,
+        "temporal_overlap": temporal,
+        "distance_factor": distance,
     }
@@ -1,8 +1,22 @@
 #spatial overlap calculations (KDE, GP)
+import numpy as np
 
+from .._lazy import lazy_import
+from ..instrument import annotate, stage
+from ..precision import dot, total
+from ..io.skymap import is_skymap_moc, nest_block_sum, ring_to_nested
+from ..io.transient import transient_columns
+from .kde import SkyKDE
+from .moc import UniqIndex
+
+ah = lazy_import('astropy_healpix')
+hp = lazy_import('healpy')
+
+@stage('overlap.spatial')
 def skymap_overlap_integral(gw_skymap, ext_skymap=None,
                             ra=None, dec=None,
-                            gw_nested=True, ext_nested=True):
+                            gw_nested=True, ext_nested=True,
+                            gw_index=None):
     """Sky map overlap integral between two sky maps.
 
     This method was originally developed in:
@@ -18,14 +32,16 @@ def skymap_overlap_integral(gw_skymap, ext_skymap=None,
 
     Parameters
     ----------
-    gw_skymap: array or Table
+    gw_skymap: array, Table or dict
         Array containing either GW sky localization probabilities
         if using nested or ring ordering,
-        or probability density if using UNIQ ordering
-    ext_skymap: array or Table
+        or probability density if using UNIQ ordering,
+        or a sky map loaded with `gw_assoc.io.load_gw_skymap`
+    ext_skymap: array, Table or dict
         Array containing either external sky localization probabilities
         if using nested or ring ordering,
-        or probability density if using UNIQ ordering
+        or probability density if using UNIQ ordering,
+        or a sky map loaded with `gw_assoc.io.load_gw_skymap`
     ra: float
         Right ascension of external localization in degrees
     dec: float
@@ -36,8 +52,17 @@ def skymap_overlap_integral(gw_skymap, ext_skymap=None,
     ext_nested: bool
         If True, assumes external sky map uses nested ordering, otherwise
         assumes ring ordering
+    gw_index: UniqIndex
+        Prebuilt index for a multi-ordered GW sky map, used with RA/DEC
+        or a multi-ordered external sky map. Built on the fly if not given
 
     """
+    # Resolve sky maps loaded with load_gw_skymap
+    gw_skymap, gw_nested, gw_index = unpack_skymap(gw_skymap, gw_nested,
+                                                   gw_index)
+    if ext_skymap is not None:
+        ext_skymap, ext_nested, _ = unpack_skymap(ext_skymap, ext_nested)
+    annotate(gw_skymap)
     # Set initial variables
     gw_skymap_uniq = None
     gw_skymap_prob = None
@@ -88,90 +113,332 @@ def skymap_overlap_integral(gw_skymap, ext_skymap=None,
     # Use multi-ordered GW sky map
     if gw_moc:
         # gw_skymap is the probability density instead of probability
-        # convert GW sky map uniq to ra and dec
-        level, ipix = ah.uniq_to_level_ipix(gw_skymap_uniq)
-        nsides = ah.level_to_nside(level)
-        areas = ah.nside_to_pixel_area(nsides)
-        ra_gw, dec_gw = \
-            ah.healpix_to_lonlat(ipix, nsides,
-                                 order='nested')
-        sky_prior = 1 / (4 * np.pi * u.sr)
-        se_norm = np.sum(gw_skymap_prob * areas)
-
         if ext_moc:
             # Use two multi-ordered sky maps
-            gw_sky_hpmoc = PartialUniqSkymap(
-                               gw_skymap_prob, gw_skymap_uniq,
-                               name="PROBDENSITY")
-            ext_sky_hpmoc = PartialUniqSkymap(
-                                    ext_skymap_prob, ext_skymap_uniq,
-                                    name="PROBDENSITY")
-            ext_norm = np.sum(ext_sky_hpmoc.s * ext_sky_hpmoc.area())
-
-            # Take product of sky maps and then sum to get inner product
-            # Note that this method uses the highest depth grid of each sky map
-            comb_sky_hpmoc = gw_sky_hpmoc * ext_sky_hpmoc
-            return np.sum(comb_sky_hpmoc.s * comb_sky_hpmoc.area() /
-                          sky_prior / se_norm / ext_norm).to(1).value
+            return moc_overlap_integral(gw_skymap, ext_skymap,
+                                        gw_index=gw_index)
 
         elif ra is not None and dec is not None:
             # Use multi-ordered gw sky map and one external point
             # Relevant for very well localized experiments
             # such as Swift
-            c = SkyCoord(ra=ra*u.degree, dec=dec*u.degree)
-            catalog = SkyCoord(ra=ra_gw, dec=dec_gw)
-            ind, d2d, d3d = c.match_to_catalog_sky(catalog)
-
-            return (gw_skymap_prob[ind] / u.sr /
-                    sky_prior / se_norm).to(1).value
+            if gw_index is None:
+                gw_index = UniqIndex(gw_skymap_uniq)
+            return _moc_point_overlap(gw_skymap_prob, gw_index, ra, dec)
 
         elif ext_skymap is not None:
             # Use multi-ordered gw sky map and flat external sky map
             # Find matching external sky map indices using GW ra/dec
+            # converted from the GW sky map uniq
+            level, ipix = ah.uniq_to_level_ipix(gw_skymap_uniq)
+            ra_gw, dec_gw = \
+                ah.healpix_to_lonlat(ipix, ah.level_to_nside(level),
+                                     order='nested')
             ext_nside = ah.npix_to_nside(len(ext_skymap))
             ext_ind = \
                 ah.lonlat_to_healpix(ra_gw, dec_gw, ext_nside,
                                      order=ext_order)
 
-            ext_norm = np.sum(ext_skymap)
+            # Plain arrays in steradians: the overlap is
+            # 4 pi sum(p_gw A_gw p_ext / A_ext) / norms, with 4 pi / A_ext
+            # the number of external pixels
+            gw_skymap_prob = np.asarray(gw_skymap_prob)
+            areas = 4 * np.pi / (12 * 4.0 ** level)
+            se_norm = dot(gw_skymap_prob, areas)
+            ext_norm = total(ext_skymap)
 
-            return np.sum(gw_skymap_prob * areas * ext_skymap[ext_ind] /
-                          ah.nside_to_pixel_area(ext_nside) /
-                          sky_prior / se_norm / ext_norm).to(1).value
+            return (dot(gw_skymap_prob * areas, np.asarray(ext_skymap)[ext_ind])
+                    * len(ext_skymap) / se_norm / ext_norm)
 
     # Use flat GW sky map
     else:
         if ra is not None and dec is not None:
             # Use flat gw sky and one external point
-            se_nside = ah.npix_to_nside(len(gw_skymap))
-            ind = ah.lonlat_to_healpix(ra * u.deg, dec * u.deg, se_nside,
-                                       order=se_order)
-            se_norm = sum(gw_skymap)
-            return gw_skymap[ind] * len(gw_skymap) / se_norm
+            return _flat_point_overlap(gw_skymap, total(gw_skymap),
+                                       se_order, ra, dec)
+
+        elif ext_moc:
+            # Use flat gw sky map and multi-ordered external sky map
+            return _flat_moc_overlap(gw_skymap, se_order, ext_skymap_uniq,
+                                     ext_skymap_prob)
 
         elif ext_skymap is not None:
-            if gw_nested != ext_nested:
-                raise ValueError("Sky maps must both use nested or ring "
-                                 "ordering")
             # Use two flat sky maps
+            # Work in nested ordering so the finer map can be summed down
+            # to the coarser grid block by block. This gives the same
+            # result as upgrading the coarser map, since upgrading copies
+            # each coarse value to all of its children.
+            gw_skymap = np.asarray(gw_skymap)
+            ext_skymap = np.asarray(ext_skymap)
+            if not gw_nested:
+                gw_skymap = ring_to_nested(gw_skymap)
+            if not ext_nested:
+                ext_skymap = ring_to_nested(ext_skymap)
             nside_s = hp.npix2nside(len(gw_skymap))
             nside_e = hp.npix2nside(len(ext_skymap))
             if nside_s > nside_e:
-                ext_skymap = hp.ud_grade(ext_skymap,
-                                         nside_out=nside_s,
-                                         order_in=('NESTED' if ext_nested
-                                                   else 'RING'))
-            else:
-                gw_skymap = hp.ud_grade(gw_skymap,
-                                        nside_out=nside_e,
-                                        order_in=('NESTED' if gw_nested
-                                                  else 'RING'))
-            se_norm = gw_skymap.sum()
-            exttrig_norm = ext_skymap.sum()
+                gw_skymap = nest_block_sum(gw_skymap, nside_e)
+            elif nside_e > nside_s:
+                ext_skymap = nest_block_sum(ext_skymap, nside_s)
+            # Block sums conserve the totals, so normalize afterwards
+            se_norm = total(gw_skymap)
+            exttrig_norm = total(ext_skymap)
             if se_norm > 0 and exttrig_norm > 0:
-                return (np.dot(gw_skymap, ext_skymap) / se_norm /
+                return (dot(gw_skymap, ext_skymap) / se_norm /
                         exttrig_norm * len(gw_skymap))
             raise ValueError("RAVEN: ERROR: At least one sky map has a "
                              "probability density that sums to zero or less.")
 
     raise ValueError("Please provide both GW and external sky map info")
+
+
+@stage('overlap.spatial')
+def skymap_overlap_points(gw_skymap, ra, dec=None, gw_nested=True,
+                          gw_index=None):
+    """Sky map overlap integral between a GW sky map and many positions.
+
+    Vectorized form of the RA/DEC branch of `skymap_overlap_integral`:
+    the sky map is unpacked and normalized once and every position is
+    evaluated in a single array operation, so scoring a whole transient
+    catalog costs about the same as scoring one transient.
+
+    Parameters
+    ----------
+    gw_skymap: array, Table, dict or SkyKDE
+        Array containing either GW sky localization probabilities
+        if using nested or ring ordering,
+        or probability density if using UNIQ ordering,
+        or a sky map loaded with `gw_assoc.io.load_gw_skymap`,
+        or a kernel density estimate from posterior samples
+    ra: float, array or TransientCatalog
+        Right ascensions of external localizations in degrees,
+        or a transient catalog providing both RA and DEC
+    dec: float or array
+        Declinations of external localizations in degrees
+    gw_nested: bool
+        If True, assumes GW sky map uses nested ordering, otherwise
+        assumes ring ordering
+    gw_index: UniqIndex
+        Prebuilt point-lookup index for a multi-ordered GW sky map.
+        Build it once per sky map to amortize it over many calls
+
+    Returns
+    -------
+    overlap: array
+        Overlap integral for each position, with the same shape as
+        the broadcast of `ra` and `dec`
+
+    """
+    if dec is None:
+        ra, dec = transient_columns(ra, ('ra', 'dec')).values()
+    ra, dec = np.broadcast_arrays(np.asarray(ra, dtype=float),
+                                  np.asarray(dec, dtype=float))
+    if isinstance(gw_skymap, SkyKDE):
+        return 4 * np.pi * gw_skymap.pdf(ra, dec)
+    gw_skymap, gw_nested, gw_index = unpack_skymap(gw_skymap, gw_nested,
+                                                   gw_index)
+    annotate(gw_skymap, points=ra.size)
+
+    if is_skymap_moc(gw_skymap):
+        gw_skymap_prob = _moc_probdensity(gw_skymap)
+        if gw_index is None:
+            gw_index = UniqIndex.from_table(gw_skymap)
+        return _moc_point_overlap(gw_skymap_prob, gw_index, ra, dec)
+
+    se_order = 'nested' if gw_nested else 'ring'
+    return _flat_point_overlap(gw_skymap, total(gw_skymap),
+                               se_order, ra, dec)
+
+
+@stage('overlap.spatial')
+def sample_overlap_integral(gw_skymap, ext_skymap):
+    """Sky map overlap integral with posterior-sample localizations.
+
+    Either side may be a `SkyKDE` of posterior samples; the other is a
+    `SkyKDE` or any sky map accepted by `skymap_overlap_points`. The
+    integral 4 pi int p_gw p_ext dOmega is an expectation over the
+    samples of one side of the density of the other: over the external
+    samples when the GW side is a kernel density estimate, otherwise
+    over the samples it has.
+
+    Parameters
+    ----------
+    gw_skymap: SkyKDE, array, Table or dict
+        GW localization
+    ext_skymap: SkyKDE, array, Table, dict, or list of them
+        External localization, or several to score in one call
+
+    Returns
+    -------
+    overlap: float or array
+        Overlap integral, or an array of them if a list of external
+        localizations was given
+
+    """
+    single = not isinstance(ext_skymap, list)
+    if single:
+        ext_skymap = [ext_skymap]
+    overlap = np.empty(len(ext_skymap))
+    for i, ext in enumerate(ext_skymap):
+        if isinstance(ext, SkyKDE):
+            density, samples = gw_skymap, ext
+        elif isinstance(gw_skymap, SkyKDE):
+            density, samples = ext, gw_skymap
+        else:
+            raise ValueError("Please provide posterior samples (SkyKDE) "
+                             "for at least one localization")
+        overlap[i] = np.dot(samples.weights,
+                            skymap_overlap_points(density, samples.ra,
+                                                  samples.dec))
+    return overlap[0] if single else overlap
+
+
+def unpack_skymap(skymap, nested=True, index=None):
+    """Resolve a loaded sky map to the inputs of the overlap functions.
+
+    Sky maps loaded with `gw_assoc.io.load_gw_skymap` are dicts. For a
+    MOC source the original cells are used, and their `UniqIndex` is
+    built once and kept in the dict under 'index'. Otherwise the
+    rasterized probabilities are used. Anything else is returned as is.
+
+    Returns
+    -------
+    skymap: array or Table
+    nested: bool
+    index: UniqIndex or None
+
+    """
+    if not isinstance(skymap, dict):
+        return skymap, nested, index
+    if skymap.get('moc') is None:
+        return skymap['prob'], skymap['nested'], index
+    if index is None:
+        index = skymap.get('index')
+        if index is None:
+            index = skymap['index'] = UniqIndex.from_table(skymap['moc'])
+    return skymap['moc'], True, index
+
+
+@stage('overlap.spatial')
+def moc_overlap_integral(gw_skymap, ext_skymaps, gw_index=None):
+    """Sky map overlap integral between multi-ordered (MOC) sky maps.
+
+    Computes the same inner product as the MOC/MOC branch of
+    `skymap_overlap_integral` without building a product map: the
+    external cells are joined against the sorted UNIQ ranges of the GW
+    sky map and each overlapping pair is weighted by the area of its
+    intersection.
+
+    Many external sky maps (e.g. a batch of Fermi-GBM localizations) are
+    joined against the GW sky map in one pass.
+
+    Parameters
+    ----------
+    gw_skymap: Table
+        GW sky map with UNIQ ordering and probability density
+    ext_skymaps: Table or list of Table
+        One or more external sky maps with UNIQ ordering and
+        probability density
+    gw_index: UniqIndex
+        Prebuilt index for the GW sky map. Build it once per sky map to
+        amortize it over many calls
+
+    Returns
+    -------
+    overlap: float or array
+        Overlap integral, or an array of them if a list of external sky
+        maps was given
+
+    """
+    single = is_skymap_moc(ext_skymaps)
+    if single:
+        ext_skymaps = [ext_skymaps]
+    if gw_index is None:
+        gw_index = UniqIndex.from_table(gw_skymap)
+
+    gw_skymap_prob = np.clip(_moc_probdensity(gw_skymap), 0., None)
+    se_norm = np.sum(gw_skymap_prob * gw_index.areas)
+
+    # Stack all external cells, remembering which sky map they came from
+    sizes = [len(ext) for ext in ext_skymaps]
+    ext_id = np.repeat(np.arange(len(sizes)), sizes)
+    ext_uniq = np.concatenate(
+        [np.asarray(ext['UNIQ'], dtype=np.int64) for ext in ext_skymaps])
+    ext_prob = np.clip(np.concatenate(
+        [_moc_probdensity(ext) for ext in ext_skymaps]), 0., None)
+    ext_level, _ = ah.uniq_to_level_ipix(ext_uniq)
+    ext_areas = 4 * np.pi / (12 * 4.0 ** ext_level)
+    ext_norm = np.bincount(ext_id, ext_prob * ext_areas,
+                           minlength=len(sizes))
+
+    rows, ext_rows, area = gw_index.intersect(ext_uniq)
+    overlap = np.bincount(ext_id[ext_rows],
+                          gw_skymap_prob[rows] * ext_prob[ext_rows] * area,
+                          minlength=len(sizes))
+    overlap = overlap * 4 * np.pi / se_norm / ext_norm
+    return overlap[0] if single else overlap
+
+
+def _moc_probdensity(skymap):
+    """Probability density column of a MOC sky map as a plain array."""
+    try:
+        prob = skymap['PROBDENSITY']
+    except KeyError:
+        prob = skymap['PROB']
+    return np.asarray(prob, dtype=float)
+
+
+def _moc_point_overlap(gw_skymap_prob, gw_index, ra, dec):
+    """Evaluate a normalized MOC probability density at RA/DEC points.
+
+    Positions outside the MOC coverage get zero overlap.
+    """
+    gw_skymap_prob = np.asarray(gw_skymap_prob)
+    se_norm = dot(gw_skymap_prob, gw_index.areas)
+    rows = gw_index.lookup(ra, dec)
+    overlap = np.where(rows >= 0, gw_skymap_prob[rows], 0.)
+    return overlap.astype(np.float64) * (4 * np.pi / se_norm)
+
+
+def _flat_moc_overlap(gw_skymap, se_order, ext_uniq, ext_prob):
+    """Overlap integral of a flat GW sky map with a MOC sky map.
+
+    In nested ordering a MOC cell at or above the GW resolution covers
+    a contiguous pixel range, whose probability is read off a cumulative
+    sum; a finer cell lies inside one GW pixel and takes its share by
+    area. The result is exact for piecewise-constant densities.
+    """
+    gw_skymap = np.clip(np.asarray(gw_skymap), 0., None)
+    if se_order == 'ring':
+        gw_skymap = ring_to_nested(gw_skymap)
+    gw_order = ah.nside_to_level(hp.npix2nside(len(gw_skymap)))
+    ext_prob = np.clip(np.asarray(ext_prob, dtype=float), 0., None)
+    level, ipix = ah.uniq_to_level_ipix(np.asarray(ext_uniq, dtype=np.int64))
+    ext_areas = 4 * np.pi / (12 * 4.0 ** level)
+
+    cumprob = np.concatenate(([0.], np.cumsum(gw_skymap, dtype=np.float64)))
+    shift = 2 * np.clip(gw_order - level, 0, None)
+    coarse = level <= gw_order
+    gw_prob = np.empty(len(ipix))
+    gw_prob[coarse] = (cumprob[(ipix[coarse] + 1) << shift[coarse]] -
+                       cumprob[ipix[coarse] << shift[coarse]])
+    fine = ~coarse
+    parent = ipix[fine] >> (2 * (level[fine] - gw_order))
+    gw_prob[fine] = gw_skymap[parent] * 4.0 ** (gw_order - level[fine])
+
+    se_norm = cumprob[-1]
+    ext_norm = np.sum(ext_prob * ext_areas)
+    if se_norm > 0 and ext_norm > 0:
+        return float(np.sum(gw_prob * ext_prob) * 4 * np.pi /
+                     se_norm / ext_norm)
+    raise ValueError("RAVEN: ERROR: At least one sky map has a "
+                     "probability density that sums to zero or less.")
+
+
+def _flat_point_overlap(gw_skymap, se_norm, se_order, ra, dec):
+    """Evaluate a normalized flat HEALPix sky map at RA/DEC points."""
+    gw_skymap = np.asarray(gw_skymap)
+    se_nside = hp.npix2nside(len(gw_skymap))
+    ind = hp.ang2pix(se_nside, ra, dec, nest=se_order == 'nested',
+                     lonlat=True)
+    return gw_skymap[ind].astype(np.float64) * (len(gw_skymap) / se_norm)
@@ -1 +1,217 @@
 # temporal overlap integrals
+import numpy as np
+
+from ..instrument import annotate, stage
+
+
+class UniformWindow:
+    """Flat coincidence window [start, end] relative to the GW time.
+
+    The temporal likelihood of an associated transient is uniform inside
+    the window. Bounds may be asymmetric, e.g. UniformWindow(-1, 5) for
+    a GRB expected up to 1 s before and 5 s after the merger. Times are
+    in whatever unit the transient times use (e.g. GPS seconds or days).
+
+    The posterior odds weigh the likelihood against unassociated
+    transients spread uniformly over `duration`, by default the window
+    length; it must be finite.
+
+    """
+
+    def __init__(self, start, end, duration=None):
+        if not end > start:
+            raise ValueError("Window end must be after its start")
+        self.start = float(start)
+        self.end = float(end)
+        self.duration = float(end - start if duration is None else duration)
+        if not (np.isfinite(self.duration) and self.duration > 0):
+            raise ValueError("Open-ended windows need a finite background "
+                             "duration")
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.start}, {self.end})"
+
+    def pdf(self, dt):
+        """Temporal likelihood of time offsets dt = t_transient - t_gw."""
+        dt = np.asarray(dt, dtype=float)
+        inside = (dt >= self.start) & (dt <= self.end)
+        return np.where(inside, 1 / (self.end - self.start), 0.)
+
+
+class ExponentialWindow(UniformWindow):
+    """Exponentially decaying window [start, end] relative to the GW time.
+
+    The likelihood decays with e-folding time `tau` from the window start
+    and is normalized over the window, suited to transients such as
+    kilonovae whose detection becomes less likely with delay. The end
+    may be np.inf, given a finite background `duration`.
+
+    """
+
+    def __init__(self, start, end, tau, duration=None):
+        super().__init__(start, end, duration)
+        if not tau > 0:
+            raise ValueError("tau must be positive")
+        self.tau = float(tau)
+
+    def __repr__(self):
+        return (f"{type(self).__name__}({self.start}, {self.end}, "
+                f"tau={self.tau})")
+
+    def pdf(self, dt):
+        dt = np.asarray(dt, dtype=float)
+        inside = (dt >= self.start) & (dt <= self.end)
+        norm = self.tau * -np.expm1(-(self.end - self.start) / self.tau)
+        with np.errstate(over='ignore'):
+            p = np.exp(-(dt - self.start) / self.tau) / norm
+        return np.where(inside, p, 0.)
+
+
+class TimeIndex:
+    """Sorted index of transient times for windowed coincidence queries.
+
+    Transients are sorted once by (class, time), so the candidates of a
+    class inside a time window are one contiguous slice found with two
+    binary searches. Queries for many GW events are vectorized, so
+    pre-filtering costs O(log n) per event instead of a scan.
+
+    Parameters
+    ----------
+    times: array
+        Transient times
+    classes: array
+        Optional transient class labels (e.g. 'GRB', 'KN'), one per
+        transient, used to apply per-class windows
+
+    """
+
+    def __init__(self, times, classes=None):
+        times = np.asarray(times, dtype=float)
+        if classes is None:
+            codes = np.zeros(times.shape, dtype=np.intp)
+            self.classes = np.array([None], dtype=object)
+        else:
+            self.classes, codes = np.unique(np.asarray(classes),
+                                            return_inverse=True)
+        self.sort = np.lexsort((times, codes))
+        self.times = times[self.sort]
+        # Slice of the sorted arrays holding each class
+        self.class_bounds = np.searchsorted(codes[self.sort],
+                                            np.arange(len(self.classes) + 1))
+
+    def __len__(self):
+        return len(self.times)
+
+    def _block(self, cls):
+        if cls is None and len(self.classes) == 1:
+            k = 0
+        else:
+            k = np.flatnonzero(self.classes == cls)
+            if not k.size:
+                return 0, 0
+            k = k[0]
+        return self.class_bounds[k], self.class_bounds[k + 1]
+
+    def count(self, t_start, t_end, cls=None):
+        """Number of transients of class `cls` with t_start <= t <= t_end."""
+        lo, hi = self._block(cls)
+        block = self.times[lo:hi]
+        return (np.searchsorted(block, t_end, side='right') -
+                np.searchsorted(block, t_start, side='left'))
+
+    def query(self, t_start, t_end, cls=None):
+        """Find all transients of class `cls` inside time ranges.
+
+        Parameters
+        ----------
+        t_start, t_end: float or array
+            Range bounds, one pair per query (e.g. per GW event)
+        cls: object
+            Transient class to search, or None if the index has no classes
+
+        Returns
+        -------
+        query_rows: array
+            Query number of each match
+        rows: array
+            Transient row (in input order) of each match
+
+        """
+        query_rows, pos = self._query(t_start, t_end, cls)
+        return query_rows, self.sort[pos]
+
+    def _query(self, t_start, t_end, cls):
+        # Like query, but returns positions in the sorted arrays
+        t_start, t_end = np.broadcast_arrays(np.atleast_1d(t_start),
+                                             np.atleast_1d(t_end))
+        lo, hi = self._block(cls)
+        block = self.times[lo:hi]
+        first = np.searchsorted(block, t_start, side='left')
+        last = np.searchsorted(block, t_end, side='right')
+        count = np.clip(last - first, 0, None)
+        query_rows = np.repeat(np.arange(len(count)), count)
+        offsets = np.cumsum(count) - count
+        i = first[query_rows] + np.arange(count.sum()) - offsets[query_rows]
+        return query_rows, lo + i
+
+
+@stage('overlap.temporal')
+def temporal_overlap(gw_times, transient_times=None, window=None,
+                     classes=None, windows=None, index=None):
+    """Temporal likelihoods of all GW event / transient pairs in coincidence.
+
+    Only pairs inside the window are returned, so the result stays small
+    for large transient catalogs.
+
+    Parameters
+    ----------
+    gw_times: float or array
+        GW event times
+    transient_times: array or TransientCatalog
+        Transient times, or a catalog providing times (and classes).
+        Not needed if `index` is given
+    window: UniformWindow
+        Window used for all transients, or for classes missing from
+        `windows`
+    classes: array
+        Transient class labels, one per transient
+    windows: dict
+        Window per transient class, for asymmetric or class-specific
+        windows
+    index: TimeIndex
+        Prebuilt index of the transient times (and classes). Build it
+        once per catalog to amortize it over many GW events
+
+    Returns
+    -------
+    gw_rows: array
+        GW event number of each coincident pair
+    rows: array
+        Transient row of each coincident pair
+    likelihood: array
+        Temporal likelihood of each pair
+
+    """
+    gw_times = np.atleast_1d(np.asarray(gw_times, dtype=float))
+    if hasattr(transient_times, 'time'):
+        if classes is None:
+            classes = transient_times.classes
+        transient_times = transient_times.time
+    if index is None:
+        index = TimeIndex(transient_times, classes)
+    annotate(gw_events=gw_times.size, transients=len(index))
+    windows = windows or {}
+
+    gw_rows, rows, likelihood = [], [], []
+    for cls in index.classes:
+        win = windows.get(cls, window)
+        if win is None:
+            raise ValueError(f"No window given for transient class {cls!r}")
+        g, pos = index._query(gw_times + win.start, gw_times + win.end, cls)
+        dt = index.times[pos] - gw_times[g]
+        gw_rows.append(g)
+        rows.append(index.sort[pos])
+        likelihood.append(win.pdf(dt))
+    return (np.concatenate(gw_rows), np.concatenate(rows),
+            np.concatenate(likelihood))
+
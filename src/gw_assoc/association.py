@@ -1,15 +1,43 @@
+from contextlib import nullcontext
+
 from .io import load_gw_skymap
 from .io.transient import Transient
-from .analysis import compute_posterior_odds
+from .analysis import compute_posterior_odds, compute_posterior_odds_batch
+from .instrument import Report, instrument, stage
 from .plotting.skymap import plot_skymap
 
 class Association:
-    def __init__(self, gw_file: str, transient_info: dict):
-        self.gw = load_gw_skymap(gw_file)
-        self.transient = Transient(**transient_info)
+    def __init__(self, gw_file: str, transient_info, *, report=None):
+        """transient_info is one transient as a dict, or a list of them.
+
+        Pass report=True (or a Report, e.g. one with hooks or shared
+        across alerts) to record per-stage timings, peak memory and input
+        sizes of this association into self.report.
+        """
+        if report is True:
+            report = Report()
+        self.report = report or None
+        with self._instrumented(), stage("association.load"):
+            self.gw = load_gw_skymap(gw_file)
+        if isinstance(transient_info, dict):
+            transient_info = [transient_info]
+        self.transients = [Transient(**info) for info in transient_info]
+        self.transient = self.transients[0]
+
+    def _instrumented(self):
+        if self.report is None:
+            return nullcontext()
+        return instrument(self.report)
 
     def compute_odds(self, **kwargs):
-        return compute_posterior_odds(self.gw, self.transient, **kwargs)
+        """Odds dict for one transient, or an odds array for several."""
+        with self._instrumented(), stage("association.compute_odds"):
+            if len(self.transients) > 1:
+                return compute_posterior_odds_batch(self.gw, self.transients,
+                                                    **kwargs)
+            return compute_posterior_odds(self.gw, self.transient, **kwargs)
 
-    def plot_skymap(self, out_file: str = "skymap.png"):
-        plot_skymap(self.gw, self.transient, out_file)
+    def plot_skymap(self, out_file: str = "skymap.png", **kwargs):
+        """Plot the sky map with all transients; see plotting.skymap."""
+        with self._instrumented(), stage("association.plot"):
+            return plot_skymap(self.gw, self.transients, out_file, **kwargs)
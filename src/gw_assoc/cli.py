@@ -0,0 +1,214 @@
+import argparse
+import json
+import sys
+import time
+
+from .analysis.temporal import ExponentialWindow, UniformWindow
+from .io.transient import DEFAULT_CHUNK_SIZE, iter_transients, json_value
+
+
+def _window(args):
+    if args.window is None:
+        return None
+    start, end = args.window
+    if args.tau is not None:
+        return ExponentialWindow(start, end, args.tau, args.duration)
+    return UniformWindow(start, end, args.duration)
+
+
+def _odds_kwargs(args):
+    return dict(prior_odds=args.prior_odds,
+                gw_time=getattr(args, "gw_time", None),
+                window=_window(args), use_distance=not args.no_distance,
+                max_credible_level=args.max_credible_level)
+
+
+def _load(args):
+    from .io import load_gw_skymap
+    columns = ("prob",) if args.no_distance else None
+    return load_gw_skymap(args.gw_file, columns=columns)
+
+
+def _records(chunk, terms):
+    """NDJSON lines for a scored chunk."""
+    ids = chunk.ids if chunk.ids is not None else [None] * len(chunk)
+    columns = [("id", ids), ("ra", chunk.ra), ("dec", chunk.dec),
+               ("z", chunk.z), ("time", chunk.time)]
+    columns += list(terms.items())
+    for i in range(len(chunk)):
+        yield json.dumps({k: json_value(v[i]) for k, v in columns})
+
+
+def odds(args):
+    from .association import Association
+
+    with open(args.transient_file) as f:
+        transient = json.load(f)
+    assoc = Association(args.gw_file, transient)
+    results = assoc.compute_odds(**_odds_kwargs(args))
+    print("Posterior odds:", results)
+    if args.plot:
+        assoc.plot_skymap(args.plot)
+
+
+def batch(args):
+    from .analysis.odds import iter_posterior_odds
+
+    gw = _load(args)
+    source = sys.stdin if args.input == "-" else args.input
+    fmt = args.format or ("jsonl" if args.input == "-" else None)
+    chunks = iter_transients(source, fmt, args.chunk_size)
+    out = sys.stdout if args.output == "-" else open(args.output, "w")
+
+    start = time.perf_counter()
+    n = 0
+    try:
+        for chunk, terms in iter_posterior_odds(
+                gw, chunks, workers=args.workers,
+                max_pending=args.max_pending, **_odds_kwargs(args)):
+            out.write("\n".join(_records(chunk, terms)) + "\n")
+            out.flush()
+            n += len(chunk)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.perf_counter() - start
+    rate = n / elapsed if elapsed > 0 else float("inf")
+    print(f"gw-assoc batch: scored {n} transients in {elapsed:.2f} s "
+          f"({rate:.0f} transients/s, {args.workers} workers)",
+          file=sys.stderr)
+
+
+def serve(args):
+    import asyncio
+    from .online import (AssociationEngine, ndjson_sink, stdin_source,
+                         watch_directory)
+
+    kwargs = _odds_kwargs(args)
+    del kwargs["gw_time"]  # each event has its own
+    engine = AssociationEngine(
+        ndjson_sink(sys.stdout), min_odds=args.min_odds,
+        columns=("prob",) if args.no_distance else None,
+        transient_ttl=args.transient_ttl, event_ttl=args.event_ttl, **kwargs)
+    sources = [watch_directory(d, poll_interval=args.poll_interval,
+                               once=args.once) for d in args.watch]
+    if args.stdin or not sources:
+        sources.append(stdin_source())
+    try:
+        asyncio.run(engine.run(*sources))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.close()
+
+
+def _add_odds_options(parser, gw_file=True):
+    if gw_file:
+        parser.add_argument("--gw-file", required=True,
+                            help="GW sky map FITS file (flat or MOC)")
+        parser.add_argument("--gw-time", type=float,
+                            help="GW event time, in the units of the "
+                                 "transient times")
+    parser.add_argument("--window", type=float, nargs=2,
+                        metavar=("START", "END"),
+                        help="temporal window relative to --gw-time")
+    parser.add_argument("--tau", type=float,
+                        help="use an exponentially decaying window with this "
+                             "e-folding time")
+    parser.add_argument("--duration", type=float,
+                        help="background duration the window is weighed "
+                             "against (default: the window length; needed "
+                             "for an open-ended window, e.g. END inf)")
+    parser.add_argument("--prior-odds", type=float, default=1.0)
+    parser.add_argument("--no-distance", action="store_true",
+                        help="2D scoring only; skips loading distance layers")
+    parser.add_argument("--max-credible-level", type=float, metavar="LEVEL",
+                        help="give zero odds, without scoring, to transients "
+                             "outside this GW credible region (e.g. 0.99)")
+    parser.add_argument("--precision", choices=["float64", "float32"],
+                        help="sky map layer precision (float32 halves "
+                             "memory; sums stay float64)")
+    parser.add_argument("--profile", action="store_true",
+                        help="print per-stage timings and peak memory to "
+                             "stderr")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="gw-assoc",
+        description="Evaluate GW / transient associations")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("odds", help="posterior odds for one transient")
+    _add_odds_options(p)
+    p.add_argument("--transient-file", required=True,
+                   help="JSON file with ra, dec, z and time")
+    p.add_argument("--plot", metavar="PNG", help="also plot the sky map")
+    p.set_defaults(func=odds)
+
+    p = sub.add_parser(
+        "batch", help="stream transients and write NDJSON odds",
+        description="Score a stream of transients (CSV, JSON lines or "
+                    "Parquet; JSON lines on stdin) against a GW sky map and "
+                    "write one NDJSON result per transient as chunks finish.")
+    _add_odds_options(p)
+    p.add_argument("--input", default="-",
+                   help="transient file, or - for stdin (default)")
+    p.add_argument("--format", choices=["csv", "jsonl", "parquet"],
+                   help="input format; guessed from the file name")
+    p.add_argument("--output", default="-",
+                   help="NDJSON output file, or - for stdout (default)")
+    p.add_argument("--workers", type=int, default=1,
+                   help="worker processes (default 1: in-process)")
+    p.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE // 10,
+                   help="transients per chunk")
+    p.add_argument("--max-pending", type=int,
+                   help="chunks in flight before reading blocks "
+                        "(default 2 per worker)")
+    p.set_defaults(func=batch)
+
+    p = sub.add_parser(
+        "serve", help="online association of an alert stream",
+        description="Keep GW events and transients in memory and write "
+                    "NDJSON scores as sky maps (new or updated) and "
+                    "transients arrive, from watched directories and/or "
+                    "JSON-line messages on stdin. Windows are relative to "
+                    "each event's time (the sky map's MJD-OBS unless the "
+                    "message gives gw_time).")
+    _add_odds_options(p, gw_file=False)
+    p.add_argument("--watch", action="append", default=[], metavar="DIR",
+                   help="directory of sky map files and JSON-line message "
+                        "files (repeatable)")
+    p.add_argument("--stdin", action="store_true",
+                   help="also read messages from stdin (the default "
+                        "without --watch)")
+    p.add_argument("--poll-interval", type=float, default=1.0,
+                   help="seconds between directory scans")
+    p.add_argument("--once", action="store_true",
+                   help="stop once watched directories have been read")
+    p.add_argument("--min-odds", type=float,
+                   help="only write scores with posterior odds above this")
+    p.add_argument("--transient-ttl", type=float, metavar="SECONDS",
+                   help="forget transients this long after they arrive")
+    p.add_argument("--event-ttl", type=float, metavar="SECONDS",
+                   help="drop events this long after their last sky map")
+    p.set_defaults(func=serve)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.precision:
+        from .precision import set_precision
+        set_precision(args.precision)
+    if not args.profile:
+        args.func(args)
+        return
+    from .instrument import instrument
+    with instrument() as report:
+        args.func(args)
+    print(report, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+# src/gw_assoc/instrument.py
+"""
+Opt-in per-stage instrumentation of the association pipeline.
+
+Pipeline stages (FITS decode, MOC rasterization, resolution matching,
+overlap integrals, odds) are wrapped in `stage`. While no `instrument`
+session is active a stage costs one global lookup; inside a session each
+completed stage records its wall time, peak allocated bytes (tracemalloc)
+and input sizes into the session's Report, and is passed to any hooks:
+
+    with instrument(hooks=[my_sink]) as report:
+        assoc = Association(gw_file, transients)
+        assoc.compute_odds()
+    print(report)
+
+Stages run inside process-pool workers are not recorded. The parent
+records the enclosing stage, and code that farms work out to a pool
+reports the workers' own timings with `record_stage` (e.g. 'odds.pool' and
+'odds.worker' for pooled scoring).
+"""
+from __future__ import annotations
+
+import functools
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple
+
+import numpy as np
+
+
+class StageEvent(NamedTuple):
+    """One completed stage, as passed to hooks."""
+    name: str
+    wall_time: float          # seconds
+    peak_bytes: int | None    # peak allocation above the stage start
+    sizes: Dict[str, int]     # e.g. nside, moc_cells, transients
+
+
+class StageStats:
+    """Aggregated statistics of one stage over all its calls."""
+    __slots__ = ("calls", "wall_time", "peak_bytes", "sizes")
+
+    def __init__(self):
+        self.calls = 0
+        self.wall_time = 0.0
+        self.peak_bytes = None
+        self.sizes = {}
+
+    def add(self, event: StageEvent) -> None:
+        self.calls += 1
+        self.wall_time += event.wall_time
+        if event.peak_bytes is not None:
+            self.peak_bytes = max(self.peak_bytes or 0, event.peak_bytes)
+        for k, v in event.sizes.items():
+            self.sizes[k] = max(self.sizes.get(k, v), v)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
+class Report:
+    """
+    Per-stage wall time, call counts, peak bytes and (maximum) input sizes.
+
+    Stages are keyed by name in first-seen order. Times of nested stages
+    are included in their parents' times.
+    """
+
+    def __init__(self, hooks: Iterable[Callable[[StageEvent], Any]] = ()):
+        self.stages: Dict[str, StageStats] = {}
+        self.hooks: List[Callable[[StageEvent], Any]] = list(hooks)
+        self._lock = threading.Lock()
+
+    def record(self, event: StageEvent) -> None:
+        with self._lock:
+            stats = self.stages.get(event.name)
+            if stats is None:
+                stats = self.stages[event.name] = StageStats()
+            stats.add(event)
+        for hook in self.hooks:
+            hook(event)
+
+    def __getitem__(self, name: str) -> StageStats:
+        return self.stages[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.stages
+
+    def clear(self) -> None:
+        with self._lock:
+            self.stages.clear()
+
+    def as_dict(self) -> Dict[str, Dict[str, Any]]:
+        """Plain-dict form, e.g. for JSON."""
+        return {name: s.as_dict() for name, s in self.stages.items()}
+
+    def __str__(self) -> str:
+        lines = [f"{'stage':28s} {'calls':>6s} {'time [ms]':>11s} "
+                 f"{'peak [MiB]':>11s}  sizes"]
+        for name, s in self.stages.items():
+            peak = ("-" if s.peak_bytes is None
+                    else f"{s.peak_bytes / 2**20:.1f}")
+            sizes = " ".join(f"{k}={v}" for k, v in s.sizes.items())
+            lines.append(f"{name:28s} {s.calls:6d} {s.wall_time * 1e3:11.2f} "
+                         f"{peak:>11s}  {sizes}")
+        return "\n".join(lines)
+
+
+# Reports of the active sessions; empty means instrumentation is off
+_reports: tuple = ()
+_state_lock = threading.Lock()
+_tracing = 0  # sessions that asked for memory tracing
+_local = threading.local()
+
+
+def enabled() -> bool:
+    return bool(_reports)
+
+
+@contextmanager
+def instrument(report: Report | None = None, *,
+               hooks: Iterable[Callable[[StageEvent], Any]] = (),
+               memory: bool = True) -> Iterator[Report]:
+    """
+    Record pipeline stages into a Report while the block runs.
+
+    Args:
+      report: Report to add to (e.g. to accumulate over alerts); a new one
+        is created if None.
+      hooks: callables receiving each StageEvent, e.g. to forward stages to
+        a metrics sink. Added to the report's hooks.
+      memory: trace peak allocations with tracemalloc. This slows down
+        allocation-heavy code; pass False for timings only.
+
+    Sessions may be nested or used from several threads; every active
+    session sees every stage.
+    """
+    global _reports, _tracing
+    report = Report() if report is None else report
+    report.hooks.extend(hooks)
+    with _state_lock:
+        started = memory and not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        _tracing += bool(memory)
+        _reports = _reports + (report,)
+    try:
+        yield report
+    finally:
+        with _state_lock:
+            _reports = tuple(r for r in _reports if r is not report)
+            _tracing -= bool(memory)
+            if started and _tracing == 0:
+                tracemalloc.stop()
+
+
+def record_stage(name: str, wall_time: float, peak_bytes: int | None = None,
+                 **sizes: int) -> None:
+    """
+    Record a stage timed elsewhere, e.g. by a process-pool worker.
+
+    A no-op unless instrumenting. The event goes to every active session
+    like a completed `stage`, but is not nested in the running stages.
+    """
+    if _reports:
+        _emit(StageEvent(name, wall_time, peak_bytes, sizes))
+
+
+def _emit(event: StageEvent) -> None:
+    for report in _reports:
+        report.record(event)
+
+
+def annotate(skymap=None, **sizes: int) -> None:
+    """
+    Attach input sizes to the innermost running stage of this thread.
+
+    If a sky map is given, its nside and/or number of MOC cells are added
+    (see skymap_sizes); they are only worked out while instrumenting.
+    """
+    if not _reports:
+        return
+    stack = getattr(_local, "stack", None)
+    if stack:
+        if skymap is not None:
+            sizes.update(skymap_sizes(skymap))
+        stack[-1].sizes.update(sizes)
+
+
+def skymap_sizes(skymap) -> Dict[str, int]:
+    """nside and/or moc_cells of any sky map representation."""
+    if isinstance(skymap, dict):
+        sizes = {"nside": int(skymap["nside"])}
+        if skymap.get("moc") is not None:
+            sizes["moc_cells"] = len(skymap["moc"])
+        return sizes
+    if hasattr(skymap, "colnames"):
+        return {"moc_cells": len(skymap)}
+    return {"nside": int(np.sqrt(len(skymap) // 12))}
+
+
+class _Frame:
+    __slots__ = ("name", "start", "base", "peak", "sizes")
+
+
+class stage:
+    """
+    Context manager and decorator marking one pipeline stage.
+
+    A stage nested directly in a stage of the same name (e.g. one overlap
+    function delegating to another) is folded into the outer one.
+    """
+    __slots__ = ("name", "_frame")
+
+    def __init__(self, name: str):
+        self.name = name
+        self._frame = None
+
+    def __call__(self, func):
+        name = self.name
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _reports:
+                return func(*args, **kwargs)
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def __enter__(self):
+        if not _reports:
+            return self
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        if stack and stack[-1].name == self.name:
+            return self
+        frame = _Frame()
+        frame.name = self.name
+        frame.sizes = {}
+        frame.base = frame.peak = None
+        if tracemalloc.is_tracing():
+            # The peak counter is global: hand the peak so far to the
+            # parent before resetting it for this stage
+            current, peak = tracemalloc.get_traced_memory()
+            if stack and stack[-1].peak is not None:
+                stack[-1].peak = max(stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+            frame.base = frame.peak = current
+        stack.append(frame)
+        self._frame = frame
+        frame.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        frame = self._frame
+        if frame is None:
+            return False
+        wall_time = time.perf_counter() - frame.start
+        self._frame = None
+        stack = _local.stack
+        stack.pop()
+        peak_bytes = None
+        if frame.peak is not None and tracemalloc.is_tracing():
+            frame.peak = max(frame.peak, tracemalloc.get_traced_memory()[1])
+            peak_bytes = frame.peak - frame.base
+            if stack and stack[-1].peak is not None:
+                stack[-1].peak = max(stack[-1].peak, frame.peak)
+        _emit(StageEvent(frame.name, wall_time, peak_bytes, frame.sizes))
+        return False
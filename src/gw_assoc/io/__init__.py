@@ -1,5 +1,24 @@
-from .skymap import load_gw_skymap
-from .transient import Transient
+from .._lazy import lazy_exports
 
-__all__ = ["load_gw_skymap", "Transient"]
+# Imported on first access: the sky map readers need astropy, healpy and
+# ligo.skymap, which the transient readers (and the CLI) do not
+_LAZY = {
+    "load_gw_skymap": ".skymap",
+    "read_skymap": ".skymap",
+    "iter_skymaps": ".prefetch",
+    "aiter_skymaps": ".prefetch",
+    "aload_gw_skymap": ".prefetch",
+    "skymap_at_nside": ".skymap",
+    "read_skymap_cache": ".skymap",
+    "write_skymap_cache": ".skymap",
+    "set_skymap_disk_cache": ".skymap",
+    "Transient": ".transient",
+    "TransientCatalog": ".transient",
+    "read_transients": ".transient",
+    "GalaxyCatalog": ".galaxy",
+    "read_galaxy_catalog": ".galaxy",
+}
 
+
+__getattr__, __dir__ = lazy_exports(globals(), _LAZY)
+__all__ = list(_LAZY)
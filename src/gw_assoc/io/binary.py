@@ -0,0 +1,92 @@
+# src/gw_assoc/io/binary.py
+"""
+Binary files of named NumPy arrays that are memory-mapped in place.
+
+A file is 8 magic bytes, the little-endian uint64 length of a JSON header,
+the header, and the uncompressed native-endian arrays, each aligned to
+ALIGN bytes. The header records the dtype, shape and offset of every
+array (relative to the first aligned position after the header) under
+'arrays', next to whatever the writer adds. Used by the sky map cache and
+the galaxy catalog.
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+from typing import Any, Dict, Iterable, Tuple
+
+import numpy as np
+
+ALIGN = 64
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // ALIGN) * ALIGN
+
+
+def native_array(arr, dtype=None) -> np.ndarray:
+    """A C-contiguous, native-endian copy of arr (or arr itself if it is)."""
+    arr = np.asarray(arr)
+    dtype = arr.dtype.newbyteorder('=') if dtype is None else np.dtype(dtype)
+    return np.ascontiguousarray(arr, dtype=dtype)
+
+
+def write_arrays(filename: str, magic: bytes, header: Dict[str, Any],
+                 arrays: Iterable[Tuple[str, np.ndarray]]) -> None:
+    """
+    Write arrays and a JSON header to filename.
+
+    The file is written to a temporary file first and renamed, so readers
+    never see a partial file. header is updated in place with the array
+    layout.
+
+    Args:
+      magic: 8 bytes identifying the kind of file.
+      header: JSON-serializable metadata.
+      arrays: (name, array) pairs; arrays must be native-endian and
+        C-contiguous (see native_array).
+    """
+    arrays = list(arrays)
+    header['arrays'] = {}
+    offset = 0
+    for name, arr in arrays:
+        offset = _aligned(offset)
+        header['arrays'][name] = dict(dtype=arr.dtype.str,
+                                      shape=list(arr.shape), offset=offset)
+        offset += arr.nbytes
+    text = json.dumps(header).encode()
+    start = _aligned(len(magic) + 8 + len(text))
+
+    tmp = f'{filename}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(magic)
+            f.write(np.uint64(len(text)).astype('<u8').tobytes())
+            f.write(text)
+            for name, arr in arrays:
+                f.seek(start + header['arrays'][name]['offset'])
+                f.write(arr.data)
+            f.truncate(start + offset)
+        os.replace(tmp, filename)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def read_header(f, magic: bytes, kind: str) -> Tuple[Dict[str, Any], int]:
+    """The JSON header of an open file and the offset of its data section."""
+    if f.read(len(magic)) != magic:
+        raise ValueError(f'{f.name} is not a gw_assoc {kind} file')
+    length = int(np.frombuffer(f.read(8), dtype='<u8')[0])
+    header = json.loads(f.read(length))
+    return header, _aligned(len(magic) + 8 + length)
+
+
+def map_arrays(filename: str, header: Dict[str, Any],
+               start: int) -> Dict[str, np.memmap]:
+    """Every array of a file as a read-only np.memmap, without copying."""
+    return {name: np.memmap(filename, dtype=np.dtype(a['dtype']), mode='r',
+                            offset=start + a['offset'],
+                            shape=tuple(a['shape']))
+            for name, a in header['arrays'].items()}
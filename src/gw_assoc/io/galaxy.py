@@ -0,0 +1,269 @@
+# src/gw_assoc/io/galaxy.py
+from __future__ import annotations
+
+from typing import Any, Dict, Tuple
+
+import numpy as np
+
+from .._lazy import lazy_import
+from ..instrument import annotate, stage
+from .binary import map_arrays, native_array, read_header, write_arrays
+
+hp = lazy_import("healpy")
+
+#: HEALPix order galaxies are indexed at by default (NSIDE 256, 0.05 deg^2)
+DEFAULT_ORDER = 8
+
+#: Float columns of a catalog; missing values are NaN
+FLOAT_COLUMNS = ("ra", "dec", "z", "dist", "weight")
+
+#: Accepted input column names for each catalog column (GLADE+ included)
+COLUMN_ALIASES = {
+    "ra": ("ra", "RA", "ra_deg"),
+    "dec": ("dec", "DEC", "Dec", "dec_deg"),
+    "z": ("z", "redshift", "z_cmb", "z_helio"),
+    "dist": ("dist", "distance", "d_L", "dL", "luminosity_distance"),
+    "weight": ("weight", "w"),
+    "ids": ("id", "ids", "name", "GLADE_no"),
+}
+
+#: Search discs up to this fraction of the pixel size (nside2resol) lie
+#: inside the 3 x 3 block of pixels around their centre; the tightest
+#: HEALPix blocks (at the polar-cap corners) still fit 0.7 with margin
+BLOCK_RADIUS = 0.25
+
+#: Magic bytes and version of the binary galaxy catalog format
+CATALOG_MAGIC = b"GWAGALXY"
+CATALOG_VERSION = 1
+
+
+class GalaxyCatalog:
+    """
+    Galaxy catalog indexed by NESTED HEALPix pixel at a fixed order.
+
+    Rows are sorted by the pixel containing each galaxy, and the rows of
+    pixel p are offsets[p]:offsets[p + 1], so the galaxies in any set of
+    pixels (a credible region, the pixels around a transient) are a few
+    slices whose cost is proportional to the number of galaxies returned,
+    not to the size of the catalog.
+
+    Columns: ra, dec (degrees), z, dist (luminosity distance in Mpc),
+    weight (e.g. a luminosity, for host weighting), and optionally ids.
+    Missing float values are NaN. Queries return row indices into the
+    sorted columns. Saved catalogs are loaded as read-only memory maps,
+    so a GLADE+-sized catalog is shared between processes and only the
+    pages that are queried are read.
+    """
+
+    def __init__(self, ra, dec, z=None, dist=None, weight=None, ids=None,
+                 order: int = DEFAULT_ORDER):
+        ra = np.atleast_1d(np.asarray(ra, dtype=float))
+        n = len(ra)
+        columns = {"ra": ra}
+        for name, col in (("dec", dec), ("z", z), ("dist", dist),
+                          ("weight", weight)):
+            if col is None:
+                if name == "dec":
+                    raise ValueError("dec is required")
+                col = np.full(n, np.nan)
+            col = np.atleast_1d(np.asarray(col, dtype=float))
+            if len(col) != n:
+                raise ValueError(f"Column {name} has length {len(col)}, "
+                                 f"expected {n}")
+            columns[name] = col
+        if ids is not None:
+            ids = np.asarray(ids)
+            if ids.dtype == object:
+                ids = ids.astype(str)
+            columns["ids"] = ids
+
+        with stage("galaxies.index"):
+            annotate(galaxies=n)
+            ipix = hp.ang2pix(2 ** order, ra, columns["dec"], nest=True,
+                              lonlat=True)
+            sort = np.argsort(ipix, kind="stable")
+            offsets = np.zeros(12 * 4 ** order + 1, dtype=np.int64)
+            np.cumsum(np.bincount(ipix, minlength=len(offsets) - 1),
+                      out=offsets[1:])
+        self._set({k: v[sort] for k, v in columns.items()}, order, offsets)
+
+    def _set(self, columns: Dict[str, np.ndarray], order: int,
+             offsets: np.ndarray) -> None:
+        for name in FLOAT_COLUMNS:
+            setattr(self, name, columns[name])
+        self.ids = columns.get("ids")
+        self.order = order
+        self.offsets = offsets
+
+    @classmethod
+    def from_columns(cls, columns: Dict[str, Any],
+                     order: int = DEFAULT_ORDER) -> "GalaxyCatalog":
+        """Build a catalog from a mapping of (possibly aliased) columns."""
+        kwargs = {}
+        for name, aliases in COLUMN_ALIASES.items():
+            for alias in aliases:
+                if alias in columns and columns[alias] is not None:
+                    kwargs[name] = columns[alias]
+                    break
+        if name_missing := {"ra", "dec"} - kwargs.keys():
+            raise ValueError(f"Missing required columns: {sorted(name_missing)}")
+        return cls(order=order, **kwargs)
+
+    @property
+    def nside(self) -> int:
+        return 2 ** self.order
+
+    def __len__(self):
+        return len(self.ra)
+
+    def __repr__(self):
+        return f"<GalaxyCatalog n={len(self)} order={self.order}>"
+
+    @property
+    def nbytes(self) -> int:
+        return sum(arr.nbytes for arr in self.columns().values()) + \
+            self.offsets.nbytes
+
+    def columns(self, rows=None) -> Dict[str, np.ndarray]:
+        """The columns as a dict of arrays, all rows (no copies) or `rows`."""
+        cols = {name: getattr(self, name) for name in FLOAT_COLUMNS}
+        if self.ids is not None:
+            cols["ids"] = self.ids
+        if rows is None:
+            return cols
+        return {name: col[rows] for name, col in cols.items()}
+
+    def rows_in_ranges(self, start, end) -> np.ndarray:
+        """
+        Rows of the galaxies in half-open NESTED pixel ranges [start, end)
+        at the catalog order, in pixel order if the ranges are sorted.
+        """
+        start, end = np.asarray(start), np.asarray(end)
+        return _concatenate_ranges(self.offsets[start], self.offsets[end])
+
+    def rows_in_pixels(self, ipix, order: int | None = None) -> np.ndarray:
+        """
+        Rows of the galaxies in NESTED pixels at any order.
+
+        Pixels at or above the catalog resolution cover whole catalog
+        pixels, so the result is exact. Finer pixels are widened to the
+        catalog pixel containing them, so the result is a superset; filter
+        the positions if exactness matters.
+        """
+        ipix = np.asarray(ipix, dtype=np.int64)
+        order = self.order if order is None else order
+        if order > self.order:
+            ipix = np.unique(ipix >> (2 * (order - self.order)))
+            order = self.order
+        shift = 2 * (self.order - order)
+        return self.rows_in_ranges(ipix << shift, (ipix + 1) << shift)
+
+    def cone(self, ra: float, dec: float, radius: float) -> np.ndarray:
+        """Rows of the galaxies within radius degrees of (ra, dec)."""
+        return self.crossmatch(ra, dec, radius)[1]
+
+    @stage("galaxies.crossmatch")
+    def crossmatch(self, ra, dec, radius) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        All galaxies within radius degrees of each of many positions.
+
+        Each search disc is covered by the 3 x 3 block of pixels around its
+        centre, at the finest order (at most the catalog's) where the disc
+        fits in such a block (see BLOCK_RADIUS). The blocks of all positions
+        become NESTED ranges at the catalog order, whose galaxies are sliced
+        out at once and cut exactly by angular separation, so there is one
+        pass per distinct block order rather than per position. Discs wider
+        than a block of base pixels fall back to healpy.query_disc. radius
+        may be one value or one per position.
+
+        Returns (position index, galaxy row) pairs as two arrays, sorted by
+        position and then row.
+        """
+        ra, dec, radius = np.broadcast_arrays(
+            np.atleast_1d(np.asarray(ra, dtype=float)),
+            np.atleast_1d(np.asarray(dec, dtype=float)),
+            np.atleast_1d(np.asarray(radius, dtype=float)))
+        annotate(points=len(ra), galaxies=len(self))
+        vec = hp.ang2vec(ra, dec, lonlat=True)
+        valid = np.flatnonzero(np.isfinite(ra) & np.isfinite(dec) &
+                               (radius > 0))
+        order = np.minimum(np.floor(np.log2(
+            BLOCK_RADIUS * hp.nside2resol(1) / np.radians(radius[valid]))),
+            self.order)
+
+        index, pixels, orders = [], [], []
+        for k in np.unique(order[order >= 0]).astype(int):
+            i = valid[order == k]
+            ipix = hp.ang2pix(2 ** k, ra[i], dec[i], nest=True, lonlat=True)
+            block = np.vstack([ipix, hp.get_all_neighbours(
+                2 ** k, ipix, nest=True)])
+            # Some pixels have only 7 neighbours (-1); very coarse blocks
+            # may list one twice
+            block.sort(axis=0)
+            keep = (block >= 0) & np.vstack(
+                [np.ones((1, len(i)), bool), block[1:] != block[:-1]])
+            index.append(np.broadcast_to(i, block.shape)[keep])
+            pixels.append(block[keep])
+            orders.append(np.full(keep.sum(), k))
+        for i in valid[order < 0]:
+            ipix = hp.query_disc(self.nside, vec[i], np.radians(radius[i]),
+                                 inclusive=True, nest=True)
+            index.append(np.full(len(ipix), i))
+            pixels.append(ipix)
+            orders.append(np.full(len(ipix), self.order))
+        if not index:
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.int64)
+        index, pixels = np.concatenate(index), np.concatenate(pixels)
+        shift = 2 * (self.order - np.concatenate(orders))
+        start = self.offsets[pixels << shift]
+        end = self.offsets[(pixels + 1) << shift]
+        rows = _concatenate_ranges(start, end)
+        index = np.repeat(index, end - start)
+
+        # Exact cut: cos(separation) >= cos(radius)
+        gvec = hp.ang2vec(self.ra[rows], self.dec[rows], lonlat=True)
+        keep = (np.einsum("ij,ij->i", gvec, vec[index]) >=
+                np.cos(np.radians(radius[index])))
+        index, rows = index[keep], rows[keep]
+        sort = np.lexsort((rows, index))
+        return index[sort], rows[sort]
+
+    def save(self, filename: str) -> None:
+        """Write the catalog in a binary format that load memory-maps."""
+        arrays = [(name, native_array(col))
+                  for name, col in self.columns().items()]
+        arrays.append(("offsets", native_array(self.offsets)))
+        header = dict(version=CATALOG_VERSION, order=self.order,
+                      size=len(self))
+        write_arrays(filename, CATALOG_MAGIC, header, arrays)
+
+    @classmethod
+    @stage("galaxies.load")
+    def load(cls, filename: str) -> "GalaxyCatalog":
+        """Load a saved catalog; every column is a read-only np.memmap."""
+        with open(filename, "rb") as f:
+            header, start = read_header(f, CATALOG_MAGIC, "galaxy catalog")
+        if header.get("version") != CATALOG_VERSION:
+            raise ValueError(f"Unsupported galaxy catalog version in "
+                             f"{filename}")
+        arrays = map_arrays(filename, header, start)
+        catalog = cls.__new__(cls)
+        catalog._set(arrays, header["order"], arrays.pop("offsets"))
+        annotate(galaxies=len(catalog))
+        return catalog
+
+
+def _concatenate_ranges(start: np.ndarray, end: np.ndarray) -> np.ndarray:
+    """The integers of half-open ranges [start, end), one after another."""
+    lengths = np.clip(end - start, 0, None)
+    total = int(lengths.sum())
+    if not total:
+        return np.zeros(0, dtype=np.int64)
+    # Start of each range, minus the position it lands at in the output
+    shift = start - (np.cumsum(lengths) - lengths)
+    return np.arange(total, dtype=np.int64) + np.repeat(shift, lengths)
+
+
+def read_galaxy_catalog(filename: str) -> GalaxyCatalog:
+    """Memory-map a galaxy catalog written by GalaxyCatalog.save."""
+    return GalaxyCatalog.load(filename)
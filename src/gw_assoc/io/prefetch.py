@@ -0,0 +1,128 @@
+# src/gw_assoc/io/prefetch.py
+"""
+Concurrent sky map loading.
+
+Decoding sky maps is mostly waiting on disk and gzip, which release the
+GIL, so several maps decode in parallel on a thread pool. Every load goes
+through load_gw_skymap, so maps already in the loader cache are returned
+at once and a path requested again while it is still being decoded (from
+here, another thread or the online engine) is decoded only once.
+
+    for path, skymap in iter_skymaps(paths, concurrency=8):
+        ...                                   # in completion order
+
+    async for path, skymap in aiter_skymaps(paths, concurrency=8):
+        ...
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, Tuple
+
+from .skymap import load_gw_skymap
+
+#: Default number of sky maps decoded at once
+DEFAULT_CONCURRENCY = min(8, (os.cpu_count() or 1) + 4)
+
+
+def iter_skymaps(paths: Iterable[str], *,
+                 concurrency: int = DEFAULT_CONCURRENCY,
+                 ordered: bool = False, return_exceptions: bool = False,
+                 **kwargs) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Load sky maps on a thread pool, yielding (path, skymap) as each is ready.
+
+    Args:
+      paths: sky map files; consumed lazily, so it may be a long generator.
+      concurrency: at most this many maps are being decoded at once.
+      ordered: yield in input order instead of completion order.
+      return_exceptions: yield (path, exception) for maps that fail to
+        load instead of raising.
+      **kwargs: forwarded to load_gw_skymap.
+    """
+    paths = iter(paths)
+    with ThreadPoolExecutor(concurrency,
+                            thread_name_prefix='gw-assoc-load') as pool:
+        pending = deque()
+
+        def submit():
+            for path in paths:
+                pending.append((path, pool.submit(load_gw_skymap, path,
+                                                  **kwargs)))
+                return True
+            return False
+
+        while len(pending) < concurrency and submit():
+            pass
+        while pending:
+            if ordered:
+                path, future = pending.popleft()
+            else:
+                wait([f for _, f in pending], return_when=FIRST_COMPLETED)
+                i = next(i for i, (_, f) in enumerate(pending) if f.done())
+                path, future = pending[i]
+                del pending[i]
+            submit()
+            yield path, _outcome(future.exception, future.result,
+                                 return_exceptions)
+
+
+def _outcome(exception, result, return_exceptions):
+    exc = exception()
+    if exc is not None and return_exceptions:
+        return exc
+    return result()
+
+
+async def aload_gw_skymap(path: str, *, executor=None,
+                          **kwargs) -> Dict[str, Any]:
+    """load_gw_skymap on a thread (default: the loop's executor)."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        executor, lambda: load_gw_skymap(path, **kwargs))
+
+
+async def aiter_skymaps(paths: Iterable[str], *,
+                        concurrency: int = DEFAULT_CONCURRENCY,
+                        return_exceptions: bool = False,
+                        **kwargs) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Async form of iter_skymaps: yields (path, skymap) in completion order.
+
+    Maps are decoded on a private pool of `concurrency` threads, so the
+    event loop stays free and other executor work is not crowded out. If
+    the iteration stops early, queued loads are cancelled and the pool is
+    shut down without waiting: loads already running finish in the
+    background (and still fill the loader cache).
+    """
+    paths = iter(paths)
+    pool = ThreadPoolExecutor(concurrency, thread_name_prefix='gw-assoc-load')
+    tasks = {}
+
+    def submit():
+        for path in paths:
+            task = asyncio.ensure_future(
+                aload_gw_skymap(path, executor=pool, **kwargs))
+            tasks[task] = path
+            return True
+        return False
+
+    try:
+        while len(tasks) < concurrency and submit():
+            pass
+        while tasks:
+            done, _ = await asyncio.wait(
+                tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                path = tasks.pop(task)
+                submit()
+                yield path, _outcome(task.exception, task.result,
+                                     return_exceptions)
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Waiting here would block the event loop on the running loads
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -1,194 +1,1055 @@
-# from __future__ import annotations
-
-# from typing import Any, Dict, Tuple, Union
-
-# import numpy as np
-# import healpy as hp
-# from astropy.io.fits import getheader
-# from astropy.table import Table
-
-# import ligo.skymap.io.fits as ligo_fits
-# import ligo.skymap.postprocess.util as ligo_pp
-
-
-# def is_skymap_moc(obj: Union[str, np.ndarray, Table]) -> bool:
-#     """
-#     Decide if a sky map is a MOC (multi-order coverage) map.
-
-#     - If a string path: check FITS header INDXSCHM == 'EXPLICIT' (MOC).
-#     - If a Table: treat as MOC.
-#     - If an ndarray (HEALPix array): not MOC.
-#     """
-#     if isinstance(obj, str):
-#         try:
-#             hdr = getheader(obj, ext=1)
-#             return hdr.get('INDXSCHM', '').upper() == 'EXPLICIT'
-#         except Exception:
-#             # If we cannot read header, assume not MOC
-#             return False
-#     elif isinstance(obj, Table):
-#         return True
-#     elif isinstance(obj, (np.ndarray, list)):
-#         return False
-#     else:
-#         raise TypeError(f'Unsupported type for is_skymap_moc: {type(obj)}')
-
-
-# def _normalize_healpix_map(arr: np.ndarray, header: dict | None) -> Dict[str, Any]:
-#     """
-#     Normalize HEALPix probability map returned by ligo.skymap.io.fits.read_sky_map(moc=False).
-#     Returns a dict with a consistent shape used throughout the package.
-#     """
-#     # ligo.skymap returns a 1D array of probabilities when moc=False
-#     prob = np.asarray(arr, dtype=float)
-#     nside = hp.npix2nside(prob.size)
-#     nested = True  # ligo.skymap uses NESTED by default
-
-#     # We *may* not have per-pixel distance params here. Keep None if absent.
-#     return dict(
-#         prob=prob,
-#         distmu=None,
-#         distsigma=None,
-#         distnorm=None,
-#         nside=nside,
-#         nested=nested,
-#         metadata=header or {}
-#     )
-
-
-# def _normalize_moc_table(tab: Table, target_nside: int | None = None) -> Dict[str, Any]:
-#     """
-#     Convert a MOC table into a full HEALPix map by rasterizing to target_nside.
-
-#     NOTE: For now we use the simple rasterization path via ligo.skymap utilities.
-#     If target_nside is None, pick the highest resolution present in the MOC.
-#     """
-#     # ligo.skymap.read_sky_map(moc=True) yields an Astropy Table like:
-#     #  ORDER, NPIX, PROBDENSITY (and possibly distance columns)
-#     # We'll rasterize by expanding each (ORDER, NPIX) cell to the corresponding pixels.
-#     order = np.asarray(tab['ORDER'], dtype=int)
-#     npix_moc = np.asarray(tab['NPIX'], dtype=int)
-
-#     # Probability density per steradian in MOC; convert to probability per pixel when rasterizing
-#     probdensity = np.asarray(tab['PROBDENSITY'], dtype=float)
-
-#     # Choose target nside
-#     max_order = int(order.max()) if order.size else 0
-#     if target_nside is None:
-#         target_nside = 2 ** max_order
-
-#     target_order = int(np.log2(target_nside))
-#     nest = True
-
-#     npix_target = hp.nside2npix(target_nside)
-#     prob = np.zeros(npix_target, dtype=float)
-
-#     # For each MOC cell, fill the corresponding child pixels at target_order
-#     for o, n, pd in zip(order, npix_moc, probdensity):
-#         # number of child pixels per parent at the target order
-#         nchild = 4 ** (target_order - o)
-#         # Parent pixel index in NESTED scheme:
-#         # ligo.skymap MOC NPIX encodes the index at that order in NEST
-#         first_child = n * nchild
-#         last_child = first_child + nchild
-#         # Solid angle per child pixel:
-#         dOmega = hp.nside2pixarea(2 ** target_order)  # steradians
-#         # Probability per child pixel = probdensity * dOmega
-#         prob[first_child:last_child] = pd * dOmega
-
-#     # Normalize to 1 just in case of rounding
-#     s = prob.sum()
-#     if s > 0:
-#         prob /= s
-
-#     # Distance columns if present (average them down to children — crude but functional)
-#     def _maybe_expand(colname: str) -> np.ndarray | None:
-#         if colname in tab.colnames:
-#             vals = np.asarray(tab[colname], dtype=float)
-#             out = np.zeros_like(prob)
-#             for o, n, v in zip(order, npix_moc, vals):
-#                 nchild = 4 ** (target_order - o)
-#                 first, last = n * nchild, n * nchild + nchild
-#                 out[first:last] = v
-#             return out
-#         return None
-
-#     distmu = _maybe_expand('DISTMU')
-#     distsigma = _maybe_expand('DISTSIGMA')
-#     distnorm = _maybe_expand('DISTNORM')
-
-#     return dict(
-#         prob=prob,
-#         distmu=distmu,
-#         distsigma=distsigma,
-#         distnorm=distnorm,
-#         nside=target_nside,
-#         nested=nest,
-#         metadata={}  # you can carry over tab.meta if needed
-#     )
-
-
-# def read_skymap(filename: str, *, moc: bool | None = None, target_nside: int | None = None) -> Dict[str, Any]:
-#     """
-#     Read a LVK sky map from FITS and return a *normalized* dict:
-#       {
-#         prob: 1D np.ndarray (length = 12 * nside^2),           # probability per pixel
-#         distmu: np.ndarray | None, distsigma: np.ndarray | None, distnorm: np.ndarray | None,
-#         nside: int,
-#         nested: bool,       # True (NESTED order)
-#         metadata: dict
-#       }
-
-#     Args:
-#       filename: path to FITS sky map
-#       moc: force MOC path (True/False). If None, auto-detect.
-#       target_nside: if provided and input is MOC, rasterize to this NSIDE.
-
-#     Behavior:
-#       - If HEALPix (not MOC): use ligo.skymap.read_sky_map(..., moc=False) and normalize.
-#       - If MOC: use ligo.skymap.read_sky_map(..., moc=True) and rasterize to HEALPix.
-#     """
-#     # Auto-detect MOC if moc is None
-#     if moc is None:
-#         moc = is_skymap_moc(filename)
-
-#     if moc:
-#         tab = ligo_fits.read_sky_map(filename, moc=True)  # Astropy Table
-#         return _normalize_moc_table(tab, target_nside=target_nside)
-#     else:
-#         arr, hdr = ligo_fits.read_sky_map(filename, moc=False)  # (array, header)
-#         return _normalize_healpix_map(arr, hdr)
-
-
-# def enforce_same_resolution(*skymaps: Dict[str, Any], nside_new: int | None = None) -> Tuple[Dict[str, Any], ...]:
-#     """
-#     Ensure all HEALPix maps share the same NSIDE (NESTED).
-
-#     - If nside_new is None, downgrade/upgrade all to the *minimum* NSIDE found.
-#     - Uses ligo.skymap.postprocess.util.smooth_ud_grade for probability and
-#       applies the same grading to distance columns if present.
-#     """
-#     maps = list(skymaps)
-#     if nside_new is None:
-#         nside_new = int(np.amin([m['nside'] for m in maps]))
-
-#     out: list[Dict[str, Any]] = []
-#     for m in maps:
-#         if m['nside'] == nside_new:
-#             out.append(m)
-#             continue
-#         # Probability
-#         prob_new = ligo_pp.smooth_ud_grade(m['prob'], nside_new, order_in='NEST', order_out='NEST')
-#         new = {**m, 'prob': prob_new, 'nside': nside_new}
-#         # Distance parameters (grade the same way if present)
-#         for key in ('distmu', 'distsigma', 'distnorm'):
-#             if m.get(key) is not None:
-#                 new[key] = ligo_pp.smooth_ud_grade(m[key], nside_new, order_in='NEST', order_out='NEST')
-#         out.append(new)
-#     return tuple(out)
-
-# Minimal stub loader for a GW skymap FITS file
-# Keep this simple so there are no circular imports.
-
-def load_gw_skymap(file_path: str):
-    return {"file": file_path, "kind": "gw_skymap"}
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import (TYPE_CHECKING, Any, Callable, Dict, Iterable, Tuple,
+                    Union)
+
+import numpy as np
+
+from .._lazy import lazy_import
+from ..instrument import annotate, stage
+from ..precision import as_layer, get_precision, layer_dtype
+from .binary import map_arrays, native_array, read_header, write_arrays
+
+if TYPE_CHECKING:
+    from astropy.table import Table
+
+ah = lazy_import('astropy_healpix')
+hp = lazy_import('healpy')
+table = lazy_import('astropy.table')
+
+
+def is_skymap_moc(obj: Union[str, np.ndarray, Table]) -> bool:
+    """
+    Decide if a sky map is a MOC (multi-order coverage) map.
+
+    - If a string path: check FITS header INDXSCHM == 'EXPLICIT' (MOC).
+    - If a Table: treat as MOC.
+    - If an ndarray (HEALPix array): not MOC.
+    """
+    if isinstance(obj, str):
+        from astropy.io.fits import getheader
+        try:
+            hdr = getheader(obj, ext=1)
+            return hdr.get('INDXSCHM', '').upper() == 'EXPLICIT'
+        except Exception:
+            # If we cannot read header, assume not MOC
+            return False
+    elif isinstance(obj, (np.ndarray, list)):
+        # Checked before Table, so arrays never import astropy
+        return False
+    elif isinstance(obj, table.Table):
+        return True
+    else:
+        raise TypeError(f'Unsupported type for is_skymap_moc: {type(obj)}')
+
+
+def _normalize_healpix_map(arr: np.ndarray, header: dict | None,
+                           distance: Dict[str, np.ndarray] | None = None,
+                           dtype: np.dtype = np.dtype(np.float64)
+                           ) -> Dict[str, Any]:
+    """
+    Normalize a flat HEALPix probability map (and optional distance layers).
+    Returns a dict with a consistent shape used throughout the package.
+
+    RING-ordered maps (header ORDERING = 'RING') are reordered to NESTED.
+    Layers are converted to dtype if it is float32 (see gw_assoc.precision);
+    arrays are not copied otherwise, so memory-mapped inputs stay lazy.
+    """
+    header = header or {}
+    distance = distance or {}
+    prob = as_layer(arr, dtype).ravel()
+    nside = hp.npix2nside(prob.size)
+    nested = True  # we always hand out NESTED maps, like ligo.skymap
+
+    layers = {'prob': prob,
+              **{k: as_layer(v, dtype).ravel() for k, v in distance.items()}}
+    if str(header.get('ORDERING', 'NESTED')).strip().upper() == 'RING':
+        layers = {k: ring_to_nested(v) for k, v in layers.items()}
+
+    # We *may* not have per-pixel distance params here. Keep None if absent.
+    return dict(
+        prob=layers['prob'],
+        distmu=layers.get('distmu'),
+        distsigma=layers.get('distsigma'),
+        distnorm=layers.get('distnorm'),
+        nside=nside,
+        nested=nested,
+        metadata=header,
+        moc=None
+    )
+
+
+@lru_cache(maxsize=4)
+def _reorder_permutation(nside: int, r2n: bool) -> np.ndarray:
+    """
+    Cached pixel permutation between RING and NESTED ordering.
+
+    m_nested = m_ring[perm] for r2n=True, m_ring = m_nested[perm] otherwise.
+    """
+    npix = hp.nside2npix(nside)
+    dtype = np.int32 if npix < 2 ** 31 else np.int64
+    ipix = np.arange(npix, dtype=dtype)
+    perm = hp.nest2ring(nside, ipix) if r2n else hp.ring2nest(nside, ipix)
+    perm = perm.astype(dtype, copy=False)
+    perm.flags.writeable = False
+    return perm
+
+
+def ring_to_nested(m: np.ndarray) -> np.ndarray:
+    """Reorder a RING HEALPix map to NESTED using a cached permutation."""
+    m = np.asarray(m)
+    return m[_reorder_permutation(hp.npix2nside(m.size), True)]
+
+
+def nested_to_ring(m: np.ndarray) -> np.ndarray:
+    """Reorder a NESTED HEALPix map to RING using a cached permutation."""
+    m = np.asarray(m)
+    return m[_reorder_permutation(hp.npix2nside(m.size), False)]
+
+
+def nest_block_sum(m: np.ndarray, nside_out: int) -> np.ndarray:
+    """
+    Downgrade a NESTED HEALPix map to nside_out by summing pixel blocks.
+
+    In NESTED order the children of a coarse pixel are contiguous, so this is
+    a reshape and a sum; probabilities per pixel are conserved exactly. The
+    sums are accumulated in float64; float32 maps give float32 results.
+    """
+    m = np.asarray(m)
+    nside_in = hp.npix2nside(m.size)
+    if nside_out > nside_in:
+        raise ValueError('nest_block_sum can only downgrade a map')
+    out = m.reshape(-1, (nside_in // nside_out) ** 2).sum(axis=1,
+                                                          dtype=np.float64)
+    return out.astype(m.dtype) if m.dtype == np.float32 else out
+
+
+def _moc_level_ipix(tab: Table) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Return (order, NESTED index) for every cell of a MOC table.
+
+    LVK sky maps store a single UNIQ column; tables with explicit ORDER/NPIX
+    columns are accepted too.
+    """
+    if 'UNIQ' in tab.colnames:
+        order, ipix = ah.uniq_to_level_ipix(
+            np.asarray(tab['UNIQ'], dtype=np.int64))
+        return order.astype(np.int64), ipix.astype(np.int64)
+    return (np.asarray(tab['ORDER'], dtype=np.int64),
+            np.asarray(tab['NPIX'], dtype=np.int64))
+
+
+@stage('skymap.rasterize')
+def rasterize_moc(order: np.ndarray, ipix: np.ndarray,
+                  values: Dict[str, np.ndarray], target_order: int, *,
+                  chunk_size: int | None = None,
+                  out: Dict[str, np.ndarray] | None = None,
+                  fill_value: float = 0.0,
+                  dtype: np.dtype = np.dtype(np.float64)
+                  ) -> Dict[str, np.ndarray]:
+    """
+    Rasterize per-cell MOC values onto a fixed-order NESTED HEALPix grid.
+
+    - Cells coarser than target_order are expanded to all their children.
+    - Cells finer than target_order are averaged into their parent pixel
+      (the same convention as ligo.skymap.moc.rasterize), so densities stay
+      densities.
+    - Pixels not covered by any cell get fill_value.
+
+    The cell layout (sort, gaps, repeat counts) is computed once and shared by
+    every column; each column is then a single np.repeat over that layout, so
+    there is no Python loop over cells.
+
+    If chunk_size is given, each output is filled in slices of chunk_size
+    pixels, so temporaries never exceed one chunk. Combine with out
+    (preallocated arrays, e.g. np.memmap) to rasterize high orders without
+    holding a second full-size copy in memory.
+
+    Outputs are of dtype (float32 for the float32 precision, see
+    gw_assoc.precision); averages of finer cells are taken in float64.
+    """
+    order = np.asarray(order, dtype=np.int64)
+    ipix = np.asarray(ipix, dtype=np.int64)
+    values = {k: np.asarray(v, dtype=float) for k, v in values.items()}
+    npix = 12 * 4 ** target_order
+    annotate(moc_cells=order.size, nside=2 ** target_order)
+
+    # Average cells finer than the target grid into their parent pixel
+    finer = order > target_order
+    if np.any(finer):
+        depth = order[finer] - target_order
+        parent, inverse = np.unique(ipix[finer] >> (2 * depth),
+                                    return_inverse=True)
+        weight = 0.25 ** depth
+        keep = ~finer
+        order = np.concatenate([order[keep],
+                                np.full(parent.size, target_order)])
+        ipix = np.concatenate([ipix[keep], parent])
+        values = {k: np.concatenate([v[keep],
+                                     np.bincount(inverse, v[finer] * weight,
+                                                 minlength=parent.size)])
+                  for k, v in values.items()}
+
+    # Half-open NESTED ranges at the target order, sorted along the sky
+    shift = 2 * (target_order - order)
+    start = ipix << shift
+    end = (ipix + 1) << shift
+    sort = np.argsort(start, kind='stable')
+    start, end = start[sort], end[sort]
+
+    # Interleave the uncovered gaps with the cells: [gap, cell, gap, ..., gap]
+    prev_end = np.concatenate([[0], end])
+    gaps = np.concatenate([start, [npix]]) - prev_end
+    if np.any(gaps < 0):
+        raise ValueError('MOC cells overlap')
+    counts = np.empty(2 * start.size + 1, dtype=np.int64)
+    counts[0::2] = gaps
+    counts[1::2] = end - start
+
+    chunks = None
+    if chunk_size is not None:
+        # For each pixel slice [plo, phi), the segments it touches and their
+        # repeat counts clipped to the slice
+        offsets = np.cumsum(counts)
+        chunks = []
+        for plo in range(0, npix, chunk_size):
+            phi = min(plo + chunk_size, npix)
+            lo = int(np.searchsorted(offsets, plo, side='right'))
+            hi = int(np.searchsorted(offsets, phi, side='left')) + 1
+            clipped = counts[lo:hi].copy()
+            clipped[0] -= plo - (offsets[lo] - counts[lo])
+            clipped[-1] -= offsets[hi - 1] - phi
+            chunks.append((plo, phi, lo, hi, clipped))
+
+    result = {}
+    for name, vals in values.items():
+        seg_vals = np.full(counts.size, fill_value, dtype=dtype)
+        seg_vals[1::2] = vals[sort]
+        if chunks is None and out is None:
+            result[name] = np.repeat(seg_vals, counts)
+            continue
+        arr = out[name] if out is not None else np.empty(npix, dtype=dtype)
+        if chunks is None:
+            arr[:] = np.repeat(seg_vals, counts)
+        else:
+            for plo, phi, lo, hi, clipped in chunks:
+                arr[plo:phi] = np.repeat(seg_vals[lo:hi], clipped)
+        result[name] = arr
+    return result
+
+
+def _normalize_moc_table(tab: Table, target_nside: int | None = None, *,
+                         chunk_size: int | None = None,
+                         dtype: np.dtype = np.dtype(np.float64)
+                         ) -> Dict[str, Any]:
+    """
+    Normalize a MOC table, rasterizing it to target_nside if one is given.
+
+    The original cells are kept under 'moc' for exact MOC computations.
+    Without target_nside nothing is rasterized: the layers are None and
+    nside is that of the finest cells; flat layers at any NSIDE are then
+    made on request by skymap_at_nside, which keeps them with the map.
+
+    With target_nside, PROBDENSITY becomes probability per pixel
+    (normalized to 1) and the distance columns are carried over per pixel,
+    all in a single rasterization pass, into dtype layers. See
+    rasterize_moc for chunk_size.
+    """
+    # ligo.skymap.read_sky_map(moc=True) yields an Astropy Table like:
+    #  UNIQ, PROBDENSITY (and possibly distance columns)
+    order, npix_moc = _moc_level_ipix(tab)
+    max_order = int(order.max()) if order.size else 0
+    if target_nside is None:
+        return dict(prob=None, distmu=None, distsigma=None, distnorm=None,
+                    nside=2 ** max_order, nested=True,
+                    metadata=dict(tab.meta), moc=tab)
+    target_order = int(np.log2(target_nside))
+    nest = True
+
+    # Probability density per steradian in MOC; convert to probability per
+    # pixel on the cells before rasterizing, normalizing to 1 just in case
+    # of rounding
+    probdensity = np.asarray(tab['PROBDENSITY'], dtype=float)
+    cell_area = 4 * np.pi / (12 * 4.0 ** order)
+    norm = np.sum(probdensity * cell_area)
+    prob = probdensity * hp.nside2pixarea(target_nside)
+    if norm > 0:
+        prob /= norm
+
+    values = {'prob': prob}
+    for colname in ('DISTMU', 'DISTSIGMA', 'DISTNORM'):
+        if colname in tab.colnames:
+            values[colname.lower()] = tab[colname]
+    maps = rasterize_moc(order, npix_moc, values, target_order,
+                         chunk_size=chunk_size, dtype=dtype)
+
+    return dict(
+        prob=maps['prob'],
+        distmu=maps.get('distmu'),
+        distsigma=maps.get('distsigma'),
+        distnorm=maps.get('distnorm'),
+        nside=target_nside,
+        nested=nest,
+        metadata=dict(tab.meta),
+        moc=tab
+    )
+
+
+SKYMAP_LAYERS = ('prob', 'distmu', 'distsigma', 'distnorm')
+
+#: Default byte budget of the process-wide sky map cache (1 GiB)
+DEFAULT_CACHE_BYTES = 1 << 30
+
+
+def _select_layers(columns: Iterable[str] | None) -> Tuple[str, ...]:
+    """Validate a column selection; PROB is always loaded."""
+    if columns is None:
+        return SKYMAP_LAYERS
+    columns = {c.lower() for c in columns}
+    unknown = columns - set(SKYMAP_LAYERS)
+    if unknown:
+        raise ValueError(f'Unknown sky map columns: {sorted(unknown)}')
+    return tuple(c for c in SKYMAP_LAYERS if c == 'prob' or c in columns)
+
+
+@stage('skymap.read')
+def read_skymap(filename: str, *, moc: bool | None = None,
+                target_nside: int | None = None,
+                columns: Iterable[str] | None = None,
+                memmap: bool = True,
+                chunk_size: int | None = None,
+                precision: str | None = None) -> Dict[str, Any]:
+    """
+    Read a LVK sky map from FITS and return a *normalized* dict:
+      {
+        prob: 1D np.ndarray (length = 12 * nside^2) | None,    # probability per pixel
+        distmu: np.ndarray | None, distsigma: np.ndarray | None, distnorm: np.ndarray | None,
+        nside: int,
+        nested: bool,       # True (NESTED order)
+        metadata: dict,     # FITS header of the sky map HDU
+        moc: Table | None,  # original MOC cells, if the file is a MOC
+        file: str
+      }
+
+    Args:
+      filename: path to FITS sky map
+      moc: force MOC path (True/False). If None, auto-detect.
+      target_nside: if provided and input is MOC, rasterize to this NSIDE.
+        By default MOC inputs are not rasterized (see Behavior).
+      columns: layers to load, any of 'prob', 'distmu', 'distsigma',
+        'distnorm'. PROB is always loaded; None loads everything present.
+        Use columns=('prob',) for 2D-only scoring.
+      memmap: memory-map the FITS file so columns are paged in on access.
+        Ignored for gzip-compressed files, which must be decompressed.
+      chunk_size: forwarded to rasterize_moc for MOC inputs.
+      precision: 'float64' or 'float32' layers; default is the current
+        gw_assoc.precision setting. MOC tables keep their column types.
+
+    Behavior:
+      - If HEALPix (not MOC): return the selected columns, reordered to
+        NESTED if needed.
+      - If MOC: keep the selected columns as cells under 'moc'; prob and
+        the distance layers are None and nside is that of the finest
+        cells. The analysis functions work on the cells directly; use
+        skymap_at_nside for flat layers. With target_nside, rasterize the
+        selected columns to HEALPix in one pass instead.
+    """
+    from astropy.io import fits
+    from astropy.table import Column, Table
+
+    layers = _select_layers(columns)
+    dtype = layer_dtype(precision)
+    memmap = memmap and not str(filename).endswith('.gz')
+
+    with fits.open(filename, memmap=memmap) as hdul:
+        hdu = hdul[1]
+        header = dict(hdu.header)
+        # Auto-detect MOC if moc is None
+        if moc is None:
+            moc = str(header.get('INDXSCHM', '')).upper() == 'EXPLICIT'
+        data = hdu.data
+        names = data.columns.names
+        units = {c.name: c.unit for c in hdu.columns}
+
+        if moc:
+            wanted = ['UNIQ', 'PROBDENSITY'] + [
+                c.upper() for c in layers[1:] if c.upper() in names]
+            tab = Table([Column(data[n], name=n, unit=units[n], copy=False)
+                         for n in wanted], meta=header, copy=False)
+            result = _normalize_moc_table(tab, target_nside=target_nside,
+                                          chunk_size=chunk_size, dtype=dtype)
+        else:
+            probname = 'PROB' if 'PROB' in names else names[0]
+            distance = {c: data[c.upper()] for c in layers[1:]
+                        if c.upper() in names}
+            result = _normalize_healpix_map(data[probname], header, distance,
+                                            dtype)
+
+    result['file'] = str(filename)
+    annotate(result)
+    return result
+
+
+def _skymap_nbytes(skymap: Dict[str, Any]) -> int:
+    """Approximate memory held by a normalized sky map."""
+    nbytes = sum(skymap[k].nbytes for k in SKYMAP_LAYERS
+                 if skymap.get(k) is not None)
+    if skymap.get('moc') is not None:
+        nbytes += sum(col.nbytes for col in skymap['moc'].itercols())
+    return nbytes
+
+
+def _freeze(skymap: Dict[str, Any]) -> Dict[str, Any]:
+    """Mark the arrays of a shared sky map read-only."""
+    arrays = [skymap[k] for k in SKYMAP_LAYERS if skymap.get(k) is not None]
+    if skymap.get('moc') is not None:
+        arrays += list(skymap['moc'].itercols())
+    for arr in arrays:
+        arr.flags.writeable = False
+    return skymap
+
+
+class SkymapCache:
+    """
+    Process-wide LRU cache of normalized sky maps with a byte budget.
+
+    Entries are keyed by the resolved path, the file's mtime and size, and the
+    read options, so a rewritten file is never served stale. When a file
+    changes, its older entries are dropped. Least recently used entries are
+    evicted once the total size exceeds max_bytes; a single map larger than the
+    budget is returned but not cached.
+
+    Cached maps are shared between callers, so their arrays are read-only.
+    Concurrent loads of the same key are coalesced (see get_or_load).
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._sizes: Dict[tuple, int] = {}
+        self._inflight: Dict[tuple, Future] = {}
+        self._lock = threading.RLock()
+
+    @property
+    def nbytes(self) -> int:
+        return sum(self._sizes.values())
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(filename: str, **options) -> tuple:
+        path = os.path.realpath(filename)
+        st = os.stat(path)
+        return (path, st.st_mtime_ns, st.st_size,
+                tuple(sorted(options.items())))
+
+    def get(self, key: tuple) -> Dict[str, Any] | None:
+        with self._lock:
+            skymap = self._entries.get(key)
+            if skymap is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return skymap
+
+    def get_or_load(self, key: tuple,
+                    load: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        The cached map for key, calling load() and caching it on a miss.
+
+        While one thread loads a key, other threads asking for the same key
+        wait for that load instead of decoding the file again; they get the
+        same map, or the same exception.
+        """
+        with self._lock:
+            skymap = self.get(key)
+            if skymap is not None:
+                return skymap
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not owner:
+            return future.result()
+        try:
+            skymap = load()
+            self.put(key, skymap)
+            future.set_result(skymap)
+            return skymap
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def put(self, key: tuple, skymap: Dict[str, Any]) -> None:
+        nbytes = _skymap_nbytes(skymap)
+        with self._lock:
+            # Drop entries for older versions of the same file
+            for old in [k for k in self._entries if k[0] == key[0]]:
+                self._pop(old)
+            if nbytes > self.max_bytes:
+                return
+            self._entries[key] = skymap
+            self._sizes[key] = nbytes
+            self.resize(self.max_bytes)
+
+    def resize(self, max_bytes: int) -> None:
+        """Change the byte budget, evicting as needed."""
+        with self._lock:
+            self.max_bytes = max_bytes
+            while self._entries and self.nbytes > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+
+    def _pop(self, key: tuple) -> None:
+        self._entries.pop(key, None)
+        self._sizes.pop(key, None)
+
+
+skymap_cache = SkymapCache()
+
+
+def set_skymap_cache_size(max_bytes: int) -> None:
+    """Set the byte budget of the process-wide sky map cache (0 disables it)."""
+    skymap_cache.resize(max_bytes)
+
+
+def clear_skymap_cache() -> None:
+    skymap_cache.clear()
+
+
+#: Magic bytes and version of the binary sky map cache format
+CACHE_MAGIC = b'GWASKYMP'
+CACHE_VERSION = 1
+
+#: Float columns stored as float32 with float32=True
+_CACHE_FLOAT_COLUMNS = ('PROBDENSITY', 'DISTMU', 'DISTSIGMA', 'DISTNORM')
+
+
+def _cache_array(arr: np.ndarray, float32: bool) -> np.ndarray:
+    arr = np.asarray(arr)
+    if float32 and arr.dtype.kind == 'f':
+        return native_array(arr, np.float32)
+    return native_array(arr)
+
+
+def write_skymap_cache(skymap: Dict[str, Any], filename: str, *,
+                       float32: bool = False,
+                       source: Dict[str, Any] | None = None) -> None:
+    """
+    Write a normalized sky map (see read_skymap) to a binary cache file.
+
+    The file is in the format of io.binary: CACHE_MAGIC, the little-endian
+    uint64 length of a JSON header, the header, and the uncompressed
+    native-endian arrays, each aligned to 64 bytes so read_skymap_cache can
+    memory-map them in place. The header holds nside, ordering, file, the
+    FITS metadata, MOC column names and units, and the dtype, shape and
+    offset of every array.
+
+    Args:
+      skymap: normalized sky map dict.
+      filename: cache file to write; written to a temporary file first and
+        renamed, so readers never see a partial file.
+      float32: store the PROB/DIST layers and MOC columns as float32,
+        halving the file. UNIQ stays int64.
+      source: identity of the FITS source (path, mtime_ns, size), used by
+        SkymapDiskCache to detect stale entries.
+    """
+    arrays = [(name, skymap[name]) for name in SKYMAP_LAYERS
+              if skymap.get(name) is not None]
+    moc = skymap.get('moc')
+    if moc is not None:
+        arrays += [('moc.' + name, moc[name]) for name in moc.colnames]
+    arrays = [(name, _cache_array(arr, float32 and (
+        name in SKYMAP_LAYERS or name[4:] in _CACHE_FLOAT_COLUMNS)))
+        for name, arr in arrays]
+
+    header = dict(
+        version=CACHE_VERSION,
+        nside=int(skymap['nside']),
+        nested=bool(skymap['nested']),
+        file=skymap.get('file'),
+        source=source,
+        metadata={k: v if isinstance(v, (bool, int, float, str)) else str(v)
+                  for k, v in (skymap.get('metadata') or {}).items()},
+        moc=None if moc is None else [
+            dict(name=name, unit=None if moc[name].unit is None
+                 else moc[name].unit.to_string())
+            for name in moc.colnames],
+    )
+    write_arrays(filename, CACHE_MAGIC, header, arrays)
+
+
+def _read_cache_header(f) -> Tuple[Dict[str, Any], int]:
+    header, start = read_header(f, CACHE_MAGIC, 'sky map cache')
+    if header.get('version') != CACHE_VERSION:
+        raise ValueError(f'Unsupported sky map cache version in {f.name}')
+    return header, start
+
+
+@stage('skymap.read_cache')
+def read_skymap_cache(filename: str) -> Dict[str, Any]:
+    """
+    Load a sky map written by write_skymap_cache, without copying.
+
+    Every array is a read-only np.memmap into the file, so pages are read
+    on first access and shared with other processes mapping the same file.
+    Returns the normalized sky map dict (see read_skymap).
+    """
+    from astropy.table import Column, Table
+
+    with open(filename, 'rb') as f:
+        header, start = _read_cache_header(f)
+    arrays = map_arrays(filename, header, start)
+
+    moc = None
+    if header['moc'] is not None:
+        moc = Table([Column(arrays['moc.' + c['name']], name=c['name'],
+                            unit=c['unit'], copy=False)
+                     for c in header['moc']],
+                    meta=header['metadata'], copy=False)
+    result = {name: arrays.get(name) for name in SKYMAP_LAYERS}
+    result.update(nside=header['nside'], nested=header['nested'],
+                  metadata=header['metadata'], moc=moc, file=header['file'])
+    annotate(result)
+    return result
+
+
+class SkymapDiskCache:
+    """
+    Directory of binary sky map caches (see write_skymap_cache).
+
+    Entries are named by a hash of the resolved FITS path and the read
+    options, and record the mtime and size of the FITS file they were
+    made from; an entry is only used while both still match and it is
+    not older than the FITS file, and is rewritten otherwise. Unwritable
+    directories are ignored, so the cache never makes a load fail.
+    """
+
+    def __init__(self, directory: str | None, *, float32: bool = False):
+        self.directory = directory
+        self.float32 = float32
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    @staticmethod
+    def _source(filename: str) -> Dict[str, Any]:
+        path = os.path.realpath(filename)
+        st = os.stat(path)
+        return dict(path=path, mtime_ns=st.st_mtime_ns, size=st.st_size)
+
+    def path(self, filename: str, **options) -> str:
+        key = repr((os.path.realpath(filename), self.float32,
+                    sorted(options.items())))
+        digest = hashlib.sha1(key.encode()).hexdigest()[:24]
+        return os.path.join(self.directory, digest + '.skymap')
+
+    def get(self, filename: str, **options) -> Dict[str, Any] | None:
+        """The cached sky map if present and fresh, else None."""
+        path = self.path(filename, **options)
+        try:
+            source = self._source(filename)
+            if os.stat(path).st_mtime_ns < source['mtime_ns']:
+                return None
+            with open(path, 'rb') as f:
+                header, _ = _read_cache_header(f)
+            if header['source'] != source:
+                return None
+            return read_skymap_cache(path)
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(self, filename: str, skymap: Dict[str, Any], **options) -> None:
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            write_skymap_cache(skymap, self.path(filename, **options),
+                               float32=self.float32,
+                               source=self._source(filename))
+        except OSError:
+            pass
+
+    def clear(self) -> None:
+        """Remove all cache files from the directory."""
+        if not self.enabled or not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name.endswith('.skymap'):
+                os.remove(os.path.join(self.directory, name))
+
+
+def _default_cache_dir() -> str | None:
+    # Opt-in: decoded maps can take GBs, so nothing is written to disk
+    # unless a directory is configured
+    return os.environ.get('GW_ASSOC_CACHE_DIR') or None
+
+
+skymap_disk_cache = SkymapDiskCache(_default_cache_dir())
+
+
+def set_skymap_disk_cache(directory: str | None, *,
+                          float32: bool = False) -> None:
+    """
+    Set the directory of the binary sky map cache (None disables it).
+
+    With float32=True new entries store the PROB/DIST layers as float32.
+    The cache is off by default; setting the GW_ASSOC_CACHE_DIR
+    environment variable turns it on for a process from the start. Entries
+    are not evicted: the directory is the caller's to manage (see
+    SkymapDiskCache.clear).
+    """
+    skymap_disk_cache.directory = directory
+    skymap_disk_cache.float32 = float32
+
+
+def _readonly(arr: np.ndarray) -> np.ndarray:
+    arr.flags.writeable = False
+    return arr
+
+
+def _distance_moments(prob: np.ndarray, distmu: np.ndarray,
+                      distsigma: np.ndarray, distnorm: np.ndarray
+                      ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Per-pixel weights and moments of the distance ansatz's Gaussian factor.
+
+    The distance distribution of a coarse pixel is the probability-weighted
+    mixture of its children's, sum_i prob_i DISTNORM_i r^2 N(r; mu_i, s_i),
+    in which the r^2 factor is common. Its Gaussian factor is matched by
+    one Gaussian through the moments returned here, (a, a mu, a (s^2+mu^2))
+    with a = prob DISTNORM, which for a coarse pixel are block sums of its
+    children's. Pixels without valid distance information get zero weight.
+    The moments are worked out in float64 and returned in the dtype of prob.
+    """
+    dtype = np.asarray(prob).dtype
+    valid = (np.isfinite(distmu) & np.isfinite(distnorm) & (distsigma > 0) &
+             (prob > 0))
+    a = np.where(valid, np.multiply(prob, distnorm, dtype=np.float64), 0.)
+    mu = np.where(valid, distmu, 0.)
+    moments = (a, a * mu, a * (np.where(valid, distsigma, 0.) ** 2 + mu ** 2))
+    if dtype == np.float32:
+        moments = tuple(m.astype(dtype) for m in moments)
+    return moments
+
+
+def _moments_to_distance(a: np.ndarray, m1: np.ndarray, m2: np.ndarray
+                         ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    DISTMU, DISTSIGMA, DISTNORM from summed moments (see _distance_moments).
+
+    Pixels with no weight get the LVK convention DISTMU=inf, DISTSIGMA=1,
+    DISTNORM=0. Worked out in float64, returned in the dtype of the moments.
+    """
+    from ligo.skymap.distance import parameters_to_moments
+
+    dtype = np.asarray(a).dtype
+    a, m1, m2 = (np.asarray(m, dtype=np.float64) for m in (a, m1, m2))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mu = m1 / a
+        sigma = np.sqrt(np.clip(m2 / a - mu ** 2, 0, None))
+    empty = ~(a > 0) | ~(sigma > 0)
+    mu[empty], sigma[empty] = np.inf, 1.
+    _, _, norm = parameters_to_moments(mu, sigma)
+    norm[empty] = 0.
+    if dtype == np.float32:
+        return mu.astype(dtype), sigma.astype(dtype), norm.astype(dtype)
+    return mu, sigma, norm
+
+
+class SkymapPyramid:
+    """
+    Multi-resolution pyramid of a flat, NESTED sky map.
+
+    Each coarser NSIDE level is built from the next finer one by NESTED
+    block sums: PROB is summed (conserving probability exactly), and so are
+    the moments of the probability-weighted distance mixture (see
+    _distance_moments), which are turned back into distance layers only for
+    the NSIDEs asked for. Levels are built on first request and kept, so
+    afterwards any coarser NSIDE is a dict lookup; all levels together take
+    at most about a third of the memory of the full-resolution map.
+    Finer NSIDEs are served by copying each value to its children (PROB
+    split evenly) and are not kept.
+
+    A MOC map loaded without rasterization (prob None, see read_skymap)
+    has no full-resolution layers: each level asked for is rasterized
+    from the cells instead, PROB from the probability density and the
+    distance layers from the per-steradian moments, which gives the same
+    levels as block sums of the map rasterized at its finest order. Its
+    levels are in the current gw_assoc.precision.
+
+    Use skymap_pyramid() to get the pyramid cached with a loaded map.
+    Level arrays are read-only. Safe to use from several threads.
+    """
+
+    def __init__(self, skymap: Dict[str, Any]):
+        self.nside = int(skymap['nside'])
+        self._prob = {}
+        self._distance = {}
+        self._moments = {}  # summed distance moments below full resolution
+        self._cells = None
+        # Separate locks so PROB and distance levels can be built at once
+        self._prob_lock = threading.Lock()
+        self._distance_lock = threading.Lock()
+        if skymap.get('prob') is None and skymap.get('moc') is not None:
+            self._set_cells(skymap['moc'])
+            return
+
+        prob = np.asarray(skymap['prob'])
+        distance = tuple(skymap.get(k) for k in ('distmu', 'distsigma',
+                                                 'distnorm'))
+        if not skymap.get('nested', True):
+            prob = ring_to_nested(prob)
+            if distance[0] is not None:
+                distance = tuple(ring_to_nested(d) for d in distance)
+        self._prob[self.nside] = prob
+        self.has_distance = distance[0] is not None
+        if self.has_distance:
+            self._distance[self.nside] = tuple(np.asarray(d)
+                                               for d in distance)
+
+    def _set_cells(self, tab: Table) -> None:
+        order, ipix = _moc_level_ipix(tab)
+        density = np.asarray(tab['PROBDENSITY'], dtype=float)
+        norm = np.sum(density * 4 * np.pi / (12 * 4.0 ** order))
+        self._cells = dict(order=order, ipix=ipix, density=density,
+                           norm=norm if norm > 0 else 1.,
+                           dtype=layer_dtype(None))
+        self.has_distance = all(c in tab.colnames for c in
+                                ('DISTMU', 'DISTSIGMA', 'DISTNORM'))
+        if self.has_distance:
+            # Per-steradian moments: rasterizing averages them over finer
+            # cells, which is the block sum up to the pixel area
+            self._cells['moments'] = _distance_moments(
+                density, *(np.asarray(tab[c], dtype=float)
+                           for c in ('DISTMU', 'DISTSIGMA', 'DISTNORM')))
+
+    def _rasterize(self, nside: int, values: Dict[str, np.ndarray]
+                   ) -> Dict[str, np.ndarray]:
+        cells = self._cells
+        return rasterize_moc(cells['order'], cells['ipix'], values,
+                             nside.bit_length() - 1, dtype=cells['dtype'])
+
+    @property
+    def levels(self) -> Tuple[int, ...]:
+        """NSIDEs built so far, finest first."""
+        return tuple(sorted(self._prob, reverse=True))
+
+    def _check(self, nside: int) -> int:
+        nside = int(nside)
+        if nside < 1 or nside & (nside - 1):
+            raise ValueError(f'NSIDE must be a power of 2, got {nside}')
+        return nside
+
+    def prob(self, nside: int) -> np.ndarray:
+        """Probability per pixel at nside (NESTED)."""
+        nside = self._check(nside)
+        prob = self._prob.get(nside)
+        if prob is not None:
+            return prob
+        if self._cells is not None:
+            cells = self._cells
+            prob = _readonly(self._rasterize(nside, {
+                'prob': cells['density'] * hp.nside2pixarea(nside) /
+                cells['norm']})['prob'])
+            if nside > self.nside:
+                return prob
+            with self._prob_lock:
+                return self._prob.setdefault(nside, prob)
+        if nside > self.nside:
+            factor = (nside // self.nside) ** 2
+            return np.repeat(self._prob[self.nside] / factor, factor)
+        with self._prob_lock:
+            level = min(n for n in self._prob if n > nside)
+            while level > nside:
+                self._prob[level // 2] = _readonly(
+                    nest_block_sum(self._prob[level], level // 2))
+                level //= 2
+        return self._prob[nside]
+
+    def distance(self, nside: int
+                 ) -> Tuple[np.ndarray, np.ndarray, np.ndarray] | None:
+        """(DISTMU, DISTSIGMA, DISTNORM) at nside, or None if absent."""
+        nside = self._check(nside)
+        if not self.has_distance:
+            return None
+        layers = self._distance.get(nside)
+        if layers is not None:
+            return layers
+        if self._cells is not None:
+            moments = self._rasterize(nside, dict(zip(
+                ('a', 'm1', 'm2'), self._cells['moments'])))
+            layers = tuple(_readonly(d) for d in _moments_to_distance(
+                moments['a'], moments['m1'], moments['m2']))
+            if nside > self.nside:
+                return layers
+            with self._distance_lock:
+                return self._distance.setdefault(nside, layers)
+        if nside > self.nside:
+            factor = (nside // self.nside) ** 2
+            return tuple(np.repeat(d, factor)
+                         for d in self._distance[self.nside])
+        with self._distance_lock:
+            if nside not in self._distance:
+                # Start from the cached moments closest above nside; levels
+                # built for coarser requests cannot be refined
+                finer = [n for n in self._moments if n >= nside]
+                if finer:
+                    level = min(finer)
+                    moments = self._moments[level]
+                else:
+                    moments = _distance_moments(self._prob[self.nside],
+                                                *self._distance[self.nside])
+                    level = self.nside
+                while level > nside:
+                    level //= 2
+                    moments = self._moments[level] = tuple(
+                        _readonly(nest_block_sum(m, level)) for m in moments)
+                self._distance[nside] = tuple(
+                    _readonly(d) for d in _moments_to_distance(*moments))
+        return self._distance[nside]
+
+    def skymap(self, skymap: Dict[str, Any], nside: int) -> Dict[str, Any]:
+        """Copy of a normalized sky map dict with its layers at nside."""
+        return _with_layers(skymap, nside, self.prob(nside),
+                            self.distance(nside))
+
+
+def _with_layers(skymap: Dict[str, Any], nside: int, prob: np.ndarray,
+                 distance: Tuple[np.ndarray, ...] | None) -> Dict[str, Any]:
+    new = {**skymap, 'prob': prob, 'nside': int(nside), 'nested': True}
+    if distance is not None:
+        new['distmu'], new['distsigma'], new['distnorm'] = distance
+    return new
+
+
+def skymap_pyramid(skymap: Dict[str, Any]) -> SkymapPyramid:
+    """
+    The SkymapPyramid of a loaded sky map, built once and kept in the dict.
+
+    Maps served by the loader cache are shared, so their pyramid is too.
+    """
+    pyramid = skymap.get('pyramid')
+    if pyramid is None:
+        pyramid = skymap.setdefault('pyramid', SkymapPyramid(skymap))
+    return pyramid
+
+
+def skymap_at_nside(skymap: Dict[str, Any], nside: int) -> Dict[str, Any]:
+    """
+    A loaded sky map at another NSIDE, via its cached pyramid.
+
+    MOC maps loaded without rasterization get flat layers at any NSIDE,
+    their own included.
+    """
+    if int(nside) == skymap['nside'] and skymap.get('prob') is not None:
+        return skymap
+    return skymap_pyramid(skymap).skymap(skymap, nside)
+
+
+@stage('skymap.resolution')
+def enforce_same_resolution(*skymaps: Dict[str, Any],
+                            nside_new: int | None = None,
+                            workers: int | None = None
+                            ) -> Tuple[Dict[str, Any], ...]:
+    """
+    Ensure all HEALPix maps share the same NSIDE (NESTED).
+
+    - If nside_new is None, downgrade/upgrade all to the *minimum* NSIDE found.
+    - Maps are regraded through their cached SkymapPyramid, so repeated calls
+      are lookups. PROB is block-summed; distance layers are combined by
+      moments (see SkymapPyramid).
+    - The PROB and distance levels of all maps are built concurrently on a
+      thread pool of `workers` threads (default: one per task, at most the
+      CPU count); NumPy releases the GIL in the block sums.
+    """
+    maps = list(skymaps)
+    if nside_new is None:
+        nside_new = int(np.amin([m['nside'] for m in maps]))
+    annotate(nside=max(m['nside'] for m in maps), nside_out=nside_new)
+
+    # One task per map and layer group; upgrades are not cached by the
+    # pyramids, so the maps are assembled from the task results
+    pyramids = {i: skymap_pyramid(m) for i, m in enumerate(maps)
+                if m['nside'] != nside_new or m.get('prob') is None}
+    tasks = {(i, 'prob'): p.prob for i, p in pyramids.items()}
+    tasks.update({(i, 'distance'): p.distance for i, p in pyramids.items()
+                  if p.has_distance})
+    if len(tasks) > 1:
+        workers = workers or min(len(tasks), os.cpu_count() or 1)
+        with ThreadPoolExecutor(workers) as pool:
+            futures = {key: pool.submit(task, nside_new)
+                       for key, task in tasks.items()}
+            layers = {key: future.result() for key, future in futures.items()}
+    else:
+        layers = {key: task(nside_new) for key, task in tasks.items()}
+    return tuple(
+        _with_layers(m, nside_new, layers[i, 'prob'],
+                     layers.get((i, 'distance'))) if i in pyramids else m
+        for i, m in enumerate(maps))
+
+
+@stage('skymap.load')
+def load_gw_skymap(file_path: str, *, cache: bool = True,
+                   disk_cache: bool = True, **kwargs) -> Dict[str, Any]:
+    """
+    Load a GW sky map as a normalized dict (see read_skymap).
+
+    Repeated loads of an unchanged file are served from the process-wide
+    LRU cache (see SkymapCache); pass cache=False to always read from disk.
+    Across processes, the decoded map can be kept in the binary disk cache
+    (off unless configured, see set_skymap_disk_cache) and memory-mapped
+    from there while it is fresher than the FITS file; pass
+    disk_cache=False to always decode the FITS file. Keyword arguments are
+    forwarded to read_skymap.
+    """
+    # Resolve the precision now, so the cache key matches what is read
+    kwargs['precision'] = get_precision() if kwargs.get(
+        'precision') is None else kwargs['precision']
+    options = dict(kwargs)
+    # chunk_size and memmap do not change the result
+    options.pop('chunk_size', None)
+    options.pop('memmap', None)
+    if 'columns' in options:
+        options['columns'] = _select_layers(options['columns'])
+
+    if not cache or skymap_cache.max_bytes <= 0:
+        return _read_skymap_cached(file_path, disk_cache, options, kwargs)
+
+    key = skymap_cache.key(file_path, **options)
+    skymap = skymap_cache.get_or_load(key, lambda: _freeze(
+        _read_skymap_cached(file_path, disk_cache, options, kwargs)))
+    annotate(skymap)
+    return skymap
+
+
+def _read_skymap_cached(file_path: str, disk_cache: bool,
+                        options: Dict[str, Any],
+                        kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """read_skymap through the disk cache, if enabled."""
+    if not (disk_cache and skymap_disk_cache.enabled):
+        return read_skymap(file_path, **kwargs)
+    skymap = skymap_disk_cache.get(file_path, **options)
+    if skymap is None:
+        skymap = read_skymap(file_path, **kwargs)
+        skymap_disk_cache.put(file_path, skymap, **options)
+    return skymap
@@ -1,5 +1,20 @@
 # src/gw_assoc/io/transient.py
+from __future__ import annotations
+
+import csv
+import json
+import math
+import os
+import sys
+from itertools import islice
+from typing import Any, Dict, IO, Iterable, Iterator, Union
+
+import numpy as np
+
+
 class Transient:
+    __slots__ = ("ra", "dec", "z", "time")
+
     def __init__(self, ra=None, dec=None, z=None, time=None):
         self.ra = ra
         self.dec = dec
@@ -9,3 +24,253 @@ class Transient:
     def __repr__(self):
         return f"<Transient ra={self.ra}, dec={self.dec}, z={self.z}, time={self.time}>"
 
+
+#: Float columns of a catalog; missing values are NaN
+FLOAT_COLUMNS = ("ra", "dec", "z", "time", "err_radius")
+#: Optional label columns, kept as object arrays
+LABEL_COLUMNS = ("ids", "classes")
+
+#: Accepted input column names for each catalog column
+COLUMN_ALIASES = {
+    "ra": ("ra", "RA", "ra_deg"),
+    "dec": ("dec", "DEC", "dec_deg"),
+    "z": ("z", "redshift"),
+    "time": ("time", "t", "mjd", "gps_time"),
+    "err_radius": ("err_radius", "error_radius", "err"),
+    "ids": ("id", "ids", "name", "objectId"),
+    "classes": ("class", "classes", "cls", "type"),
+}
+
+DEFAULT_CHUNK_SIZE = 100_000
+
+
+class TransientCatalog:
+    """
+    Columnar catalog of transients backed by NumPy arrays.
+
+    Columns: ra, dec (degrees), z, time, and optionally err_radius (degrees),
+    ids and classes. Missing float values are NaN. Slicing with a slice
+    returns a catalog of views (no copy); integer indexing returns a
+    Transient row. Everything in gw_assoc.analysis that takes transients
+    accepts a catalog directly.
+    """
+
+    __slots__ = FLOAT_COLUMNS + LABEL_COLUMNS
+
+    def __init__(self, ra, dec, z=None, time=None, err_radius=None,
+                 ids=None, classes=None):
+        self.ra = np.atleast_1d(np.asarray(ra, dtype=float))
+        n = len(self.ra)
+        for name, col in (("dec", dec), ("z", z), ("time", time),
+                          ("err_radius", err_radius)):
+            if col is None:
+                if name == "dec":
+                    raise ValueError("dec is required")
+                arr = None if name == "err_radius" else np.full(n, np.nan)
+            else:
+                arr = np.atleast_1d(np.asarray(col, dtype=float))
+                if len(arr) != n:
+                    raise ValueError(f"Column {name} has length {len(arr)}, "
+                                     f"expected {n}")
+            setattr(self, name, arr)
+        for name, col in (("ids", ids), ("classes", classes)):
+            setattr(self, name, None if col is None else np.asarray(col))
+
+    @classmethod
+    def from_transients(cls, transients: Iterable[Transient]) -> "TransientCatalog":
+        transients = list(transients)
+        cols = {k: [_as_float(getattr(t, k, None)) for t in transients]
+                for k in ("ra", "dec", "z", "time")}
+        return cls(**cols)
+
+    @classmethod
+    def from_columns(cls, columns: Dict[str, Any]) -> "TransientCatalog":
+        """Build a catalog from a mapping of (possibly aliased) columns."""
+        kwargs = {}
+        for name, aliases in COLUMN_ALIASES.items():
+            for alias in aliases:
+                if alias in columns and columns[alias] is not None:
+                    kwargs[name] = columns[alias]
+                    break
+        if name_missing := {"ra", "dec"} - kwargs.keys():
+            raise ValueError(f"Missing required columns: {sorted(name_missing)}")
+        for name in FLOAT_COLUMNS:
+            if name in kwargs:
+                kwargs[name] = _float_column(kwargs[name])
+        return cls(**kwargs)
+
+    @classmethod
+    def concatenate(cls, catalogs: Iterable["TransientCatalog"]) -> "TransientCatalog":
+        catalogs = list(catalogs)
+        if not catalogs:
+            return cls([], [])
+        kwargs = {}
+        for name in FLOAT_COLUMNS + LABEL_COLUMNS:
+            cols = [getattr(c, name) for c in catalogs]
+            if all(col is None for col in cols):
+                continue
+            # Pad catalogs lacking an optional column
+            fill, dtype = (None, object) if name in LABEL_COLUMNS else (np.nan, float)
+            kwargs[name] = np.concatenate([
+                np.full(len(c), fill, dtype=dtype) if col is None else col
+                for c, col in zip(catalogs, cols)])
+        return cls(**kwargs)
+
+    def __len__(self):
+        return len(self.ra)
+
+    def __getitem__(self, item):
+        if isinstance(item, (int, np.integer)):
+            return Transient(*(_scalar(getattr(self, k)[item])
+                               for k in ("ra", "dec", "z", "time")))
+        return TransientCatalog(**{
+            k: None if getattr(self, k) is None else getattr(self, k)[item]
+            for k in FLOAT_COLUMNS + LABEL_COLUMNS})
+
+    def __iter__(self) -> Iterator[Transient]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def __repr__(self):
+        return f"<TransientCatalog n={len(self)}>"
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, k).nbytes for k in self.__slots__
+                   if getattr(self, k) is not None)
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        """The non-empty columns as a dict of arrays (no copies)."""
+        return {k: getattr(self, k) for k in self.__slots__
+                if getattr(self, k) is not None}
+
+
+def transient_columns(transients, names=("ra", "dec", "z", "time")) -> Dict[str, np.ndarray]:
+    """
+    Float column arrays from any supported transient input.
+
+    Accepts a TransientCatalog (columns are returned without copying), a
+    single Transient, a sequence of Transients, or a dict of arrays. Missing
+    values are NaN.
+    """
+    if isinstance(transients, TransientCatalog):
+        return {k: getattr(transients, k) for k in names}
+    if isinstance(transients, Transient):
+        transients = [transients]
+    if isinstance(transients, dict):
+        n = len(np.atleast_1d(transients["ra"]))
+        return {k: (np.atleast_1d(np.asarray(transients[k], dtype=float))
+                    if transients.get(k) is not None else np.full(n, np.nan))
+                for k in names}
+    return {k: np.array([_as_float(getattr(t, k, None)) for t in transients],
+                        dtype=float)
+            for k in names}
+
+
+def _as_float(value) -> float:
+    return np.nan if value is None or value == "" else float(value)
+
+
+def _float_column(values) -> np.ndarray:
+    arr = np.asarray(values)
+    if arr.dtype.kind in "fiub":
+        return arr.astype(float, copy=False)
+    if arr.dtype.kind in "US":
+        # Text from CSV: empty cells are missing values
+        return np.where(arr == "", "nan", arr).astype(float)
+    return np.array([_as_float(v) for v in arr], dtype=float)
+
+
+def _scalar(value):
+    value = value.item() if hasattr(value, "item") else value
+    return None if isinstance(value, float) and np.isnan(value) else value
+
+
+def json_value(value):
+    """A catalog or score value as JSON: a Python scalar, None if non-finite."""
+    if value is None:
+        return None
+    value = value.item() if hasattr(value, "item") else value
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def _open_text(source: Union[str, os.PathLike, IO[str]]):
+    if source == "-":
+        return sys.stdin, False
+    if hasattr(source, "read"):
+        return source, False
+    return open(source, newline=""), True
+
+
+def iter_csv(source, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[TransientCatalog]:
+    """Stream a CSV file (path, file object or '-' for stdin) in catalog chunks."""
+    fh, close = _open_text(source)
+    try:
+        reader = csv.DictReader(fh)
+        while rows := list(islice(reader, chunk_size)):
+            yield TransientCatalog.from_columns(
+                {k: [row[k] for row in rows] for k in reader.fieldnames})
+    finally:
+        if close:
+            fh.close()
+
+
+def iter_jsonl(source, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[TransientCatalog]:
+    """Stream a JSON-lines file (path, file object or '-' for stdin) in catalog chunks."""
+    fh, close = _open_text(source)
+    try:
+        lines = (line for line in fh if line.strip())
+        while batch := list(islice(lines, chunk_size)):
+            records = [json.loads(line) for line in batch]
+            keys = {k for rec in records for k in rec}
+            yield TransientCatalog.from_columns(
+                {k: [rec.get(k) for rec in records] for k in keys})
+    finally:
+        if close:
+            fh.close()
+
+
+def iter_parquet(path, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[TransientCatalog]:
+    """Stream a Parquet file in catalog chunks (requires pyarrow)."""
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as exc:
+        raise ImportError("Reading Parquet catalogs requires pyarrow") from exc
+
+    pf = pq.ParquetFile(path)
+    aliases = {a for names in COLUMN_ALIASES.values() for a in names}
+    columns = [c for c in pf.schema_arrow.names if c in aliases]
+    for batch in pf.iter_batches(batch_size=chunk_size, columns=columns):
+        yield TransientCatalog.from_columns(
+            {name: col.to_numpy(zero_copy_only=False)
+             for name, col in zip(batch.schema.names, batch.columns)})
+
+
+READERS = {"csv": iter_csv, "jsonl": iter_jsonl, "ndjson": iter_jsonl,
+           "parquet": iter_parquet}
+
+
+def _guess_format(source) -> str:
+    name = str(getattr(source, "name", source)).lower()
+    for ext, fmt in ((".csv", "csv"), (".jsonl", "jsonl"),
+                     (".ndjson", "jsonl"), (".json", "jsonl"),
+                     (".parquet", "parquet"), (".pq", "parquet")):
+        if name.endswith(ext):
+            return fmt
+    raise ValueError(f"Cannot guess the catalog format of {name!r}; "
+                     "pass format=")
+
+
+def iter_transients(source, format: str | None = None,
+                    chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[TransientCatalog]:
+    """Stream a transient catalog in chunks of at most chunk_size rows."""
+    return READERS[format or _guess_format(source)](source, chunk_size)
+
+
+def read_transients(source, format: str | None = None,
+                    chunk_size: int = DEFAULT_CHUNK_SIZE) -> TransientCatalog:
+    """Read a whole transient catalog (CSV, JSON lines or Parquet)."""
+    return TransientCatalog.concatenate(
+        iter_transients(source, format, chunk_size))
@@ -0,0 +1,443 @@
+# src/gw_assoc/online.py
+"""
+Long-running asyncio association engine for alert streams.
+
+The engine keeps every active GW event prepared in memory (loaded sky map,
+UNIQ index, credible index) together with all transients seen so far, and
+scores incrementally:
+
+- a new transient is scored against every active event;
+- a new or updated sky map (preliminary -> initial -> update) rescores all
+  known transients against that event only;
+- a retraction drops the event.
+
+A message that cannot be applied (unknown type, unreadable sky map,
+malformed transient, invalid JSON line) becomes an 'error' record sent to
+the sink; the engine carries on with the next message. With
+transient_ttl/event_ttl, transients and events not updated for that long
+are dropped, so memory and the cost of rescoring stay bounded.
+
+Messages are dicts (e.g. JSON lines):
+
+    {"type": "skymap", "event_id": "S250101a", "file": "bayestar.fits",
+     "alert_type": "PRELIMINARY", "gw_time": 60676.1}
+    {"type": "transient", "id": "ZTF25aaa", "ra": 10.1, "dec": -5.2,
+     "z": 0.03, "time": 60676.4}
+    {"type": "retraction", "event_id": "S250101a"}
+
+A message without "type" is a transient. gw_time defaults to the MJD-OBS
+of the sky map, so transient times are then MJD. Results go to an async
+sink as lists of records. Sources stand in for a live broker offline:
+`jsonl_source` (e.g. stdin) and `watch_directory`.
+
+    engine = AssociationEngine(ndjson_sink(sys.stdout), window=window)
+    await engine.run(watch_directory("alerts/"), stdin_source())
+"""
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import (Any, AsyncIterator, Awaitable, Callable, Dict, IO,
+                    Iterable, List)
+
+import numpy as np
+
+from .io.transient import TransientCatalog, json_value, transient_columns
+
+#: Sky map files picked up by watch_directory
+SKYMAP_SUFFIXES = ('.fits', '.fits.gz', '.fits.fz')
+#: Message files picked up by watch_directory
+MESSAGE_SUFFIXES = ('.json', '.jsonl', '.ndjson')
+
+Record = Dict[str, Any]
+Sink = Callable[[List[Record]], Awaitable[Any]]
+
+
+class EventState:
+    """One active GW event: its sky map, prepared for scoring."""
+
+    __slots__ = ('event_id', 'file', 'skymap', 'gw_time', 'alert_type',
+                 'revision', 'updated')
+
+    def __init__(self, event_id: str, file: str, skymap: Dict[str, Any],
+                 gw_time: float | None, alert_type: str | None,
+                 revision: int):
+        self.event_id = event_id
+        self.file = file
+        self.skymap = skymap
+        self.gw_time = gw_time
+        self.alert_type = alert_type
+        self.revision = revision
+        self.updated = time.time()
+
+    def __repr__(self):
+        return (f'<EventState {self.event_id} rev={self.revision} '
+                f'{self.alert_type or ""} {os.path.basename(self.file)}>')
+
+
+class AssociationEngine:
+    """
+    Incremental association of a transient stream with active GW events.
+
+    Args:
+      sink: async callable receiving each batch of result records; see
+        ndjson_sink. Records have type 'score' (one per scored pair, with
+        event_id, revision, alert_type, transient id/ra/dec/z/time and the
+        odds terms; revision counts the sky maps of the event),
+        'retraction', 'expired' or 'error' (the message and the error).
+      min_odds: only emit scores with posterior odds above this.
+      columns: sky map layers to load, e.g. ('prob',) for 2D scoring.
+      transient_ttl: drop transients this many seconds after they arrived
+        (None keeps them all).
+      event_ttl: drop events this many seconds after their last sky map,
+        with an 'expired' record (None keeps them until retracted).
+      **odds_kwargs: forwarded to compute_posterior_odds_batch (window,
+        prior_odds, use_distance, max_credible_level, ...). gw_time comes
+        from each event.
+
+    Loading and scoring run on a worker thread, so the event loop (and
+    the sources feeding it) stay responsive. Messages are applied one at a
+    time, in arrival order.
+    """
+
+    def __init__(self, sink: Sink | None = None, *,
+                 min_odds: float | None = None,
+                 columns: Iterable[str] | None = None,
+                 transient_ttl: float | None = None,
+                 event_ttl: float | None = None, **odds_kwargs):
+        self.sink = sink
+        self.min_odds = min_odds
+        self.columns = columns
+        self.transient_ttl = transient_ttl
+        self.event_ttl = event_ttl
+        self.odds_kwargs = odds_kwargs
+        self.events: Dict[str, EventState] = {}
+        # (arrival time, catalog) of each transient message
+        self._catalogs: List[tuple] = []
+        self._transients: TransientCatalog | None = None
+        self._ids = itertools.count()
+        # Created by the first message, inside the running loop (a Lock
+        # made outside one binds to the wrong loop before Python 3.10)
+        self._lock: asyncio.Lock | None = None
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix='gw-assoc')
+
+    @property
+    def transients(self) -> TransientCatalog | None:
+        """All transients received so far (and not expired), as one catalog."""
+        if self._transients is None and self._catalogs:
+            self._transients = TransientCatalog.concatenate(
+                [catalog for _, catalog in self._catalogs])
+        return self._transients
+
+    async def _call(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def handle(self, message: Record) -> List[Record]:
+        """
+        Apply one message; returns (and emits) the resulting records.
+
+        Errors are reported as a single 'error' record rather than raised,
+        so one bad message never stops the stream.
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            records = self.expire()
+            try:
+                records += await self._apply(message)
+            except Exception as exc:
+                records.append(_error_record(message, exc))
+        if records and self.sink is not None:
+            await self.sink(records)
+        return records
+
+    async def _apply(self, message: Record) -> List[Record]:
+        kind = message.get('type', 'transient')
+        if kind == 'skymap':
+            return await self.update_event(
+                message['event_id'], message['file'],
+                gw_time=message.get('gw_time'),
+                alert_type=message.get('alert_type'))
+        if kind == 'retraction':
+            return self.retract(message['event_id'])
+        if kind in ('transient', 'transients'):
+            rows = message.get('transients', [message])
+            return await self.add_transients(
+                TransientCatalog.from_columns(_rows_to_columns(rows)))
+        if kind == 'invalid':
+            raise ValueError(message['error'])
+        raise ValueError(f'Unknown message type {kind!r}')
+
+    def expire(self, now: float | None = None) -> List[Record]:
+        """Drop transients and events older than their ttl."""
+        now = time.time() if now is None else now
+        records = []
+        if self.transient_ttl is not None:
+            keep = [(t, c) for t, c in self._catalogs
+                    if now - t <= self.transient_ttl]
+            if len(keep) < len(self._catalogs):
+                self._catalogs = keep
+                self._transients = None
+        if self.event_ttl is not None:
+            for event_id, state in list(self.events.items()):
+                if now - state.updated > self.event_ttl:
+                    del self.events[event_id]
+                    records.append(dict(type='expired', event_id=event_id))
+        return records
+
+    async def update_event(self, event_id: str, file: str, *,
+                           gw_time: float | None = None,
+                           alert_type: str | None = None) -> List[Record]:
+        """Load a new or updated sky map and rescore this event only."""
+        previous = self.events.get(event_id)
+        revision = previous.revision + 1 if previous else 1
+        state = await self._call(self._prepare, event_id, file, gw_time,
+                                 alert_type, revision)
+        self.events[event_id] = state
+        if self.transients is None:
+            return []
+        return await self._call(self._score, state, self.transients)
+
+    def retract(self, event_id: str) -> List[Record]:
+        if self.events.pop(event_id, None) is None:
+            return []
+        return [dict(type='retraction', event_id=event_id)]
+
+    async def add_transients(self, catalog: TransientCatalog
+                             ) -> List[Record]:
+        """Store new transients and score them against every event."""
+        if catalog.ids is None:
+            catalog.ids = np.array([f'T{next(self._ids)}'
+                                    for _ in range(len(catalog))],
+                                   dtype=object)
+        self._catalogs.append((time.time(), catalog))
+        self._transients = None
+        records = []
+        for state in list(self.events.values()):
+            records += await self._call(self._score, state, catalog)
+        return records
+
+    def _prepare(self, event_id, file, gw_time, alert_type,
+                 revision) -> EventState:
+        from .analysis.credible import credible_index
+        from .analysis.spatial import unpack_skymap
+        from .io.skymap import load_gw_skymap
+
+        skymap = load_gw_skymap(file, columns=self.columns)
+        unpack_skymap(skymap)  # builds and keeps the UNIQ index
+        if self.odds_kwargs.get('max_credible_level') is not None:
+            credible_index(skymap)
+        if gw_time is None:
+            gw_time = skymap['metadata'].get('MJD-OBS')
+        return EventState(event_id, file, skymap, gw_time, alert_type,
+                          revision)
+
+    def _score(self, state: EventState, catalog: TransientCatalog
+               ) -> List[Record]:
+        from .analysis.odds import compute_posterior_odds_batch
+
+        kwargs = dict(self.odds_kwargs)
+        if state.gw_time is None:
+            kwargs.pop('window', None)
+        terms = compute_posterior_odds_batch(
+            state.skymap, catalog, return_terms=True, gw_time=state.gw_time,
+            **kwargs)
+        keep = np.arange(len(catalog))
+        if self.min_odds is not None:
+            keep = np.flatnonzero(terms['posterior_odds'] > self.min_odds)
+        cols = transient_columns(catalog)
+        return [dict(type='score', event_id=state.event_id,
+                     revision=state.revision, alert_type=state.alert_type,
+                     id=json_value(catalog.ids[i]),
+                     **{k: json_value(v[i]) for k, v in cols.items()},
+                     **{k: json_value(v[i]) for k, v in terms.items()})
+                for i in keep]
+
+    async def run(self, *sources: AsyncIterator[Record]) -> None:
+        """Handle messages from all sources until every source is done."""
+        async for message in merge(*sources):
+            await self.handle(message)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+
+def _error_record(message: Any, exc: Exception) -> Record:
+    record = dict(type='error', error=f'{type(exc).__name__}: {exc}')
+    if isinstance(message, dict):
+        record['message'] = {k: json_value(v) for k, v in message.items()
+                             if k != 'transients'}
+    return record
+
+
+def _rows_to_columns(rows: List[Record]) -> Dict[str, list]:
+    names = {k for row in rows for k in row if k != 'type'}
+    return {k: [row.get(k) for row in rows] for k in names}
+
+
+async def merge(*sources: AsyncIterator[Record]) -> AsyncIterator[Record]:
+    """
+    Interleave several async sources in arrival order.
+
+    An exception in any source is raised as soon as it happens, and the
+    other sources are cancelled.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+
+    async def pump(source):
+        try:
+            async for item in source:
+                await queue.put(item)
+        except Exception as exc:
+            await queue.put(_SourceError(exc))
+        finally:
+            await queue.put(done)
+
+    tasks = [asyncio.ensure_future(pump(s)) for s in sources]
+    remaining = len(tasks)
+    try:
+        while remaining:
+            item = await queue.get()
+            if item is done:
+                remaining -= 1
+            elif isinstance(item, _SourceError):
+                raise item.exc
+            else:
+                yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+class _SourceError:
+    __slots__ = ('exc',)
+
+    def __init__(self, exc: Exception):
+        self.exc = exc
+
+
+def _parse_line(line: str) -> Record:
+    """A JSON message, or an 'invalid' message the engine reports."""
+    try:
+        message = json.loads(line)
+    except ValueError as exc:
+        return dict(type='invalid', error=f'Invalid JSON: {exc}', line=line)
+    if not isinstance(message, dict):
+        return dict(type='invalid', error='Message is not a JSON object',
+                    line=line)
+    return message
+
+
+async def jsonl_source(stream: IO[str]) -> AsyncIterator[Record]:
+    """Messages from a JSON-lines text stream, read off the event loop."""
+    while True:
+        line = await asyncio.to_thread(stream.readline)
+        if not line:
+            return
+        line = line.strip()
+        if line:
+            yield _parse_line(line)
+
+
+def stdin_source() -> AsyncIterator[Record]:
+    """Messages as JSON lines on standard input."""
+    return jsonl_source(sys.stdin)
+
+
+async def watch_directory(path: str, *, poll_interval: float = 1.0,
+                          once: bool = False) -> AsyncIterator[Record]:
+    """
+    Messages from files appearing in (or changing under) a directory.
+
+    - A sky map file (SKYMAP_SUFFIXES) becomes a 'skymap' message each time
+      it is written. Its event id is the name of the subdirectory it is in
+      (alerts/S250101a/bayestar.fits), or else its name up to the first
+      '-' or '.' (alerts/S250101a-update.fits). The alert type is taken
+      from the file name if it contains preliminary, initial or update.
+    - Lines appended to a JSON-lines file (MESSAGE_SUFFIXES) are messages;
+      only new lines are read on each poll.
+
+    Files are picked up in modification-time order once their size has not
+    changed for one poll. With once=True the directory is scanned until
+    nothing new turns up and the source ends, e.g. for offline replays.
+    """
+    seen: Dict[str, tuple] = {}
+    offsets: Dict[str, int] = {}
+    pending: Dict[str, tuple] = {}
+    while True:
+        found = False
+        for file, stat in await asyncio.to_thread(_scan, path):
+            key = (stat.st_mtime_ns, stat.st_size)
+            if seen.get(file) == key:
+                continue
+            if pending.get(file) != key:
+                # Wait one poll for the writer to finish
+                pending[file] = key
+                found = True
+                continue
+            pending.pop(file)
+            seen[file] = key
+            found = True
+            if file.endswith(SKYMAP_SUFFIXES):
+                yield _skymap_message(path, file)
+            else:
+                for message in await asyncio.to_thread(_read_new_lines,
+                                                       file, offsets):
+                    yield message
+        if once and not found:
+            return
+        await asyncio.sleep(poll_interval)
+
+
+def _scan(path: str) -> List[tuple]:
+    files = []
+    for root, _, names in os.walk(path):
+        for name in names:
+            if name.endswith(SKYMAP_SUFFIXES + MESSAGE_SUFFIXES):
+                file = os.path.join(root, name)
+                try:
+                    files.append((file, os.stat(file)))
+                except FileNotFoundError:
+                    pass
+    return sorted(files, key=lambda f: f[1].st_mtime_ns)
+
+
+def _skymap_message(path: str, file: str) -> Record:
+    rel = os.path.relpath(file, path)
+    name = os.path.basename(file)
+    if os.path.dirname(rel):
+        event_id = rel.split(os.sep)[0]
+    else:
+        event_id = name.split('-')[0].split('.')[0]
+    alert_type = next((t.upper() for t in ('preliminary', 'initial', 'update')
+                       if t in name.lower()), None)
+    return dict(type='skymap', event_id=event_id, file=file,
+                alert_type=alert_type)
+
+
+def _read_new_lines(file: str, offsets: Dict[str, int]) -> List[Record]:
+    with open(file, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < offsets.get(file, 0):
+            offsets[file] = 0  # truncated or replaced
+        f.seek(offsets.get(file, 0))
+        data = f.read()
+    # Keep an unterminated last line for the next poll
+    end = data.rfind(b'\n') + 1
+    offsets[file] = offsets.get(file, 0) + end
+    return [_parse_line(line) for line in data[:end].decode().splitlines()
+            if line.strip()]
+
+
+def ndjson_sink(stream: IO[str] = sys.stdout) -> Sink:
+    """Sink writing each record as a JSON line to a text stream."""
+    async def sink(records: List[Record]) -> None:
+        stream.write(''.join(json.dumps(r) + '\n' for r in records))
+        stream.flush()
+    return sink
@@ -1,15 +1,262 @@
-import matplotlib.pyplot as plt
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 
-def plot_skymap(gw_data, transient, out_file="skymap.png"):
+import numpy as np
+
+from .._lazy import lazy_import
+from ..analysis.credible import CredibleIndex
+from ..io.skymap import (_moc_level_ipix, _normalize_moc_table, is_skymap_moc,
+                         nest_block_sum, ring_to_nested, skymap_at_nside)
+from ..io.transient import TransientCatalog, transient_columns
+
+hp = lazy_import("healpy")
+
+#: NSIDE of the preview image drawn by default (786432 pixels)
+DEFAULT_PREVIEW_NSIDE = 256
+#: Transients are labelled individually up to this many
+MAX_LABELS = 20
+
+SQRT2 = np.sqrt(2)
+
+
+def skymap_preview(gw_data, nside=DEFAULT_PREVIEW_NSIDE, nested=True):
+    """
+    Probability per pixel of a sky map at (at most) nside, NESTED.
+
+    Finer maps are aggregated by NESTED block sums, through the pyramid
+    cached with a loaded sky map, so previews of the same map are lookups
+    after the first. nside=None keeps the full resolution.
+
+    Returns
+    -------
+    prob, nside
+    """
+    if isinstance(gw_data, dict):
+        if gw_data.get("prob") is None:
+            # MOC cells, rasterized (and kept) by the pyramid
+            nside = gw_data["nside"] if nside is None else min(
+                nside, gw_data["nside"])
+            return skymap_at_nside(gw_data, nside)["prob"], nside
+        if nside is None or nside >= gw_data["nside"]:
+            prob = np.asarray(gw_data["prob"])
+            if not gw_data.get("nested", True):
+                prob = ring_to_nested(prob)
+            return prob, gw_data["nside"]
+        return skymap_at_nside(gw_data, nside)["prob"], nside
+    if is_skymap_moc(gw_data):
+        order = int(_moc_level_ipix(gw_data)[0].max())
+        nside = 2 ** order if nside is None else min(nside, 2 ** order)
+        return _normalize_moc_table(gw_data, nside)["prob"], nside
+    prob = np.asarray(gw_data)
+    if not nested:
+        prob = ring_to_nested(prob)
+    native = hp.npix2nside(prob.size)
+    if nside is None or nside >= native:
+        return prob, native
+    return nest_block_sum(prob, nside), nside
+
+
+def mollweide(ra, dec):
+    """Mollweide x, y of RA/DEC in degrees, RA 180 in the middle, east left."""
+    lon = np.radians(180 - np.asarray(ra, dtype=float) % 360)
+    lat = np.radians(np.asarray(dec, dtype=float))
+    # Solve 2 theta + sin(2 theta) = pi sin(lat) by Newton's method
+    theta = lat.copy()
+    target = np.pi * np.sin(lat)
+    for _ in range(20):
+        f = 2 * theta + np.sin(2 * theta) - target
+        theta -= f / np.maximum(2 + 2 * np.cos(2 * theta), 1e-12)
+    return 2 * SQRT2 / np.pi * lon * np.cos(theta), SQRT2 * np.sin(theta)
+
+
+@lru_cache(maxsize=4)
+def _mollweide_grid(width):
+    """RA/DEC of the pixel centres of a width x width/2 Mollweide image."""
+    height = width // 2
+    x = (np.arange(width) + 0.5) / width * 4 * SQRT2 - 2 * SQRT2
+    y = (np.arange(height) + 0.5) / height * 2 * SQRT2 - SQRT2
+    x, y = np.meshgrid(x, y)
+    inside = (x / (2 * SQRT2)) ** 2 + (y / SQRT2) ** 2 < 1
+    theta = np.arcsin(np.clip(y / SQRT2, -1, 1))
+    lat = np.arcsin(np.clip((2 * theta + np.sin(2 * theta)) / np.pi, -1, 1))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        lon = np.pi * x / (2 * SQRT2 * np.cos(theta))
+    ra = (180 - np.degrees(np.where(inside, lon, 0.))) % 360
+    dec = np.degrees(lat)
+    for arr in (ra, dec, inside):
+        arr.flags.writeable = False
+    return ra, dec, inside
+
+
+def _graticule(ax):
+    style = dict(color="0.6", linewidth=0.5, zorder=2)
+    line = np.linspace(0, 360, 181)
+    for dec in (-60, -30, 0, 30, 60):
+        ax.plot(*mollweide(line, np.full_like(line, dec)), **style)
+        x, y = mollweide(359.999, dec)
+        ax.text(x - 0.05, y, f"{dec:+d}°", ha="right", va="center",
+                fontsize=7, color="0.3")
+    line = np.linspace(-90, 90, 91)
+    for ra in range(0, 360, 60):
+        ax.plot(*mollweide(np.full_like(line, ra), line), **style)
+        if ra:
+            x, y = mollweide(ra, 0)
+            ax.text(x, y - 0.08, f"{ra // 15}h", ha="center", va="top",
+                    fontsize=7, color="0.9")
+    ax.plot(*mollweide(np.r_[np.full(91, 360 - 1e-9), np.full(91, 0)],
+                       np.r_[line, line[::-1]]), color="0.2",
+            linewidth=0.8, zorder=2)
+
+
+def plot_skymap(gw_data, transients=None, out_file="skymap.png", *,
+                nside=DEFAULT_PREVIEW_NSIDE, contours=(0.5, 0.9),
+                labels=None, title=None, width=800, figsize=(10, 6),
+                dpi=150, cmap="viridis"):
     """
-    Minimal placeholder: blank plot with transient marker.
+    Mollweide plot of a GW sky map with credible contours and transients.
+
+    The image is drawn from a NESTED-aggregated preview at `nside` (see
+    skymap_preview), which costs the same for any map resolution; pass
+    nside=None for full resolution. Contours are credible levels of that
+    same preview (see analysis.credible), so they follow the pixels drawn.
+    Uses a bare matplotlib Figure, so no interactive backend is involved.
+
+    Parameters
+    ----------
+    gw_data : dict, Table or array
+        GW sky map (from load_gw_skymap, a MOC table or a NESTED array).
+    transients : Transient, sequence of Transient, TransientCatalog or dict
+        Transients to mark; any number.
+    out_file : str or None
+        Output image; None returns the Figure instead.
+    contours : sequence of float
+        Credible levels to outline; empty for none.
+    labels : sequence of str, optional
+        Marker labels; default the catalog ids. Only drawn for up to
+        MAX_LABELS transients.
+    width : int
+        Image width in pixels of the sampled sky map.
+
+    Returns
+    -------
+    str or Figure
     """
-    fig, ax = plt.subplots()
-    ax.set_title("Skymap (stub)")
-    if getattr(transient, "ra", None) is not None and getattr(transient, "dec", None) is not None:
-        ax.plot(transient.ra, transient.dec, "o", label="Transient")
-        ax.set_xlabel("RA [deg]")
-        ax.set_ylabel("Dec [deg]")
-        ax.legend()
+    from matplotlib.figure import Figure  # slow; only needed when plotting
+
+    prob, plot_nside = skymap_preview(gw_data, nside)
+    ra, dec, inside = _mollweide_grid(int(width))
+    image = np.full(ra.shape, np.nan)
+    ipix = hp.ang2pix(plot_nside, ra[inside], dec[inside], nest=True,
+                      lonlat=True)
+    image[inside] = prob[ipix] / hp.nside2pixarea(plot_nside, degrees=True)
+
+    fig = Figure(figsize=figsize, dpi=dpi)
+    ax = fig.add_subplot()
+    extent = (-2 * SQRT2, 2 * SQRT2, -SQRT2, SQRT2)
+    im = ax.imshow(image, extent=extent, origin="lower", cmap=cmap,
+                   interpolation="nearest", zorder=1)
+    fig.colorbar(im, ax=ax, orientation="horizontal", fraction=0.046,
+                 pad=0.04, label="probability per deg²")
+
+    if contours:
+        index = CredibleIndex.from_flat(prob)
+        levels = np.full(ra.shape, np.nan)
+        levels[inside] = index.cumprob[index.rank[ipix]]
+        x = np.linspace(extent[0], extent[1], ra.shape[1])
+        y = np.linspace(extent[2], extent[3], ra.shape[0])
+        cs = ax.contour(x, y, np.ma.masked_invalid(levels),
+                        levels=sorted(contours), colors="white",
+                        linewidths=0.8, zorder=3)
+        ax.clabel(cs, fmt=lambda v: f"{v:.0%}", fontsize=7)
+    _graticule(ax)
+
+    if transients is not None:
+        cols = transient_columns(transients, ("ra", "dec"))
+        x, y = mollweide(cols["ra"], cols["dec"])
+        ax.scatter(x, y, marker="*", s=90, facecolor="C3",
+                   edgecolor="white", linewidth=0.6, zorder=4)
+        if labels is None and isinstance(transients, TransientCatalog):
+            labels = transients.ids
+        if labels is not None and len(x) <= MAX_LABELS:
+            for xi, yi, label in zip(x, y, labels):
+                ax.annotate(str(label), (xi, yi), xytext=(4, 4),
+                            textcoords="offset points", color="white",
+                            fontsize=7, zorder=5)
+
+    if title is None and isinstance(gw_data, dict) and gw_data.get("file"):
+        title = os.path.basename(gw_data["file"])
+    if title:
+        ax.set_title(title)
+    ax.set_xlim(extent[0] - 0.02, extent[1] + 0.02)
+    ax.set_ylim(extent[2] - 0.02, extent[3] + 0.02)
+    ax.set_aspect("equal")
+    ax.axis("off")
+
+    if out_file is None:
+        return fig
     fig.savefig(out_file, bbox_inches="tight")
-    plt.close(fig)
+    return out_file
+
+
+class SkymapPlotter:
+    """
+    Renders sky map figures on a process pool, off the scoring path.
+
+    submit() returns a Future at once; workers use the non-interactive Agg
+    backend. Pass sky maps as file paths where possible: workers load them
+    through the loader caches instead of receiving pickled arrays.
+
+        with SkymapPlotter(workers=2) as plotter:
+            future = plotter.submit(gw_file, catalog, "event.png")
+            ...  # keep scoring
+    """
+
+    def __init__(self, workers=None):
+        self._pool = ProcessPoolExecutor(workers,
+                                         initializer=_init_plot_worker)
+
+    def submit(self, gw_data, transients=None, out_file="skymap.png",
+               **kwargs):
+        """Queue one plot_skymap call; returns a Future of out_file."""
+        if isinstance(gw_data, dict):
+            # Leave out the caches kept with loaded maps, which do not pickle
+            gw_data = {k: gw_data.get(k) for k in
+                       ("prob", "nside", "nested", "moc", "file")}
+        return self._pool.submit(_plot_job, gw_data, transients, out_file,
+                                 kwargs)
+
+    def close(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def plot_skymaps(jobs, *, workers=None, **kwargs):
+    """
+    Render many (gw_data, transients, out_file) figures on a process pool.
+
+    Keyword arguments are passed to every plot_skymap call. Returns the
+    output files in job order.
+    """
+    with SkymapPlotter(workers) as plotter:
+        futures = [plotter.submit(*job, **kwargs) for job in jobs]
+        return [future.result() for future in futures]
+
+
+def _init_plot_worker():
+    os.environ["MPLBACKEND"] = "Agg"
+    import matplotlib
+    matplotlib.use("Agg")
+
+
+def _plot_job(gw_data, transients, out_file, kwargs):
+    if isinstance(gw_data, (str, os.PathLike)):
+        from ..io.skymap import load_gw_skymap
+        gw_data = load_gw_skymap(os.fspath(gw_data), columns=("prob",))
+    return plot_skymap(gw_data, transients, out_file, **kwargs)
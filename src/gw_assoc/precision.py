@@ -0,0 +1,121 @@
+# src/gw_assoc/precision.py
+"""
+Floating-point precision of sky map arrays.
+
+By default sky map layers (PROB, DISTMU, DISTSIGMA, DISTNORM) are float64.
+With float32 they are loaded, rasterized and regraded as float32, halving
+their memory and the bandwidth of every pass over them, while every sum
+over pixels (normalizations, overlap integrals, block sums of the
+resolution pyramid) is accumulated in float64 and results are float64:
+
+    set_precision('float32')          # process-wide
+    with precision('float32'):        # or for a block
+        skymap = load_gw_skymap(path)
+
+Accuracy versus float64. Storing a value in float32 rounds it to a relative
+error of at most u = 2**-24 (about 6e-8). Since the sums are accumulated in
+float64, their own rounding error is negligible and:
+
+- PROB and the rasterized MOC layers differ from float64 by at most u.
+- Point overlaps (PROB of one pixel over the float64 total) and overlap
+  integrals (float64 sums of products of two float32 maps) differ by at
+  most 2u + 1e-15 relative, about 1.2e-7.
+- A resolution pyramid level k steps below the full resolution is rounded
+  once per step: PROB differs by at most (k + 1) u, e.g. 7e-7 from
+  NSIDE 2048 down to 1.
+- Regraded distance layers go through the mixture moments, where the
+  variance is a difference; DISTSIGMA differs by about u (DISTMU/DISTSIGMA)^2,
+  below 1e-5 for DISTMU/DISTSIGMA < 10.
+- Distance Bayes factors, evaluated in float64 from float32 layers, differ
+  by a few u times the sensitivity of the line-of-sight integral to
+  DISTMU/DISTSIGMA; about 1e-6 relative for typical maps.
+
+These are relative bounds for values in the float32 normal range. PROB
+below about 1.2e-38 (far in the tails of a localization) is subnormal or
+flushed to zero in float32, so there the error is absolute, up to 1.2e-38
+per pixel.
+
+MOC tables keep their original column types. The setting is a process-wide
+default; loaders also take an explicit `precision` argument.
+"""
+from contextlib import contextmanager
+
+import numpy as np
+
+PRECISIONS = {
+    "float64": np.dtype(np.float64),
+    "float32": np.dtype(np.float32),
+}
+
+_precision = "float64"
+
+
+def get_precision():
+    """Name of the current default sky map precision."""
+    return _precision
+
+
+def set_precision(name):
+    """Set the default sky map precision, 'float64' or 'float32'."""
+    global _precision
+    _precision = _check(name)
+
+
+@contextmanager
+def precision(name):
+    """Use another default sky map precision while the block runs.
+
+    The default is process-wide, not per thread.
+    """
+    old = get_precision()
+    set_precision(name)
+    try:
+        yield name
+    finally:
+        set_precision(old)
+
+
+def _check(name):
+    try:
+        name = np.dtype(name).name
+    except TypeError:
+        pass
+    if name not in PRECISIONS:
+        raise ValueError(f"precision must be one of {sorted(PRECISIONS)}, "
+                         f"got {name!r}")
+    return name
+
+
+def layer_dtype(name=None):
+    """dtype of sky map layers for a precision name (default: current)."""
+    return PRECISIONS[_check(name or _precision)]
+
+
+def as_layer(arr, dtype):
+    """A sky map layer in `dtype`.
+
+    float64 layers are passed through untouched in any byte order, so
+    memory-mapped FITS columns stay lazy; float32 ones are converted.
+    """
+    arr = np.asarray(arr)
+    if dtype == np.float64 or arr.dtype == dtype:
+        return arr
+    return arr.astype(dtype)
+
+
+def total(arr):
+    """Sum of an array, accumulated in float64."""
+    return float(np.sum(arr, dtype=np.float64))
+
+
+def dot(a, b, chunk_size=1 << 16):
+    """Dot product of two vectors, accumulated in float64.
+
+    float32 inputs are converted a chunk at a time, never as a whole.
+    """
+    a, b = np.asarray(a), np.asarray(b)
+    if a.dtype == np.float64 and b.dtype == np.float64:
+        return float(np.dot(a, b))
+    return float(sum(np.dot(a[i:i + chunk_size].astype(np.float64),
+                            b[i:i + chunk_size].astype(np.float64))
+                     for i in range(0, len(a), chunk_size)))
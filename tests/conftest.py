@@ -0,0 +1,28 @@
+# tests/conftest.py
+import os
+import sys
+
+import pytest
+
+# The synthetic sky maps of the benchmarks double as test fixtures
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir,
+                                'benchmarks'))
+
+import synthetic  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def _no_disk_cache(monkeypatch):
+    """Keep tests from writing to a sky map disk cache."""
+    from gw_assoc.io.skymap import skymap_disk_cache
+    monkeypatch.setattr(skymap_disk_cache, 'directory', None)
+
+
+@pytest.fixture
+def flat_map():
+    return synthetic.flat_skymap(64)
+
+
+@pytest.fixture
+def moc_map():
+    return synthetic.moc_skymap(8)
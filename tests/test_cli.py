@@ -0,0 +1,83 @@
+# tests/test_cli.py
+import io
+import json
+
+import numpy as np
+import pytest
+import synthetic
+
+from gw_assoc.analysis import credible_index
+from gw_assoc.cli import main
+from gw_assoc.io import load_gw_skymap
+
+COLUMNS = ['id', 'ra', 'dec', 'z', 'time', 'posterior_odds',
+           'spatial_overlap', 'temporal_overlap', 'distance_factor']
+
+
+@pytest.fixture
+def gw_file(tmp_path, flat_map):
+    path = str(tmp_path / 'flat.fits')
+    synthetic.write_flat(path, flat_map)
+    return path
+
+
+@pytest.fixture
+def rows():
+    # Near the synthetic event, with every other redshift missing
+    rng = np.random.default_rng(2)
+    ra, dec = rng.normal(120, 12, 40), rng.normal(-30, 12, 40)
+    return [dict(id=f'T{i}', ra=float(r), dec=float(d),
+                 z=0.05 if i % 2 else None, time=None)
+            for i, (r, d) in enumerate(zip(ra, dec))]
+
+
+def _batch(monkeypatch, capsys, gw_file, *args, stdin=''):
+    monkeypatch.setattr('sys.stdin', io.StringIO(stdin))
+    main(['batch', '--gw-file', gw_file, '--chunk-size', '7', *args])
+    out = capsys.readouterr()
+    assert 'scored' in out.err
+    return [json.loads(line) for line in out.out.splitlines()]
+
+
+def test_batch_stdin_and_file_agree(tmp_path, monkeypatch, capsys, gw_file,
+                                    rows):
+    from_stdin = _batch(monkeypatch, capsys, gw_file,
+                        stdin='\n'.join(json.dumps(r) for r in rows))
+    csv = tmp_path / 'transients.csv'
+    csv.write_text('id,ra,dec,z\n' + ''.join(
+        f"{r['id']},{r['ra']!r},{r['dec']!r},{r['z'] or ''}\n" for r in rows))
+    output = tmp_path / 'odds.ndjson'
+    assert _batch(monkeypatch, capsys, gw_file, '--input', str(csv),
+                  '--output', str(output)) == []
+    from_file = [json.loads(line) for line in output.read_text().splitlines()]
+
+    assert from_stdin == from_file
+    assert [list(r) for r in from_stdin] == [COLUMNS] * len(rows)
+    for row, rec in zip(rows, from_stdin):
+        # Missing values are written as null, not NaN
+        assert {k: rec[k] for k in row} == row
+        assert rec['posterior_odds'] > 0
+
+
+def test_batch_workers_match_in_process(monkeypatch, capsys, gw_file, rows):
+    stdin = '\n'.join(json.dumps(r) for r in rows)
+    serial = _batch(monkeypatch, capsys, gw_file, stdin=stdin)
+    pooled = _batch(monkeypatch, capsys, gw_file, '--workers', '2',
+                    stdin=stdin)
+    assert pooled == pytest.approx(serial)
+
+
+def test_batch_credible_filter(monkeypatch, capsys, gw_file, rows):
+    stdin = '\n'.join(json.dumps(r) for r in rows)
+    unfiltered = _batch(monkeypatch, capsys, gw_file, stdin=stdin)
+    filtered = _batch(monkeypatch, capsys, gw_file,
+                      '--max-credible-level', '0.5', stdin=stdin)
+    levels = credible_index(load_gw_skymap(gw_file)).credible_level(
+        [r['ra'] for r in rows], [r['dec'] for r in rows])
+    inside = levels <= 0.5
+    assert inside.any() and not inside.all()
+    for level, full, rec in zip(levels, unfiltered, filtered):
+        if level <= 0.5:
+            assert rec == pytest.approx(full)
+        else:
+            assert rec['posterior_odds'] == 0
@@ -0,0 +1,84 @@
+# tests/test_credible.py
+import pickle
+
+import astropy_healpix as ah
+import healpy as hp
+import numpy as np
+import pytest
+import synthetic
+
+from gw_assoc.analysis import CredibleIndex, SkyKDE, credible_index
+
+
+def _brute_levels(density, areas):
+    """Searched probability and area of every pixel, by direct sums."""
+    prob = density * areas
+    denser = density[None, :] >= density[:, None]
+    return (denser @ prob) / prob.sum(), denser @ areas
+
+
+@pytest.fixture
+def noisy_moc():
+    # Random densities, so no two cells tie
+    table = synthetic.moc_skymap(6, distance=False)
+    rng = np.random.default_rng(2)
+    table['PROBDENSITY'] = rng.random(len(table))
+    return table
+
+
+def test_flat_matches_brute_force():
+    prob = np.random.default_rng(3).random(hp.nside2npix(8))
+    level, area = _brute_levels(prob, np.full(prob.size,
+                                              4 * np.pi / prob.size))
+    ra, dec = synthetic.random_points(300)
+    ipix = hp.ang2pix(8, ra, dec, nest=True, lonlat=True)
+    index = CredibleIndex.from_flat(prob)
+    np.testing.assert_allclose(index.credible_level(ra, dec), level[ipix])
+    np.testing.assert_allclose(index.searched_area(ra, dec),
+                               np.degrees(np.degrees(area[ipix])))
+    np.testing.assert_array_equal(index.region(0.5),
+                                  np.flatnonzero(level <= 0.5))
+
+
+def test_moc_matches_brute_force(noisy_moc):
+    order, ipix = ah.uniq_to_level_ipix(np.asarray(noisy_moc['UNIQ']))
+    density = np.asarray(noisy_moc['PROBDENSITY'])
+    level, area = _brute_levels(density, 4 * np.pi / (12 * 4.0 ** order))
+    ra, dec = synthetic.random_points(300)
+    # Cell of each point: the one whose pixel contains it at its order
+    fine = hp.ang2pix(2 ** 6, ra, dec, nest=True, lonlat=True)
+    cell = [np.flatnonzero(ipix == p >> (2 * (6 - order)))[0] for p in fine]
+    index = credible_index(noisy_moc)
+    np.testing.assert_allclose(index.credible_level(ra, dec), level[cell])
+    np.testing.assert_allclose(index.searched(ra, dec)[1],
+                               np.degrees(np.degrees(area[cell])))
+    np.testing.assert_allclose(
+        index.region_area(0.9),
+        np.degrees(np.degrees(area[level >= 0.9].min())))
+
+
+def test_index_kept_with_loaded_skymap(flat_map):
+    index = credible_index(flat_map)
+    assert credible_index(flat_map) is index
+    copy = pickle.loads(pickle.dumps(index))
+    ra, dec = synthetic.random_points(50)
+    np.testing.assert_array_equal(copy.credible_level(ra, dec),
+                                  index.credible_level(ra, dec))
+
+
+def test_kde_indexed_through_its_skymap():
+    rng = np.random.default_rng(4)
+    kde = SkyKDE(rng.normal(120, 3, 500), rng.normal(-30, 3, 500))
+    expected = CredibleIndex.from_flat(kde.skymap()['prob'])
+    assert credible_index(kde).credible_level(120., -30.) == \
+        expected.credible_level(120., -30.)
+
+
+def test_from_arrays_round_trip(noisy_moc):
+    index = credible_index(noisy_moc)
+    rebuilt = CredibleIndex.from_arrays(index.cumprob, index.cumarea,
+                                        index.rank, index._locate)
+    ra, dec = synthetic.random_points(1000)
+    np.testing.assert_array_equal(rebuilt.searched(ra, dec)[0],
+                                  index.searched(ra, dec)[0])
+    assert rebuilt.region_area(0.9) == index.region_area(0.9)
@@ -0,0 +1,138 @@
+# tests/test_galaxy.py
+import healpy as hp
+import numpy as np
+import pytest
+import synthetic
+
+from gw_assoc import GalaxyCatalog, TransientCatalog
+from gw_assoc.analysis import (credible_index, galaxies_in_region,
+                               galaxy_probabilities, host_probability)
+
+
+@pytest.fixture
+def galaxies():
+    rng = np.random.default_rng(8)
+    ra, dec = synthetic.random_points(20000, seed=8)
+    ra[:5000] = rng.normal(120, 8, 5000) % 360
+    dec[:5000] = np.clip(rng.normal(-30, 8, 5000), -90, 90)
+    dist = rng.uniform(100, 800, len(ra))
+    dist[::4] = np.nan  # redshift only
+    return GalaxyCatalog(ra, dec, z=rng.uniform(0.02, 0.15, len(ra)),
+                         dist=dist, weight=rng.uniform(0.5, 2, len(ra)),
+                         order=6)
+
+
+def _separation(ra1, dec1, ra2, dec2):
+    v1 = hp.ang2vec(ra1, dec1, lonlat=True)
+    v2 = hp.ang2vec(ra2, dec2, lonlat=True)
+    return np.degrees(np.arccos(np.clip(np.sum(v1 * v2, axis=-1), -1, 1)))
+
+
+def test_crossmatch_matches_brute_force(galaxies):
+    ra, dec = synthetic.random_points(30, seed=9)
+    radius = np.linspace(0.5, 5, 30)
+    index, rows = galaxies.crossmatch(ra, dec, radius)
+    for i in range(30):
+        sep = _separation(galaxies.ra, galaxies.dec, ra[i], dec[i])
+        expected = np.flatnonzero(sep <= radius[i])
+        np.testing.assert_array_equal(np.sort(rows[index == i]), expected)
+    np.testing.assert_array_equal(
+        galaxies.cone(ra[0], dec[0], radius[0]), rows[index == 0])
+
+
+def test_crossmatch_block_orders_match_brute_force(galaxies):
+    # Radii from well inside one catalog pixel to wider than the blocks of
+    # base pixels, positions near the poles and the cap/belt corners, and
+    # positions that match nothing
+    ra = np.array([0., 45., 90., 135., 10., 200., 300., 120., 5., 7.])
+    dec = np.array([89.9, -89.5, 41.8, -41.8, 0., 60., -70., -30., 0., 1.])
+    radius = np.array([0.2, 1 / 60, 3., 8., 15., 30., 60., 0.5, 0., 2.])
+    ra[-1] = np.nan
+    index, rows = galaxies.crossmatch(ra, dec, radius)
+    assert np.all(np.diff(index) >= 0)
+    for i in range(len(ra)):
+        sep = _separation(galaxies.ra, galaxies.dec, ra[i], dec[i])
+        expected = np.flatnonzero(sep <= radius[i]) if radius[i] > 0 else []
+        np.testing.assert_array_equal(rows[index == i], expected)
+
+
+def test_rows_in_pixels(galaxies):
+    for order in (4, 6, 8):
+        ipix = hp.ang2pix(2 ** order, galaxies.ra, galaxies.dec, nest=True,
+                          lonlat=True)
+        query = np.unique(ipix[:50])
+        rows = galaxies.rows_in_pixels(query, order)
+        inside = np.isin(ipix, query)
+        if order <= galaxies.order:
+            np.testing.assert_array_equal(np.sort(rows),
+                                          np.flatnonzero(inside))
+        else:
+            assert set(np.flatnonzero(inside)) <= set(rows)
+
+
+def test_save_and_load(galaxies, tmp_path):
+    filename = str(tmp_path / 'galaxies.bin')
+    galaxies.save(filename)
+    loaded = GalaxyCatalog.load(filename)
+    assert isinstance(loaded.ra, np.memmap) and loaded.order == 6
+    for name, col in galaxies.columns().items():
+        np.testing.assert_array_equal(loaded.columns()[name], col)
+    np.testing.assert_array_equal(loaded.cone(120., -30., 2.),
+                                  galaxies.cone(120., -30., 2.))
+
+
+@pytest.mark.parametrize('skymap', ['flat_map', 'moc_map'])
+def test_region_matches_brute_force(galaxies, skymap, request):
+    # Flat map pixels are coarser than the catalog's, MOC cells finer
+    gw = request.getfixturevalue(skymap)
+    rows = galaxies_in_region(gw, galaxies, 0.9)
+    inside = credible_index(gw).inside(galaxies.ra, galaxies.dec, 0.9)
+    np.testing.assert_array_equal(np.sort(rows), np.flatnonzero(inside))
+
+
+def test_galaxy_probabilities_with_distances(galaxies, flat_map):
+    rows = np.flatnonzero(np.isfinite(galaxies.dist))[:500]
+    ipix = hp.ang2pix(64, galaxies.ra[rows], galaxies.dec[rows], nest=True,
+                      lonlat=True)
+    mu, sigma, norm = (flat_map[k][ipix]
+                       for k in ('distmu', 'distsigma', 'distnorm'))
+    dL = galaxies.dist[rows]
+    # dP/dV = p / A_pix DISTNORM N(dL; mu, sigma), the dL^2 cancelling
+    expected = (flat_map['prob'][ipix] / hp.nside2pixarea(64) * norm *
+                np.exp(-0.5 * ((dL - mu) / sigma) ** 2) /
+                (np.sqrt(2 * np.pi) * sigma) * galaxies.weight[rows])
+    np.testing.assert_allclose(
+        galaxy_probabilities(flat_map, galaxies, rows), expected, rtol=1e-10)
+
+
+def test_host_probability(galaxies, flat_map):
+    transients = TransientCatalog(ra=[120., 118., 300.],
+                                  dec=[-30., -28., 40.],
+                                  err_radius=[1., np.nan, 1.])
+    result = host_probability(flat_map, galaxies, transients)
+
+    p = galaxy_probabilities(flat_map, galaxies)
+    inside = credible_index(flat_map).inside(galaxies.ra, galaxies.dec, 0.99)
+    radius = [1., 1 / 60, 1.]
+    near = [_separation(galaxies.ra, galaxies.dec, ra, dec) <= r
+            for ra, dec, r in zip(transients.ra, transients.dec, radius)]
+    expected = [p[n].sum() / (p[inside].sum() + p[n & ~inside].sum())
+                for n in near]
+    np.testing.assert_allclose(result, expected, rtol=1e-10)
+    assert result[2] < 1e-10 * result[0]
+
+
+def test_host_probability_is_at_most_one(galaxies, flat_map):
+    # A wide search just outside a small credible region holds more
+    # probability than the region itself
+    transients = TransientCatalog(ra=[120., 140.], dec=[-30., -30.])
+    alone = host_probability(flat_map, galaxies, transients[1:],
+                             radius=15., level=0.02)
+    result = host_probability(flat_map, galaxies, transients,
+                              radius=[0.5, 15.], level=0.02)
+    p = galaxy_probabilities(flat_map, galaxies)
+    inside = credible_index(flat_map).inside(galaxies.ra, galaxies.dec, 0.02)
+    near = _separation(galaxies.ra, galaxies.dec, 140., -30.) <= 15.
+    assert p[near & ~inside].sum() > p[inside].sum()
+    assert np.all((result > 0) & (result <= 1))
+    np.testing.assert_allclose(result[1:], alone, rtol=1e-12)
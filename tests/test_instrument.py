@@ -0,0 +1,96 @@
+# tests/test_instrument.py
+import time
+
+import numpy as np
+import synthetic
+
+from gw_assoc import TransientCatalog
+from gw_assoc.analysis import (compute_posterior_odds_batch,
+                               compute_posterior_odds_matrix)
+from gw_assoc.instrument import (Report, StageEvent, annotate, instrument,
+                                 record_stage, stage)
+
+
+@stage('outer')
+def _outer(n):
+    annotate(n=n)
+    with stage('inner'):
+        annotate(nside=8)
+        time.sleep(0.01)
+    return _outer_again(n)
+
+
+@stage('outer')
+def _outer_again(n):
+    return n
+
+
+def test_report_aggregates_events():
+    seen = []
+    report = Report(hooks=[seen.append])
+    report.record(StageEvent('a', 0.5, 100, {'n': 3}))
+    report.record(StageEvent('a', 0.25, None, {'n': 7, 'nside': 4}))
+    report.record(StageEvent('b', 1.0, None, {}))
+    assert len(seen) == 3 and list(report.stages) == ['a', 'b']
+    assert report['a'].as_dict() == dict(
+        calls=2, wall_time=0.75, peak_bytes=100, sizes={'n': 7, 'nside': 4})
+    assert report.as_dict()['b']['peak_bytes'] is None
+    text = str(report).splitlines()
+    assert text[0].split()[:2] == ['stage', 'calls']
+    assert text[1].split()[:4] == ['a', '2', '750.00', '0.0']
+    report.clear()
+    assert 'a' not in report
+
+
+def test_stages_nest_and_fold():
+    events = []
+    with instrument(hooks=[events.append], memory=False) as report:
+        assert _outer(5) == 5
+    # The directly nested 'outer' call is folded into the outer one
+    assert [e.name for e in events] == ['inner', 'outer']
+    assert report['outer'].calls == 1
+    assert report['outer'].sizes == {'n': 5}
+    assert report['inner'].sizes == {'nside': 8}
+    assert report['outer'].wall_time >= report['inner'].wall_time >= 0.01
+
+
+def test_stages_are_free_when_off():
+    report = Report()
+    with instrument(report, memory=False):
+        pass
+    # No active session: nothing recorded, annotate and record are no-ops
+    assert _outer(1) == 1
+    annotate(n=1)
+    record_stage('x', 1.0)
+    assert not report.stages
+
+
+def test_peak_bytes_and_nested_sessions():
+    with instrument() as outer:
+        with instrument(memory=False) as inner:
+            with stage('alloc'):
+                data = np.ones(2 ** 20)
+                del data
+    for report in (outer, inner):
+        assert report['alloc'].peak_bytes >= 8 * 2 ** 20
+
+
+def test_pooled_odds_record_pool_and_worker_stages(flat_map):
+    ra, dec = synthetic.random_points(100)
+    catalog = TransientCatalog(ra=ra, dec=dec)
+    with instrument(memory=False) as report:
+        pooled = compute_posterior_odds_batch(flat_map, catalog, workers=2,
+                                              chunk_size=30)
+    np.testing.assert_allclose(pooled,
+                               compute_posterior_odds_batch(flat_map, catalog))
+    assert report['odds.pool'].sizes == dict(transients=100, workers=2,
+                                             chunks=4)
+    assert report['odds.worker'].calls == 4
+    assert report['odds.worker'].sizes == {'transients': 30}
+    assert 0 < report['odds.pool'].wall_time <= report['odds'].wall_time
+
+    with instrument(memory=False) as report:
+        compute_posterior_odds_matrix([flat_map, flat_map], catalog,
+                                      workers=2)
+    assert report['odds.pool'].sizes['skymaps'] == 2
+    assert 0 < report['odds.pool'].wall_time <= report['odds'].wall_time
@@ -0,0 +1,72 @@
+# tests/test_kde.py
+import healpy as hp
+import numpy as np
+import pytest
+import synthetic
+
+from gw_assoc.analysis import SkyKDE
+from gw_assoc.analysis.spatial import (sample_overlap_integral,
+                                       skymap_overlap_points)
+
+
+@pytest.fixture
+def samples():
+    rng = np.random.default_rng(7)
+    return (rng.normal(120, 4, 300), rng.normal(-30, 4, 300),
+            rng.normal(400, 50, 300))
+
+
+def _brute_pdf(kde, ra, dec):
+    """vMF mixture summed over every sample, without the cutoff."""
+    vec = hp.ang2vec(ra, dec, lonlat=True)
+    svec = hp.ang2vec(kde.ra, kde.dec, lonlat=True)
+    kappa = kde.kappa
+    norm = kappa / (2 * np.pi * (1 - np.exp(-2 * kappa)))
+    return norm * np.exp(kappa * (vec @ svec.T - 1)) @ kde.weights
+
+
+def test_pdf_matches_brute_force(samples):
+    ra, dec, _ = samples
+    kde = SkyKDE(ra, dec, weights=np.linspace(1, 2, len(ra)), bandwidth=3.)
+    pra, pdec = synthetic.random_points(500)
+    pra[:100] = 120 + 10 * np.sin(np.arange(100))
+    pdec[:100] = -30 + 10 * np.cos(np.arange(100))
+    expected = _brute_pdf(kde, pra, pdec)
+    np.testing.assert_allclose(kde.pdf(pra, pdec), expected, rtol=1e-6,
+                               atol=1e-6 * expected.max())
+
+
+def test_pdf_is_normalized(samples):
+    kde = SkyKDE(*samples[:2])
+    ra, dec = hp.pix2ang(128, np.arange(hp.nside2npix(128)), lonlat=True)
+    assert np.sum(kde.pdf(ra, dec)) * hp.nside2pixarea(128) == \
+        pytest.approx(1, rel=1e-3)
+
+
+def test_skymap_distance_layers(samples):
+    from ligo.skymap.distance import parameters_to_moments
+
+    kde = SkyKDE(*samples)
+    skymap = kde.skymap(64)
+    assert skymap['prob'].sum() == pytest.approx(1)
+    peak = hp.ang2pix(64, 120., -30., nest=True, lonlat=True)
+    mean, std, _ = parameters_to_moments(skymap['distmu'][peak],
+                                         skymap['distsigma'][peak])
+    assert mean == pytest.approx(400, rel=0.1)
+    assert std == pytest.approx(50, rel=0.3)
+
+
+def test_single_sample_skymap():
+    kde = SkyKDE([120.], [-30.])
+    skymap = kde.skymap(64)
+    peak = hp.ang2pix(64, 120., -30., nest=True, lonlat=True)
+    assert skymap['prob'][peak] == pytest.approx(skymap['prob'].max())
+    assert skymap['prob'].sum() == pytest.approx(1)
+
+
+def test_sample_overlap_is_sample_mean(flat_map, samples):
+    kde = SkyKDE(*samples[:2])
+    expected = np.mean(skymap_overlap_points(flat_map, kde.ra, kde.dec))
+    assert sample_overlap_integral(flat_map, kde) == pytest.approx(expected)
+    assert sample_overlap_integral(kde, [kde, flat_map])[1] == \
+        pytest.approx(expected)
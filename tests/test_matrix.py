@@ -0,0 +1,82 @@
+# tests/test_matrix.py
+import numpy as np
+import pytest
+import synthetic
+
+from gw_assoc import TransientCatalog
+from gw_assoc.analysis import (compute_posterior_odds_batch,
+                               compute_posterior_odds_matrix)
+from gw_assoc.analysis.matrix import SharedSkymaps, plan_tasks
+from gw_assoc.analysis.moc import UniqIndex
+from gw_assoc.analysis.temporal import UniformWindow
+
+
+@pytest.fixture
+def gw_maps(flat_map, moc_map):
+    return [flat_map, moc_map,
+            synthetic.flat_skymap(32, center=(300., 40.))['prob']]
+
+
+@pytest.fixture
+def catalog():
+    rng = np.random.default_rng(6)
+    ra, dec = synthetic.random_points(120, seed=6)
+    ra[:40] = rng.normal(120, 5, 40)
+    dec[:40] = rng.normal(-30, 5, 40)
+    return TransientCatalog(ra=ra, dec=dec, z=rng.uniform(0.01, 0.2, 120),
+                            time=rng.uniform(-1, 3, 120))
+
+
+def _per_map(gw_maps, catalog, gw_times, **kwargs):
+    return np.array([compute_posterior_odds_batch(g, catalog, gw_time=t,
+                                                  **kwargs)
+                     for g, t in zip(gw_maps, gw_times)])
+
+
+def test_matrix_matches_per_map_batch(gw_maps, catalog):
+    window = UniformWindow(0., 1.)
+    gw_times = [0., 1., 0.5]
+    matrix = compute_posterior_odds_matrix(gw_maps, catalog, window=window,
+                                           gw_time=gw_times)
+    np.testing.assert_allclose(
+        matrix, _per_map(gw_maps, catalog, gw_times, window=window),
+        rtol=1e-12)
+    assert np.count_nonzero(matrix) > 0
+
+
+def test_pool_matches_in_process(gw_maps, catalog):
+    kwargs = dict(window=UniformWindow(0., 2.), gw_time=0.,
+                  max_credible_level=0.9)
+    expected = compute_posterior_odds_matrix(gw_maps, catalog,
+                                             return_terms=True, **kwargs)
+    pooled = compute_posterior_odds_matrix(gw_maps, catalog, workers=2,
+                                           return_terms=True, **kwargs)
+    for key, value in expected.items():
+        np.testing.assert_allclose(pooled[key], value, rtol=1e-12)
+
+
+def test_shared_skymaps_attach(flat_map, moc_map):
+    with SharedSkymaps([flat_map, moc_map]) as shared:
+        attached = SharedSkymaps.attach(shared.handle)
+        flat, moc = attached[0], attached[1]
+        np.testing.assert_array_equal(flat['prob'], flat_map['prob'])
+        assert not flat['prob'].flags.writeable
+        for name in moc_map.colnames:
+            np.testing.assert_array_equal(moc['moc'][name], moc_map[name])
+        ra, dec = synthetic.random_points(100)
+        np.testing.assert_array_equal(
+            moc['index'].lookup(ra, dec),
+            UniqIndex.from_table(moc_map).lookup(ra, dec))
+        attached.close()
+
+
+@pytest.mark.parametrize('chunk_size', [None, 7])
+def test_plan_tasks_covers_every_pair(chunk_size):
+    weights = [1., 4., 2.]
+    tasks = plan_tasks(weights, 50, workers=3, chunk_size=chunk_size)
+    covered = np.zeros((3, 50), dtype=int)
+    for m, start, stop in tasks:
+        covered[m, start:stop] += 1
+    assert (covered == 1).all()
+    cost = [weights[m] * (stop - start) for m, start, stop in tasks]
+    assert cost == sorted(cost, reverse=True)
@@ -0,0 +1,87 @@
+# tests/test_moc.py
+import astropy_healpix as ah
+import healpy as hp
+import numpy as np
+import pytest
+import synthetic
+
+from gw_assoc.analysis.moc import UniqIndex
+from gw_assoc.io.skymap import rasterize_moc
+
+
+def _raster_rows(uniq, order):
+    """Row of the cell covering each NESTED pixel, -1 where uncovered."""
+    level, ipix = ah.uniq_to_level_ipix(uniq)
+    rows = rasterize_moc(level, ipix, {'row': np.arange(len(uniq))}, order,
+                         fill_value=-1)['row']
+    return rows.astype(np.int64)
+
+
+def test_lookup_matches_rasterized(moc_map):
+    uniq = np.asarray(moc_map['UNIQ'])
+    index = UniqIndex(uniq)
+    ra, dec = synthetic.random_points(2000)
+    ipix = hp.ang2pix(2 ** index.max_order, ra, dec, nest=True, lonlat=True)
+    np.testing.assert_array_equal(index.lookup(ra, dec),
+                                  _raster_rows(uniq, index.max_order)[ipix])
+
+
+def test_lookup_outside_coverage(moc_map):
+    # Shuffled rows with every third cell dropped
+    uniq = np.asarray(moc_map['UNIQ'])
+    uniq = np.random.default_rng(5).permutation(uniq)[::3]
+    index = UniqIndex(uniq)
+    ipix = np.arange(hp.order2npix(index.max_order))
+    expected = _raster_rows(uniq, index.max_order)
+    assert (expected == -1).any()
+    np.testing.assert_array_equal(index.lookup_nested(ipix), expected)
+    pixarea = hp.nside2pixarea(2 ** index.max_order)
+    assert index.areas.sum() == pytest.approx(
+        np.count_nonzero(expected >= 0) * pixarea)
+
+
+def _cells(moc_map):
+    level, ipix = ah.uniq_to_level_ipix(np.asarray(moc_map['UNIQ']))
+    values = {k: np.asarray(moc_map[k]) for k in ('PROBDENSITY', 'DISTMU')}
+    return level, ipix, values
+
+
+@pytest.mark.parametrize('chunk_size', [1000, 4096, 12345])
+def test_rasterize_chunked_matches_unchunked(moc_map, chunk_size):
+    level, ipix, values = _cells(moc_map)
+    order = int(level.max())
+    full = rasterize_moc(level, ipix, values, order)
+    out = {k: np.full(hp.order2npix(order), np.nan) for k in values}
+    chunked = rasterize_moc(level, ipix, values, order,
+                            chunk_size=chunk_size, out=out)
+    for k in values:
+        assert chunked[k] is out[k]
+        np.testing.assert_array_equal(chunked[k], full[k])
+
+
+@pytest.mark.parametrize('depth', [1, 3])
+def test_rasterize_below_max_order_matches_ud_grade(moc_map, depth):
+    # Finer cells are averaged into their parent, like ud_grade on densities
+    level, ipix, values = _cells(moc_map)
+    order = int(level.max())
+    full = rasterize_moc(level, ipix, values, order)
+    coarse = rasterize_moc(level, ipix, values, order - depth)
+    for k in values:
+        np.testing.assert_allclose(
+            coarse[k], hp.ud_grade(full[k], 2 ** (order - depth),
+                                   order_in='NESTED', order_out='NESTED'),
+            rtol=1e-12)
+
+
+def test_from_arrays_round_trip(moc_map):
+    index = UniqIndex.from_table(moc_map)
+    arrays = {k: getattr(index, k) for k in ('level', 'sort', 'starts',
+                                              'ends')}
+    for max_order in (None, index.max_order):
+        rebuilt = UniqIndex.from_arrays(max_order=max_order, **arrays)
+        assert rebuilt.max_order == index.max_order
+        ra, dec = synthetic.random_points(1000)
+        np.testing.assert_array_equal(rebuilt.lookup(ra, dec),
+                                      index.lookup(ra, dec))
+    assert UniqIndex.from_arrays(*(np.zeros(0, dtype=np.int64),) * 4
+                                 ).max_order == 0
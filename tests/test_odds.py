@@ -0,0 +1,74 @@
+# tests/test_odds.py
+import threading
+
+import numpy as np
+import pytest
+import synthetic
+
+from gw_assoc import TransientCatalog
+from gw_assoc.analysis import (compute_posterior_odds,
+                               compute_posterior_odds_batch, credible_index,
+                               odds)
+
+
+@pytest.fixture
+def catalog():
+    ra, dec = synthetic.random_points(200)
+    rng = np.random.default_rng(1)
+    ra[:50] = rng.normal(120, 5, 50)
+    dec[:50] = rng.normal(-30, 5, 50)
+    return TransientCatalog(ra=ra, dec=dec, z=rng.uniform(0.01, 0.2, 200))
+
+
+@pytest.mark.parametrize('skymap', ['flat_map', 'moc_map'])
+def test_batch_matches_per_transient(skymap, catalog, request):
+    gw = request.getfixturevalue(skymap)
+    batch = compute_posterior_odds_batch(gw, catalog)
+    single = [compute_posterior_odds(gw, t)['posterior_odds']
+              for t in catalog[:20]]
+    np.testing.assert_allclose(batch[:20], single, rtol=1e-12)
+    assert np.count_nonzero(batch) > 0
+
+
+def test_pool_matches_in_process(flat_map, catalog):
+    expected = compute_posterior_odds_batch(flat_map, catalog)
+    pooled = compute_posterior_odds_batch(flat_map, catalog, workers=2)
+    np.testing.assert_allclose(pooled, expected, rtol=1e-12)
+    assert odds._WORKER_SKYMAP is None
+
+
+def test_concurrent_pools_use_their_own_map(catalog):
+    maps = [synthetic.flat_skymap(32, center=(120., -30.)),
+            synthetic.flat_skymap(32, center=(300., 40.))]
+    expected = [compute_posterior_odds_batch(m, catalog) for m in maps]
+    results = [None, None]
+
+    def run(i):
+        results[i] = compute_posterior_odds_batch(maps[i], catalog,
+                                                  workers=2)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in (0, 1)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for got, want in zip(results, expected):
+        np.testing.assert_allclose(got, want, rtol=1e-12)
+
+
+@pytest.mark.parametrize('workers', [None, 2])
+def test_credible_filter_masks_unfiltered_odds(moc_map, catalog, workers,
+                                               monkeypatch):
+    built = []
+    monkeypatch.setattr(odds, 'credible_index',
+                        lambda gw: built.append(gw) or credible_index(gw))
+    chunks = [catalog[i:i + 50] for i in range(0, len(catalog), 50)]
+    filtered = np.concatenate([
+        t['posterior_odds'] for _, t in odds.iter_posterior_odds(
+            moc_map, chunks, workers=workers, max_credible_level=0.9)])
+    assert len(built) == 1
+
+    expected = compute_posterior_odds_batch(moc_map, catalog)
+    inside = credible_index(moc_map).inside(catalog.ra, catalog.dec, 0.9)
+    np.testing.assert_allclose(filtered, np.where(inside, expected, 0.),
+                               rtol=1e-12)
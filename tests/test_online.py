@@ -0,0 +1,174 @@
+# tests/test_online.py
+import asyncio
+import io
+import json
+
+import numpy as np
+import pytest
+import synthetic
+
+from gw_assoc.analysis import compute_posterior_odds_batch
+from gw_assoc.io.skymap import load_gw_skymap
+from gw_assoc import online
+from gw_assoc.online import (AssociationEngine, jsonl_source, merge,
+                             watch_directory)
+
+TRANSIENTS = [dict(id='A', ra=120., dec=-30., z=0.05),
+              dict(id='B', ra=300., dec=40., z=0.05)]
+
+
+@pytest.fixture
+def skymap_files(tmp_path):
+    files = []
+    for i, center in enumerate([(120., -30.), (125., -25.)]):
+        file = str(tmp_path / f'S1-{i}.fits')
+        synthetic.write_flat(file, synthetic.flat_skymap(32, center=center))
+        files.append(file)
+    return files
+
+
+def _expected(file, transients):
+    cols = {k: [t[k] for t in transients] for k in ('ra', 'dec', 'z')}
+    return compute_posterior_odds_batch(load_gw_skymap(file), cols)
+
+
+def test_engine_rescores_on_updates(skymap_files):
+    # Built outside any event loop, as on Python 3.9
+    engine = AssociationEngine()
+    records = []
+
+    async def run():
+        records.append(await engine.handle(dict(transients=TRANSIENTS,
+                                                type='transients')))
+        for file in skymap_files:
+            records.append(await engine.handle(
+                dict(type='skymap', event_id='S1', file=file)))
+        records.append(await engine.handle(dict(type='retraction',
+                                                event_id='S1')))
+        records.append(await engine.handle(dict(TRANSIENTS[0])))
+
+    try:
+        asyncio.run(run())
+    finally:
+        engine.close()
+    none, first, second, retraction, after = records
+    assert none == [] and after == []
+    for recs, file in ((first, skymap_files[0]), (second, skymap_files[1])):
+        assert [r['id'] for r in recs] == ['A', 'B']
+        np.testing.assert_allclose([r['posterior_odds'] for r in recs],
+                                   _expected(file, TRANSIENTS), rtol=1e-12)
+    assert [r['revision'] for r in first + second] == [1, 1, 2, 2]
+    assert retraction == [dict(type='retraction', event_id='S1')]
+
+
+def test_new_transients_score_against_active_events(skymap_files):
+    engine = AssociationEngine(min_odds=1.)
+
+    async def run():
+        await engine.handle(dict(type='skymap', event_id='S1',
+                                 file=skymap_files[0]))
+        return await engine.handle(dict(type='transients',
+                                        transients=TRANSIENTS))
+
+    try:
+        records = asyncio.run(run())
+    finally:
+        engine.close()
+    # B is far outside the sky map, so min_odds drops it
+    odds_a, odds_b = _expected(skymap_files[0], TRANSIENTS)
+    assert odds_b < 1. < odds_a
+    assert [(r['id'], r['posterior_odds']) for r in records] == \
+        [('A', pytest.approx(odds_a, rel=1e-12))]
+    assert len(engine.transients) == 2
+
+
+def test_watch_directory_replay(tmp_path, skymap_files):
+    (tmp_path / 'transients.jsonl').write_text(
+        ''.join(json.dumps(t) + '\n' for t in TRANSIENTS))
+
+    async def collect():
+        return [m async for m in watch_directory(str(tmp_path),
+                                                 poll_interval=0, once=True)]
+
+    messages = asyncio.run(collect())
+    skymaps = [m for m in messages if m.get('type') == 'skymap']
+    assert sorted(m['file'] for m in skymaps) == skymap_files
+    assert {m['event_id'] for m in skymaps} == {'S1'}
+    assert [m for m in messages if 'type' not in m] == TRANSIENTS
+
+
+def test_bad_messages_are_reported_and_skipped(skymap_files, tmp_path):
+    lines = [json.dumps(dict(type='bogus')),
+             json.dumps(dict(type='skymap', event_id='S0',
+                             file=str(tmp_path / 'missing.fits'))),
+             json.dumps(dict(id='C', ra='nowhere', dec=0.)),
+             '{"ra": 1,',
+             json.dumps(dict(type='skymap', event_id='S1',
+                             file=skymap_files[0])),
+             json.dumps(TRANSIENTS[0])]
+    emitted = []
+
+    async def sink(records):
+        emitted.extend(records)
+
+    engine = AssociationEngine(sink)
+    try:
+        asyncio.run(engine.run(jsonl_source(io.StringIO('\n'.join(lines)))))
+    finally:
+        engine.close()
+    errors = [r for r in emitted if r['type'] == 'error']
+    assert len(errors) == 4
+    assert errors[0]['message'] == dict(type='bogus')
+    assert errors[1]['error'].startswith('FileNotFoundError')
+    assert errors[2]['error'].startswith('ValueError')
+    assert errors[3]['error'].startswith('ValueError: Invalid JSON')
+    scores = [r for r in emitted if r['type'] == 'score']
+    assert [(r['event_id'], r['id']) for r in scores] == [('S1', 'A')]
+    assert list(engine.events) == ['S1']
+
+
+def test_transients_and_events_expire(skymap_files, monkeypatch):
+    clock = [1000.]
+    monkeypatch.setattr(online.time, 'time', lambda: clock[0])
+    engine = AssociationEngine(transient_ttl=60., event_ttl=120.)
+
+    async def handle(message, at):
+        clock[0] = at
+        return await engine.handle(message)
+
+    async def run():
+        await handle(dict(type='transients', transients=TRANSIENTS), 1000.)
+        await handle(dict(type='skymap', event_id='S1',
+                          file=skymap_files[0]), 1030.)
+        first = await handle(dict(TRANSIENTS[0], id='C'), 1050.)
+        # The first two transients are gone by the update
+        update = await handle(dict(type='skymap', event_id='S1',
+                                   file=skymap_files[1]), 1100.)
+        expired = await handle(dict(TRANSIENTS[0], id='D'), 1300.)
+        return first, update, expired
+
+    try:
+        first, update, expired = asyncio.run(run())
+    finally:
+        engine.close()
+    assert [r['id'] for r in first] == ['C']
+    assert [r['id'] for r in update] == ['C']
+    assert expired == [dict(type='expired', event_id='S1')]
+    assert list(engine.transients.ids) == ['D']
+
+
+def test_merge_raises_source_errors_at_once():
+    async def failing():
+        yield dict(n=1)
+        raise OSError('broker went away')
+
+    async def endless():
+        while True:
+            await asyncio.sleep(10)
+            yield dict(n=2)
+
+    async def run():
+        return [m async for m in merge(failing(), endless())]
+
+    with pytest.raises(OSError, match='broker'):
+        asyncio.run(asyncio.wait_for(run(), 5))
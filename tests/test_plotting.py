@@ -0,0 +1,54 @@
+# tests/test_plotting.py
+import numpy as np
+import pytest
+import synthetic
+
+pytest.importorskip('matplotlib')
+
+from gw_assoc.io.skymap import nest_block_sum  # noqa: E402
+from gw_assoc.plotting.skymap import (plot_skymap, plot_skymaps,  # noqa: E402
+                                      skymap_preview)
+
+PNG = b'\x89PNG\r\n\x1a\n'
+
+
+def _contours(fig):
+    ax = fig.axes[0]
+    return [c for c in ax.collections if hasattr(c, 'allsegs')][0]
+
+
+def test_preview_is_block_sum(flat_map):
+    prob, nside = skymap_preview(flat_map, 16)
+    assert nside == 16
+    np.testing.assert_allclose(prob, nest_block_sum(flat_map['prob'], 16))
+    assert skymap_preview(flat_map, 1024)[1] == flat_map['nside']
+
+
+def test_contours_follow_the_plotted_preview(flat_map):
+    # A coarse preview drawn from a fine map and the same map stored at
+    # the preview NSIDE give identical contours
+    coarse = dict(flat_map, prob=nest_block_sum(flat_map['prob'], 8),
+                  nside=8)
+    del coarse['distmu'], coarse['distsigma'], coarse['distnorm']
+    kwargs = dict(out_file=None, nside=8, contours=(0.5, 0.9), width=200)
+    drawn = _contours(plot_skymap(flat_map, **kwargs))
+    expected = _contours(plot_skymap(coarse, **kwargs))
+    assert list(drawn.levels) == [0.5, 0.9]
+    for segs, expected_segs in zip(drawn.allsegs, expected.allsegs):
+        assert len(segs) == len(expected_segs) > 0
+        for seg, expected_seg in zip(segs, expected_segs):
+            np.testing.assert_array_equal(seg, expected_seg)
+
+
+def test_plot_skymaps_on_a_pool(tmp_path, flat_map):
+    path = str(tmp_path / 'flat.fits')
+    synthetic.write_flat(path, flat_map)
+    ra, dec = synthetic.random_points(5)
+    jobs = [(path, dict(ra=ra, dec=dec), str(tmp_path / 'file.png')),
+            (flat_map, None, str(tmp_path / 'dict.png')),
+            (flat_map['prob'], None, str(tmp_path / 'array.png'))]
+    outputs = plot_skymaps(jobs, workers=2, nside=16, width=200)
+    assert outputs == [job[2] for job in jobs]
+    for out in outputs:
+        with open(out, 'rb') as f:
+            assert f.read(8) == PNG
@@ -0,0 +1,86 @@
+# tests/test_precision.py
+import math
+
+import numpy as np
+import pytest
+import synthetic
+
+from gw_assoc import TransientCatalog
+from gw_assoc.analysis import compute_posterior_odds_batch
+from gw_assoc.analysis.spatial import (skymap_overlap_integral,
+                                       skymap_overlap_points)
+from gw_assoc.io import load_gw_skymap
+from gw_assoc.precision import dot, total
+
+# Unit roundoff of float32 and the point/integral bound of the docstring
+U = 2.0 ** -24
+OVERLAP_RTOL = 2 * U + 1e-15
+# Below the float32 normal range errors are absolute, up to TINY per pixel
+TINY = float(np.finfo(np.float32).tiny)
+NPIX = 12 * 64 ** 2
+
+
+@pytest.fixture
+def maps(tmp_path, flat_map):
+    path = str(tmp_path / 'flat.fits')
+    synthetic.write_flat(path, flat_map)
+    return {name: load_gw_skymap(path, precision=name)
+            for name in ('float64', 'float32')}
+
+
+def test_total_and_dot_accumulate_in_float64():
+    # 1 followed by many values below its float32 spacing
+    a = np.full(100_003, 1e-8, dtype=np.float32)
+    a[0] = 1
+    exact = math.fsum(a.astype(np.float64))
+    assert isinstance(total(a), float)
+    assert total(a) == pytest.approx(exact, rel=1e-14)
+    assert np.cumsum(a)[-1] != pytest.approx(exact, rel=1e-6)
+    b = np.ones_like(a)
+    for chunk_size in (1000, 1 << 16, 1 << 20):
+        assert dot(a, b, chunk_size) == pytest.approx(exact, rel=1e-14)
+    assert dot(a.astype(np.float64), b) == pytest.approx(exact, rel=1e-14)
+
+
+def test_float32_layers(maps):
+    for key in ('prob', 'distmu', 'distsigma', 'distnorm'):
+        assert maps['float32'][key].dtype == np.float32
+        assert maps['float64'][key].dtype.itemsize == 8
+        np.testing.assert_allclose(maps['float32'][key], maps['float64'][key],
+                                   rtol=U, atol=TINY)
+
+
+def test_float32_overlaps_within_bound(maps):
+    ra, dec = synthetic.random_points(500)
+    rng = np.random.default_rng(2)
+    ra[:100], dec[:100] = rng.normal(120, 8, 100), rng.normal(-30, 8, 100)
+    points = {k: skymap_overlap_points(m, ra, dec) for k, m in maps.items()}
+    # A point overlap is PROB of its pixel times NPIX
+    np.testing.assert_allclose(points['float32'], points['float64'],
+                               rtol=OVERLAP_RTOL, atol=TINY * NPIX)
+    ext = synthetic.flat_skymap(64, center=(125., -25.), distance=False)
+    assert skymap_overlap_integral(
+        maps['float32'], ext['prob'].astype(np.float32)) == pytest.approx(
+        skymap_overlap_integral(maps['float64'], ext['prob']),
+        rel=OVERLAP_RTOL, abs=0)
+
+
+def test_float32_odds_within_bound(maps):
+    ra, dec = synthetic.random_points(300)
+    rng = np.random.default_rng(3)
+    ra[:100], dec[:100] = rng.normal(120, 8, 100), rng.normal(-30, 8, 100)
+    catalog = TransientCatalog(ra=ra, dec=dec, z=rng.uniform(0.02, 0.15, 300))
+    terms = {k: compute_posterior_odds_batch(m, catalog, return_terms=True)
+             for k, m in maps.items()}
+    np.testing.assert_allclose(terms['float32']['spatial_overlap'],
+                               terms['float64']['spatial_overlap'],
+                               rtol=OVERLAP_RTOL, atol=TINY * NPIX)
+    # Distance factors: about 1e-6 relative for typical maps, where the
+    # layers are in the float32 normal range
+    normal = terms['float64']['spatial_overlap'] >= TINY * NPIX
+    assert normal.sum() > 100
+    for key in ('distance_factor', 'posterior_odds'):
+        assert terms['float32'][key].dtype == np.float64
+        np.testing.assert_allclose(terms['float32'][key][normal],
+                                   terms['float64'][key][normal],
+                                   rtol=1e-6, atol=0)
@@ -0,0 +1,98 @@
+# tests/test_prefetch.py
+import asyncio
+import threading
+import time
+from collections import Counter
+
+import pytest
+import synthetic
+
+from gw_assoc.io import skymap as skymap_io
+from gw_assoc.io.prefetch import aiter_skymaps, iter_skymaps
+
+
+@pytest.fixture
+def files(tmp_path):
+    paths = []
+    for i in range(3):
+        paths.append(str(tmp_path / f'flat{i}.fits'))
+        synthetic.write_flat(paths[-1], synthetic.flat_skymap(16))
+    return paths
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    """Count read_skymap calls per path; reads take `reads.delay` seconds,
+    or `reads.slow[path]`."""
+    skymap_io.clear_skymap_cache()
+    read_skymap = skymap_io.read_skymap
+    counts = Counter()
+    lock = threading.Lock()
+
+    def slow_read(path, **kwargs):
+        with lock:
+            counts[path] += 1
+        time.sleep(counts.slow.get(path, counts.delay))
+        return read_skymap(path, **kwargs)
+
+    counts.delay, counts.slow = 0.1, {}
+    monkeypatch.setattr(skymap_io, 'read_skymap', slow_read)
+    yield counts
+    skymap_io.clear_skymap_cache()
+
+
+async def _collect(paths, **kwargs):
+    return [item async for item in aiter_skymaps(paths, **kwargs)]
+
+
+@pytest.mark.parametrize('ordered', [False, True])
+def test_in_flight_loads_are_coalesced(files, reads, ordered):
+    paths = [files[0]] * 4 + files
+    results = list(iter_skymaps(paths, concurrency=4, ordered=ordered))
+    assert Counter(p for p, _ in results) == Counter(paths)
+    if ordered:
+        assert [p for p, _ in results] == paths
+    assert all(reads[p] == 1 for p in files)
+    first = [m for p, m in results if p == files[0]]
+    assert all(m is first[0] for m in first)
+
+
+def test_async_in_flight_loads_are_coalesced(files, reads):
+    paths = files + files[::-1]
+    results = asyncio.run(_collect(paths, concurrency=6))
+    assert Counter(p for p, _ in results) == Counter(paths)
+    assert all(reads[p] == 1 for p in files)
+
+
+def test_return_exceptions(files, tmp_path):
+    missing = str(tmp_path / 'missing.fits')
+    results = dict(iter_skymaps([files[0], missing], return_exceptions=True))
+    assert isinstance(results[missing], OSError)
+    assert results[files[0]]['nside'] == 16
+    with pytest.raises(OSError):
+        list(iter_skymaps([missing]))
+
+
+def test_async_early_exit_does_not_block_the_loop(files, reads, tmp_path):
+    # A fast map ahead of slow ones: stopping after it must not wait for
+    # the slow loads still running, and queued loads never start
+    reads.delay = 0
+    slow = []
+    for i in range(4):
+        slow.append(str(tmp_path / f'slow{i}.fits'))
+        synthetic.write_flat(slow[-1], synthetic.flat_skymap(16))
+        reads.slow[slow[-1]] = 1.0
+
+    async def stop_early():
+        maps = aiter_skymaps(files[:1] + slow, concurrency=3)
+        async for path, _ in maps:
+            break
+        start = time.perf_counter()
+        await maps.aclose()
+        return path, time.perf_counter() - start
+
+    path, seconds = asyncio.run(stop_early())
+    assert path == files[0]
+    assert seconds < 0.5
+    time.sleep(1.2)
+    assert sum(reads[p] for p in slow) == 2
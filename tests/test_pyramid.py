@@ -0,0 +1,98 @@
+# tests/test_pyramid.py
+import numpy as np
+import pytest
+import synthetic
+
+from gw_assoc.io.skymap import (SkymapPyramid, _distance_moments,
+                                _moments_to_distance, enforce_same_resolution,
+                                nest_block_sum, read_skymap, skymap_at_nside)
+
+
+def _direct(skymap, nside):
+    """Distance layers at nside straight from the full-resolution map."""
+    moments = _distance_moments(skymap['prob'], skymap['distmu'],
+                                skymap['distsigma'], skymap['distnorm'])
+    return _moments_to_distance(*(nest_block_sum(m, nside) for m in moments))
+
+
+def test_prob_matches_direct_downgrade(flat_map):
+    for nside in (32, 8, 1):
+        np.testing.assert_allclose(skymap_at_nside(flat_map, nside)['prob'],
+                                   nest_block_sum(flat_map['prob'], nside),
+                                   rtol=1e-12, atol=1e-300)
+
+
+def test_distance_matches_direct_downgrade(flat_map):
+    coarse = skymap_at_nside(flat_map, 16)
+    for key, expected in zip(('distmu', 'distsigma', 'distnorm'),
+                             _direct(flat_map, 16)):
+        np.testing.assert_allclose(coarse[key], expected, rtol=1e-10)
+
+
+def test_finer_distance_after_coarser_request():
+    # A coarse request caches only coarse moments; a finer one afterwards
+    # must start again from the full resolution
+    fine = synthetic.flat_skymap(256)
+    enforce_same_resolution(fine, synthetic.flat_skymap(16))
+    result = skymap_at_nside(fine, 128)
+    for key, expected in zip(('distmu', 'distsigma', 'distnorm'),
+                             _direct(fine, 128)):
+        np.testing.assert_allclose(result[key], expected, rtol=1e-10)
+
+
+@pytest.mark.parametrize('order', [(16, 128, 64), (32, 64, 8, 128),
+                                   (8, 128, 16)])
+def test_distance_levels_in_any_request_order(order):
+    # Each request reuses the closest cached moments above it, or the full
+    # resolution when none are cached; every order gives the direct result
+    fine = synthetic.flat_skymap(256)
+    for nside in order:
+        result = skymap_at_nside(fine, nside)
+        for key, expected in zip(('distmu', 'distsigma', 'distnorm'),
+                                 _direct(fine, nside)):
+            np.testing.assert_allclose(result[key], expected, rtol=1e-10)
+
+
+def test_enforce_same_resolution_builds_each_level_once(monkeypatch):
+    calls = []
+    for name in ('prob', 'distance'):
+        method = getattr(SkymapPyramid, name)
+
+        def counted(self, nside, method=method, name=name):
+            calls.append((name, nside))
+            return method(self, nside)
+
+        monkeypatch.setattr(SkymapPyramid, name, counted)
+    coarse, fine = synthetic.flat_skymap(16), synthetic.flat_skymap(64)
+    up, same = enforce_same_resolution(coarse, fine, nside_new=64)
+    assert sorted(calls) == [('distance', 64), ('prob', 64)]
+    assert same is fine
+    assert up['nside'] == 64 and up['prob'].sum() == pytest.approx(1)
+    np.testing.assert_array_equal(up['prob'],
+                                  np.repeat(coarse['prob'] / 16, 16))
+    np.testing.assert_array_equal(up['distmu'],
+                                  np.repeat(coarse['distmu'], 16))
+
+
+def test_upgrade_splits_probability(flat_map):
+    fine = skymap_at_nside(flat_map, 128)
+    assert np.isclose(fine['prob'].sum(), 1)
+    np.testing.assert_array_equal(fine['distmu'][::4], flat_map['distmu'])
+
+
+def test_moc_levels_match_full_rasterization(tmp_path):
+    filename = str(tmp_path / 'moc.fits')
+    synthetic.write_moc(filename, synthetic.moc_skymap(7))
+    lazy = read_skymap(filename)
+    full = read_skymap(filename, target_nside=lazy['nside'])
+    assert lazy['prob'] is None and lazy['nside'] == 128
+    for nside in (128, 32):
+        level = skymap_at_nside(lazy, nside)
+        np.testing.assert_allclose(level['prob'],
+                                   nest_block_sum(full['prob'], nside),
+                                   rtol=1e-12, atol=1e-300)
+        for key, expected in zip(('distmu', 'distsigma', 'distnorm'),
+                                 _direct(full, nside)):
+            np.testing.assert_allclose(level[key], expected, rtol=1e-10)
+    assert skymap_at_nside(lazy, 32)['prob'] is \
+        skymap_at_nside(lazy, 32)['prob']
@@ -0,0 +1,103 @@
+# tests/test_skymap_cache.py
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+import synthetic
+
+from gw_assoc.io import skymap as skymap_io
+from gw_assoc.io.skymap import (SkymapCache, SkymapDiskCache, load_gw_skymap,
+                                read_skymap, read_skymap_cache,
+                                write_skymap_cache)
+
+
+@pytest.fixture
+def flat_file(tmp_path):
+    path = str(tmp_path / 'flat.fits')
+    synthetic.write_flat(path, synthetic.flat_skymap(32))
+    return path
+
+
+@pytest.fixture
+def moc_file(tmp_path):
+    path = str(tmp_path / 'moc.fits')
+    synthetic.write_moc(path, synthetic.moc_skymap(7))
+    return path
+
+
+def test_disk_cache_is_opt_in(monkeypatch):
+    monkeypatch.delenv('GW_ASSOC_CACHE_DIR', raising=False)
+    assert skymap_io._default_cache_dir() is None
+    monkeypatch.setenv('GW_ASSOC_CACHE_DIR', '/some/dir')
+    assert skymap_io._default_cache_dir() == '/some/dir'
+
+
+@pytest.mark.parametrize('fixture', ['flat_file', 'moc_file'])
+def test_cache_file_round_trip(fixture, tmp_path, request):
+    skymap = read_skymap(request.getfixturevalue(fixture))
+    path = str(tmp_path / 'map.skymap')
+    write_skymap_cache(skymap, path)
+    cached = read_skymap_cache(path)
+    for key in skymap_io.SKYMAP_LAYERS:
+        if skymap[key] is None:
+            assert cached[key] is None
+        else:
+            assert isinstance(cached[key], np.memmap)
+            np.testing.assert_array_equal(cached[key], skymap[key])
+    if skymap['moc'] is not None:
+        for name in skymap['moc'].colnames:
+            np.testing.assert_array_equal(cached['moc'][name],
+                                          skymap['moc'][name])
+            assert cached['moc'][name].unit == skymap['moc'][name].unit
+
+
+def test_disk_cache_detects_stale_entries(flat_file, tmp_path):
+    cache = SkymapDiskCache(str(tmp_path / 'cache'))
+    assert cache.get(flat_file) is None
+    cache.put(flat_file, read_skymap(flat_file))
+    assert cache.get(flat_file) is not None
+    # Rewriting the FITS file invalidates the entry
+    time.sleep(0.01)
+    synthetic.write_flat(flat_file, synthetic.flat_skymap(16))
+    assert cache.get(flat_file) is None
+    cache.clear()
+    assert not os.listdir(cache.directory)
+
+
+def test_load_is_served_from_memory_cache(flat_file):
+    first = load_gw_skymap(flat_file)
+    assert load_gw_skymap(flat_file) is first
+    assert load_gw_skymap(flat_file, cache=False) is not first
+
+
+def test_concurrent_loads_are_coalesced():
+    cache = SkymapCache()
+    calls = []
+
+    def load():
+        calls.append(1)
+        time.sleep(0.2)
+        return {'prob': np.zeros(12)}
+
+    results = []
+    threads = [threading.Thread(
+        target=lambda: results.append(cache.get_or_load(('k',), load)))
+        for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert all(r is results[0] for r in results)
+    assert cache.coalesced == 3
+
+
+def test_loaded_moc_map_stays_in_cache(moc_file):
+    skymap_io.clear_skymap_cache()
+    skymap = load_gw_skymap(moc_file)
+    # Only the cells are held; flat layers are made on request
+    assert skymap['prob'] is None and len(skymap['moc'])
+    assert len(skymap_io.skymap_cache) == 1
+    assert load_gw_skymap(moc_file) is skymap
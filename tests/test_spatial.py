@@ -0,0 +1,61 @@
+# tests/test_spatial.py
+import astropy_healpix as ah
+import healpy as hp
+import numpy as np
+import pytest
+import synthetic
+
+from gw_assoc.analysis.spatial import (moc_overlap_integral,
+                                        skymap_overlap_integral)
+from gw_assoc.io.skymap import rasterize_moc
+
+
+def _rasterize(table, order):
+    level, ipix = ah.uniq_to_level_ipix(np.asarray(table['UNIQ']))
+    density = rasterize_moc(level, ipix,
+                            {'p': np.asarray(table['PROBDENSITY'])},
+                            order)['p']
+    return density * hp.nside2pixarea(2 ** order)
+
+
+@pytest.mark.parametrize('ext_order', [5, 8])
+def test_flat_moc_overlap_matches_rasterized(ext_order):
+    # MOC cells both coarser and finer than the flat GW map (order 6)
+    gw = synthetic.flat_skymap(64, center=(120., -30.), sigma=10.)['prob']
+    ext = synthetic.moc_skymap(ext_order, center=(125., -25.), sigma=8.)
+    order = max(6, ext_order)
+    expected = skymap_overlap_integral(gw, _rasterize(ext, order))
+    assert skymap_overlap_integral(gw, ext) == pytest.approx(expected,
+                                                             rel=1e-10)
+
+
+def test_flat_moc_overlap_ring_ordering():
+    gw = synthetic.flat_skymap(64)['prob']
+    ext = synthetic.moc_skymap(8, center=(125., -25.), sigma=8.)
+    ring = gw[hp.ring2nest(64, np.arange(gw.size))]
+    assert skymap_overlap_integral(ring, ext, gw_nested=False) == \
+        pytest.approx(skymap_overlap_integral(gw, ext), rel=1e-12)
+
+
+def test_overlap_accepts_loaded_skymaps(flat_map, moc_map):
+    loaded = dict(synthetic.flat_skymap(64), moc=moc_map)
+    ext = synthetic.flat_skymap(32, center=(125., -25.), sigma=8.)
+    for gw, table in ((flat_map, flat_map['prob']), (loaded, moc_map)):
+        assert skymap_overlap_integral(gw, ext) == pytest.approx(
+            skymap_overlap_integral(table, ext['prob']), rel=1e-12)
+        assert skymap_overlap_integral(gw, ra=125., dec=-25.) == \
+            pytest.approx(skymap_overlap_integral(table, ra=125., dec=-25.),
+                          rel=1e-12)
+    assert skymap_overlap_integral(ext, loaded) == pytest.approx(
+        skymap_overlap_integral(ext['prob'], moc_map), rel=1e-12)
+
+
+def test_moc_moc_overlap_matches_rasterized(moc_map):
+    ext = [synthetic.moc_skymap(order, center=(125., -25.), sigma=8.)
+           for order in (5, 7)]
+    expected = [skymap_overlap_integral(_rasterize(moc_map, 8),
+                                        _rasterize(e, 8)) for e in ext]
+    np.testing.assert_allclose(moc_overlap_integral(moc_map, ext), expected,
+                               rtol=1e-10)
+    assert skymap_overlap_integral(moc_map, ext[0]) == \
+        pytest.approx(expected[0], rel=1e-10)
@@ -0,0 +1,25 @@
+# tests/test_startup.py
+import shutil
+import subprocess
+import sys
+
+import pytest
+import startup
+
+
+@pytest.mark.parametrize('name', list(startup.COMMANDS))
+def test_no_heavy_imports(name):
+    # Which modules get loaded is deterministic; the wall-clock budgets are
+    # left to benchmarks/startup.py.
+    _, modules = startup.best_time(startup.COMMANDS[name], 1)
+    assert 'gw_assoc' in modules
+    assert not modules & set(startup.HEAVY_MODULES)
+
+
+def test_console_script_help():
+    command = shutil.which('gw-assoc')
+    command = [command] if command else [sys.executable, '-m', 'gw_assoc.cli']
+    result = subprocess.run(command + ['--help'], capture_output=True,
+                            text=True)
+    assert result.returncode == 0
+    assert 'usage' in result.stdout
@@ -0,0 +1,52 @@
+# tests/test_temporal.py
+import numpy as np
+import pytest
+
+from gw_assoc import TransientCatalog
+from gw_assoc.analysis import compute_posterior_odds_batch
+from gw_assoc.analysis.temporal import (ExponentialWindow, TimeIndex,
+                                        UniformWindow, temporal_overlap)
+
+
+def test_open_ended_window_needs_duration():
+    with pytest.raises(ValueError):
+        ExponentialWindow(0, np.inf, tau=2.)
+    window = ExponentialWindow(0, np.inf, tau=2., duration=10.)
+    assert window.pdf(0.) == pytest.approx(0.5)
+
+
+def test_open_ended_window_gives_finite_odds(flat_map):
+    catalog = TransientCatalog(ra=[120., 120.], dec=[-30., -30.],
+                               time=[1., 100.])
+    window = ExponentialWindow(0, np.inf, tau=2., duration=10.)
+    odds = compute_posterior_odds_batch(flat_map, catalog, gw_time=0.,
+                                        window=window)
+    assert np.all(np.isfinite(odds))
+    assert odds[0] > odds[1] > 0
+
+
+def test_uniform_window_odds_factor_is_one_inside(flat_map):
+    catalog = TransientCatalog(ra=[120.], dec=[-30.], time=[3.])
+    terms = compute_posterior_odds_batch(flat_map, catalog, gw_time=0.,
+                                         window=UniformWindow(-1, 5),
+                                         return_terms=True)
+    assert terms['temporal_overlap'][0] == pytest.approx(1.)
+
+
+def test_time_index_matches_scan():
+    rng = np.random.default_rng(0)
+    times = rng.uniform(0, 100, 1000)
+    classes = rng.choice(['GRB', 'KN'], 1000)
+    gw_times = np.array([10., 50., 99.])
+    windows = {'GRB': UniformWindow(-1, 5), 'KN': UniformWindow(0, 20)}
+    g, rows, likelihood = temporal_overlap(gw_times, times,
+                                           classes=classes, windows=windows)
+    expected = set()
+    for i, t in enumerate(gw_times):
+        for cls, win in windows.items():
+            dt = times - t
+            hit = (classes == cls) & (dt >= win.start) & (dt <= win.end)
+            expected |= {(i, j) for j in np.flatnonzero(hit)}
+    assert set(zip(g.tolist(), rows.tolist())) == expected
+    index = TimeIndex(times, classes)
+    assert index.count(0, 100, 'GRB') == np.count_nonzero(classes == 'GRB')
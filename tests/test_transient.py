@@ -0,0 +1,100 @@
+# tests/test_transient.py
+import io
+import json
+
+import numpy as np
+import pytest
+
+from gw_assoc.io.transient import (iter_csv, iter_jsonl, iter_parquet,
+                                   read_transients)
+
+ROWS = [
+    dict(objectId="ZTF1", ra=10.0, dec=-5.0, z=0.01, mjd=60000.5,
+         type="kilonova"),
+    dict(objectId="ZTF2", ra=20.0, dec=15.0, z=None, mjd=60001.0,
+         type=None),
+    dict(objectId="ZTF3", ra=30.5, dec=-45.0, z=0.2, mjd=None,
+         type="SN Ia"),
+    dict(objectId="ZTF4", ra=359.0, dec=89.0, z=None, mjd=60002.25,
+         type=None),
+    dict(objectId="ZTF5", ra=0.0, dec=0.0, z=0.05, mjd=60003.0,
+         type="kilonova"),
+]
+
+
+def _write_csv(path):
+    with open(path, "w") as f:
+        f.write(",".join(ROWS[0]) + "\n")
+        for row in ROWS:
+            f.write(",".join("" if v is None else str(v)
+                             for v in row.values()) + "\n")
+
+
+def _write_jsonl(path):
+    with open(path, "w") as f:
+        for row in ROWS:
+            # Omitted keys and explicit nulls are both missing values
+            f.write(json.dumps({k: v for k, v in row.items()
+                                if v is not None or k == "type"}) + "\n")
+
+
+def _write_parquet(path):
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    pq.write_table(pa.Table.from_pylist(ROWS), path)
+
+
+WRITERS = {"csv": _write_csv, "jsonl": _write_jsonl,
+           "parquet": _write_parquet}
+
+
+def _check(cat, rows=ROWS):
+    def col(key):
+        return np.array([np.nan if r[key] is None else r[key] for r in rows])
+
+    np.testing.assert_array_equal(cat.ra, col("ra"))
+    np.testing.assert_array_equal(cat.dec, col("dec"))
+    np.testing.assert_array_equal(cat.z, col("z"))
+    np.testing.assert_array_equal(cat.time, col("mjd"))
+    assert cat.err_radius is None
+    assert list(cat.ids) == [r["objectId"] for r in rows]
+
+
+@pytest.mark.parametrize("fmt", list(WRITERS))
+def test_read_transients_round_trip(tmp_path, fmt):
+    path = tmp_path / f"catalog.{fmt}"
+    WRITERS[fmt](path)
+    cat = read_transients(path)
+    _check(cat)
+    # CSV has no nulls, only empty cells
+    missing = "" if fmt == "csv" else None
+    assert list(cat.classes) == [missing if r["type"] is None else r["type"]
+                                 for r in ROWS]
+
+
+@pytest.mark.parametrize("fmt, reader", [("csv", iter_csv),
+                                         ("jsonl", iter_jsonl),
+                                         ("parquet", iter_parquet)])
+def test_chunks_split_at_chunk_size(tmp_path, fmt, reader):
+    path = tmp_path / f"catalog.{fmt}"
+    WRITERS[fmt](path)
+    chunks = list(reader(str(path), chunk_size=2))
+    assert [len(c) for c in chunks] == [2, 2, 1]
+    for i, chunk in enumerate(chunks):
+        _check(chunk, ROWS[2 * i:2 * i + 2])
+    _check(read_transients(path, chunk_size=2))
+
+
+def test_jsonl_chunk_without_optional_columns():
+    # The second chunk has no z and no class at all; concatenation pads them
+    lines = [dict(ra=1.0, dec=2.0, z=0.1, cls="AGN"), dict(ra=3.0, dec=4.0)]
+    source = io.StringIO("\n".join(json.dumps(r) for r in lines) + "\n\n")
+    cat = read_transients(source, format="jsonl", chunk_size=1)
+    np.testing.assert_array_equal(cat.z, [0.1, np.nan])
+    assert list(cat.classes) == ["AGN", None]
+    assert cat.ids is None
+
+
+def test_missing_required_column():
+    with pytest.raises(ValueError, match="dec"):
+        read_transients(io.StringIO("ra,z\n1,0.1\n"), format="csv")